@@ -2,13 +2,22 @@
 """
 
 import logging
+import re
 from pathlib import Path
 
 import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 import numpy as np
 import pandas as pd
 
+from main.analysis.cache import SummaryCache
+from main.analysis.cube import CUBE_DIMENSIONS, AggregateCube
+from main.analysis.dedup import DEDUP_COLUMNS, OfferDeduplicator
+from main.analysis.diff import SnapshotDiff, diff_snapshots
+from main.analysis.dtypes import apply_schema, get_memory_report
+from main.analysis.plots import draw_price_by_district, draw_price_histograms, draw_price_trend
+from main.analysis.report import ReportRenderer
+from main.analysis.timeseries import PriceTimeSeries
+
 # Logger
 logger = logging.getLogger(__name__)
 
@@ -17,16 +26,206 @@ class OfferAnalyzer:
     """ Read, analyze and visualize offer data
     """
 
-    def __init__(self, offer_datafile: str):
+    def __init__(self, offer_datafile: str,
+                 districts: list = None,
+                 run_date_from: str = None,
+                 run_date_to: str = None,
+                 cache: SummaryCache = None,
+                 dedup: bool = False):
+        """
+        Parameters
+        ----------
+        offer_datafile : str
+            .json file or parquet dataset (directory / .parquet file)
+            with offer data
+        districts : list, optional
+            districts to analyze, by default all
+        run_date_from : str, optional
+            first run date (YYYY-MM-DD) to analyze, parquet data only
+        run_date_to : str, optional
+            last run date (YYYY-MM-DD) to analyze, parquet data only
+        cache : SummaryCache, optional
+            cache for summaries and histogram data, by default None.
+            With cache, data is read only when a result is not cached
+        dedup : bool, optional
+            analyze one offer per canonical offer ID (near-duplicate offers
+            of the same flat counted once), by default False
+        """
         self.offer_datafile = offer_datafile
-        # Read flat data
-        self.offer_data = pd.read_json(offer_datafile)
+        self.columnar = self._is_columnar(offer_datafile)
+        self.districts = districts
+        self.filters = self._get_partition_filters(
+            districts, run_date_from, run_date_to)
+        self.cache = cache
+        self.dedup = dedup
+        self.canonical_ids = None  # canonical offer ID of each row (computed for dedup)
+        self.fingerprint = None  # data content hash (computed for cache)
+        self.offer_data = None
+        self.memory_report = None
+        if self.columnar:
+            # Columns and partitions are read on demand by each summary
+            logger.info(
+                f"Using columnar data from: {Path(self.offer_datafile).resolve()}")
+        elif self.cache is None:
+            self._load_offer_data()
+
+    def _load_offer_data(self):
+        """ Read flat data, types are set by declared schema """
+        raw_data = pd.read_json(self.offer_datafile, dtype=False,
+                                convert_dates=False)
+        if self.districts:
+            raw_data = raw_data.loc[raw_data['district'].isin(self.districts)]
+        self.offer_data = apply_schema(raw_data)
+        self.memory_report = get_memory_report(raw_data, self.offer_data)
+        del raw_data
         logger.info(
             f"Loaded data from file: {Path(self.offer_datafile).resolve()}")
+        logger.info(
+            f"Memory use reduced from {self.memory_report.loc['Total', 'bytes_before'] / 2**20:.1f} MB"
+            f" to {self.memory_report.loc['Total', 'bytes_after'] / 2**20:.1f} MB")
+        logger.debug(f"Memory use per column:\n{self.memory_report}")
         logger.debug(f"Offer data:\n{self.offer_data.head()}")
         logger.debug(
             f"Available columns are: {', '.join(self.offer_data.columns)}")
 
+    @staticmethod
+    def _is_columnar(offer_datafile: str) -> bool:
+        """Check if offer data is stored as parquet dataset
+
+        Parameters
+        ----------
+        offer_datafile : str
+            path to offer data
+
+        Returns
+        -------
+        bool
+            True for parquet dataset
+        """
+        path = Path(offer_datafile)
+        return path.is_dir() or path.suffix == '.parquet'
+
+    @staticmethod
+    def _get_partition_filters(districts: list,
+                               run_date_from: str,
+                               run_date_to: str) -> list:
+        """Translate selection into filters on dataset partitions
+
+        Parameters
+        ----------
+        districts : list
+            districts to read
+        run_date_from : str
+            first run date to read
+        run_date_to : str
+            last run date to read
+
+        Returns
+        -------
+        list
+            partition filters (pyarrow format)
+        """
+        filters = []
+        if districts:
+            filters.append(('district', 'in', list(districts)))
+        if run_date_from:
+            filters.append(('run_date', '>=', str(run_date_from)))
+        if run_date_to:
+            filters.append(('run_date', '<=', str(run_date_to)))
+        return filters
+
+    def _read_columns(self, columns: list) -> pd.DataFrame:
+        """Get offer data limited to given columns
+
+        For parquet datasets only selected columns and partitions
+        are read from disk.
+
+        Parameters
+        ----------
+        columns : list
+            columns to read
+
+        Returns
+        -------
+        pd.DataFrame
+            offer data, with dedup only the first offer of each
+            cluster of near-duplicates
+        """
+        offer_data = self._read_offer_columns(columns)
+        if self.dedup:
+            offer_data = offer_data.loc[~self.get_canonical_ids()['canonical_id'].duplicated().to_numpy()]
+        return offer_data
+
+    def _read_offer_columns(self, columns: list, filters: list = None) -> pd.DataFrame:
+        """Read offer data columns (all rows, or rows of partitions
+        matching additional filters of parquet dataset)"""
+        if not self.columnar:
+            if self.offer_data is None:
+                self._load_offer_data()
+            return self.offer_data.loc[:, columns]
+        offer_data = pd.read_parquet(self.offer_datafile,
+                                     engine='pyarrow',
+                                     columns=columns,
+                                     filters=(self.filters + (filters or [])) or None)
+        offer_data = apply_schema(offer_data)
+        logger.debug(
+            f"Read {len(offer_data)} rows of columns: {', '.join(columns)}")
+        return offer_data
+
+    def get_canonical_ids(self) -> pd.DataFrame:
+        """Get canonical offer ID of each offer (near-duplicates share the ID)
+
+        Returns
+        -------
+        pd.DataFrame
+            link and canonical_id, rows in order of offer data
+
+        Examples
+        --------
+        >>> canonical_ids = ofan.get_canonical_ids()
+        >>> canonical_ids.groupby('canonical_id').size().sort_values()
+        """
+        if self.canonical_ids is None:
+            columns = DEDUP_COLUMNS + (['run_date'] if self.columnar else [])
+            offer_data = self._read_offer_columns(columns)
+            self.canonical_ids = pd.DataFrame({
+                'link': offer_data['link'],
+                'canonical_id': OfferDeduplicator().get_canonical_ids(offer_data)})
+        return self.canonical_ids
+
+    def _get_cached(self, name: str, compute, **params):
+        """Get result from cache or compute it
+
+        Parameters
+        ----------
+        name : str
+            result name
+        compute : callable
+            function computing the result
+        **params
+            parameters the result depends on
+
+        Returns
+        -------
+        object
+            computed or cached result
+        """
+        if self.cache is None:
+            return compute()
+        if self.fingerprint is None:
+            self.fingerprint = self.cache.get_fingerprint(self.offer_datafile)
+        if self.dedup:
+            params['dedup'] = True
+        key = self.cache.get_key(self.fingerprint, name,
+                                 filters=self.filters, **params)
+        result = self.cache.get(key)
+        if result is None:
+            result = compute()
+            self.cache.set(key, result)
+        else:
+            logger.debug(f"Using cached result: {name}")
+        return result
+
     def get_price_summary(self):
         """Summarize price (total and per meter)
             Calculate descriptive statistics and plot histograms
@@ -36,77 +235,57 @@ class OfferAnalyzer:
         pd.DataFrame
             Price descriptive statistics
         """
-        price_summary = self.offer_data.loc[:, [
-            'price', 'price_meter']].describe()
-        price_summary.columns = ['Price', 'Price/m\u00B2']
+        price_summary, price_histograms = self._get_cached(
+            'price_summary', self._summarize_price, n_bins=20)
         with pd.option_context('precision', 0):
             logger.info(f"\n{price_summary}")
 
-        plt.subplots(nrows=2, ncols=1, figsize=(10, 7))
-        plt.subplot(2, 1, 1)
-        self._plot_price_histogram(self.offer_data['price'],
-                                   title="Price distribution",
-                                   x_tick_interval=50000,
-                                   color="darkcyan")
-        plt.subplot(2, 1, 2)
-        self._plot_price_histogram(self.offer_data['price_meter'],
-                                   title="Price/m\u00B2 distribution",
-                                   x_tick_interval=1000,
-                                   color="sienna")
-        plt.tight_layout()
+        draw_price_histograms(plt.figure(figsize=(10, 7)), price_histograms)
 
         return price_summary
 
+    def _summarize_price(self, n_bins: int = 20) -> tuple:
+        """Calculate price descriptive statistics and histogram data
+
+        Parameters
+        ----------
+        n_bins : int, optional
+            number of histogram bins, by default 20
+
+        Returns
+        -------
+        tuple
+            (price descriptive statistics, column -> histogram data)
+        """
+        price_data = self._read_columns(['price', 'price_meter'])
+        price_summary = price_data.describe()
+        price_summary.columns = ['Price', 'Price/m\u00B2']
+        price_histograms = {c: self._get_histogram_data(price_data[c], n_bins)
+                            for c in ['price', 'price_meter']}
+        return price_summary, price_histograms
+
     @staticmethod
-    def _plot_price_histogram(price_data: pd.Series,
-                              title: str,
-                              x_tick_interval: int,
-                              **kwargs):
-        """ Plot histogram of price
+    def _get_histogram_data(price_data: pd.Series, n_bins: int) -> dict:
+        """Get histogram bins of price
 
         Parameters
         ----------
         price_data : pd.Series
             price data
-        title : str
-            plot title
-        x_tick_interval : int
-            interval for x axis
+        n_bins : int
+            number of bins
+
+        Returns
+        -------
+        dict
+            bin counts and edges, median price and number of observations
         """
         price_data = price_data.dropna()
-        n_obs = len(price_data)
-
-        with plt.style.context('bmh'):
-            n_bins = 20
-            ax = price_data.hist(bins=n_bins, alpha=0.9, **kwargs)
-
-            ax.grid(linewidth=0.5)
-            ax.spines['right'].set_visible(False)
-            ax.spines['top'].set_visible(False)
-
-            plt.title(title)
-            plt.xlabel("price")
-            plt.ylabel("number of offers")
-
-            # Format X axis
-            plt.xticks(rotation=45)
-            ax.xaxis.set_major_locator(
-                ticker.MultipleLocator(base=x_tick_interval))
-            ax.xaxis.set_major_formatter(ticker.StrMethodFormatter('{x:,.0f}'))
-
-            # Add median price
-            median_price = price_data.median()
-            hist_y, hist_x = np.histogram(price_data, bins=n_bins)
-            plt.axvline(median_price, color='midnightblue', linewidth=2)
-            plt.text(median_price, np.quantile(hist_y, 0.25),
-                     s=f"Median price={median_price:,.0f} z\u0142",
-                     rotation=90,
-                     horizontalalignment="right",
-                     verticalalignment="bottom")
-
-            # Add number of observations
-            plt.text(hist_x.min(), hist_y.max() * 0.9, s=f"Total number of offers={n_obs}",
-                     horizontalalignment="left")
+        hist_y, hist_x = np.histogram(price_data, bins=n_bins)
+        return {'counts': hist_y,
+                'edges': hist_x,
+                'median': price_data.median(),
+                'n_obs': len(price_data)}
 
     def get_price_district_summary(self):
         """Summarize price by district
@@ -116,60 +295,299 @@ class OfferAnalyzer:
         pd.DataFrame
             Price descriptive statistics grouped by district
         """
-        # Group by district, sort by median price per meter
-        price_district_summary = self.offer_data.loc[:, [
-            'district', 'price', 'price_meter']].groupby('district').describe()\
-            .sort_values(by=('price_meter', '50%'), ascending=False)
-        price_district_summary.columns.set_levels(
-            ['Price', 'Price/m\u00B2'], level=0, inplace=True)
+        price_district_summary = self._get_cached(
+            'price_district_summary', self._summarize_price_district)
 
         # View summary
         with pd.option_context('precision', 0):
             logger.info(f"\n{price_district_summary}")
 
         # Plots
-        plt.subplots(nrows=2, ncols=1, figsize=(10, 7))
-        plt.subplot(2, 1, 1)
-        self._plot_price_by_district(
-            price_district_summary, 'Price', 50000, color="darkcyan")
-        plt.subplot(2, 1, 2)
-        self._plot_price_by_district(
-            price_district_summary, 'Price/m\u00B2', 1000, color="sienna")
-        plt.tight_layout()
+        draw_price_by_district(plt.figure(figsize=(10, 7)),
+                               self._get_district_medians(price_district_summary))
+
+        return price_district_summary
 
+    def _summarize_price_district(self) -> pd.DataFrame:
+        """Calculate price descriptive statistics by district
+
+        Returns
+        -------
+        pd.DataFrame
+            Price descriptive statistics grouped by district
+        """
+        # Group by district, sort by median price per meter
+        price_district_summary = self._read_columns([
+            'district', 'price', 'price_meter']).groupby('district', observed=True).describe()\
+            .sort_values(by=('price_meter', '50%'), ascending=False)
+        price_district_summary.columns.set_levels(
+            ['Price', 'Price/m\u00B2'], level=0, inplace=True)
         return price_district_summary
 
     @staticmethod
-    def _plot_price_by_district(price_data: pd.DataFrame,
-                                column_name: str,
-                                x_tick_interval: int,
-                                **kwargs):
-        """Plot price median by district
+    def _get_district_medians(price_district_summary: pd.DataFrame) -> dict:
+        """Get median prices by district for plotting
 
         Parameters
         ----------
-        price_data : pd.DataFrame
+        price_district_summary : pd.DataFrame
             price summary grouped by district
-        column_name : str
-            Column from dataframe to plot
-        x_tick_interval : int
-            interval for x axis
-        """
-        chart_data = price_data.loc[:, (column_name, '50%')].sort_values()
-        with plt.style.context('bmh'):
-            ax = chart_data.plot.barh(**kwargs)
-
-            ax.grid(axis='y')
-            ax.spines['right'].set_visible(False)
-            ax.spines['top'].set_visible(False)
-
-            plt.title(f"{column_name} median")
-
-            # Format X axis
-            plt.xticks(rotation=45)
-            ax.xaxis.set_major_locator(
-                ticker.MultipleLocator(base=x_tick_interval))
-            ax.xaxis.set_major_formatter(ticker.StrMethodFormatter('{x:,.0f}'))
+
+        Returns
+        -------
+        dict
+            column (price/price_meter) -> district -> median price
+        """
+        return {'price': price_district_summary[('Price', '50%')].dropna().to_dict(),
+                'price_meter': price_district_summary[('Price/m\u00B2', '50%')].dropna().to_dict()}
+
+    def get_cube(self, k: int = 200) -> AggregateCube:
+        """Get aggregate cube for fast segment queries
+
+        The cube is built once per dataset (and cached if cache is set).
+
+        Parameters
+        ----------
+        k : int, optional
+            quantile sketch size parameter per cell, by default 200
+
+        Returns
+        -------
+        AggregateCube
+            price aggregates per district, number of rooms, market,
+            building type, owner and floor band
+
+        Examples
+        --------
+        >>> cube = ofan.get_cube()
+        >>> cube.query(by=['district'], nrooms=['2', '3'], market='Primary')
+        """
+        columns = ['price', 'price_meter', 'floor'] + \
+            [d for d in CUBE_DIMENSIONS if d != 'floor_band']
+        return self._get_cached('cube', lambda: AggregateCube(self._read_columns(columns), k=k),
+                                k=k)
+
+    def get_snapshot_diff(self, previous_datafile: str = None) -> SnapshotDiff:
+        """Compare offer data with previous snapshot
+
+        Parameters
+        ----------
+        previous_datafile : str, optional
+            earlier snapshot (.json file or parquet dataset), by default
+            the previous run stored in the analyzed parquet dataset
+
+        Returns
+        -------
+        SnapshotDiff
+            new, removed, re-priced and changed offers
+
+        Raises
+        ------
+        ValueError
+            if previous snapshot is not given for .json offer data
+        """
+        if previous_datafile is None:
+            if not self.columnar:
+                raise ValueError('Previous snapshot file required for .json offer data')
+            return diff_snapshots(self.offer_datafile, districts=self.districts)
+        return diff_snapshots(previous_datafile, self.offer_datafile,
+                              districts=self.districts)
+
+    @staticmethod
+    def get_price_change_summary(price_history: pd.DataFrame) -> pd.DataFrame:
+        """Summarize price changes by district
+
+        Parameters
+        ----------
+        price_history : pd.DataFrame
+            price changes (see `SnapshotDiff.get_price_history`),
+            possibly concatenated over many runs
+
+        Returns
+        -------
+        pd.DataFrame
+            number of price changes, reductions and rises,
+            median and mean change [%] per district and in total
+        """
+        def summarize(changes: pd.DataFrame) -> pd.Series:
+            return pd.Series({'changes': len(changes),
+                              'reduced': (changes['price_change'] < 0).sum(),
+                              'raised': (changes['price_change'] > 0).sum(),
+                              'median_change_pct': changes['price_change_pct'].median(),
+                              'mean_change_pct': changes['price_change_pct'].mean()})
+
+        price_change_summary = price_history.groupby('district').apply(summarize)\
+            .sort_values(by='changes', ascending=False)
+        price_change_summary.loc['Total'] = summarize(price_history)
+        logger.info(f"\n{price_change_summary}")
+        return price_change_summary
+
+    def update_price_series(self, price_series: PriceTimeSeries,
+                            complete_until: str = None) -> int:
+        """Append days completed since the last update to daily price series
+
+        Parameters
+        ----------
+        price_series : PriceTimeSeries
+            materialized series (saved to its file if set)
+        complete_until : str, optional
+            last day with complete data (YYYY-MM-DD), by default
+            the day before the run date (or latest date in data)
+
+        Returns
+        -------
+        int
+            number of appended days
+
+        Notes
+        -----
+        Offers of a parquet dataset are listed in many runs. Only runs after
+        the watermark are read (earlier runs have no offers of new days),
+        and each offer is counted once, in its latest run. With dedup,
+        each cluster of near-duplicates is counted once, in its latest run.
+        """
+        columns = ['link', 'date', 'district', 'price', 'price_meter']
+        filters = None
+        if self.columnar:
+            columns.append('run_date')
+            if price_series.watermark is not None:
+                filters = [('run_date', '>', f"{price_series.watermark:%Y-%m-%d}")]
+        if self.dedup:
+            columns += [c for c in DEDUP_COLUMNS if c not in columns]
+        offer_data = self._read_offer_columns(columns, filters)
+        key = 'link'
+        if self.dedup:
+            # Duplicates are found within runs, so IDs do not depend on earlier runs
+            offer_data = offer_data.assign(
+                canonical_id=OfferDeduplicator().get_canonical_ids(offer_data))
+            key = 'canonical_id'
+        if self.columnar:
+            offer_data = offer_data.iloc[np.argsort(offer_data['run_date'].astype(str).to_numpy(),
+                                                    kind='stable')]
+        offer_data = offer_data.drop_duplicates(key, keep='last')
+        n_days = price_series.update(offer_data, complete_until)
+        if n_days and price_series.series_file:
+            price_series.save()
+        return n_days
+
+    @staticmethod
+    def get_price_trend(price_series: PriceTimeSeries,
+                        window: int = 7,
+                        districts: list = None) -> pd.DataFrame:
+        """Plot rolling median price per meter trend by district
+
+        Parameters
+        ----------
+        price_series : PriceTimeSeries
+            materialized series
+        window : int, optional
+            window length in days, by default 7
+        districts : list, optional
+            districts to plot, by default all (and total)
+
+        Returns
+        -------
+        pd.DataFrame
+            price per meter trend indexed by date, district in columns
+        """
+        draw_price_trend(plt.figure(figsize=(10, 7)),
+                         price_series.get_chart_data(window, districts),
+                         title=f"{window}-day rolling window")
+        return price_series.get_trend('price_meter', '50%', window, districts)
+
+    def get_report_charts(self, segments: tuple = ('nrooms', 'market'),
+                          n_bins: int = 20) -> dict:
+        """Get definitions of report charts
+
+        Charts are: price histograms and median price by district for all
+        offers, price histograms per district, and both charts per
+        value of each segment column.
+
+        Parameters
+        ----------
+        segments : tuple, optional
+            columns defining offer segments, by default ('nrooms', 'market')
+        n_bins : int, optional
+            number of histogram bins, by default 20
+
+        Returns
+        -------
+        dict
+            chart name -> chart definition (see `main.analysis.report`)
+        """
+        return self._get_cached('report_charts', lambda: self._build_report_charts(segments, n_bins),
+                                segments=list(segments), n_bins=n_bins)
+
+    def _build_report_charts(self, segments: tuple, n_bins: int) -> dict:
+        """Compute data of report charts
+
+        Parameters
+        ----------
+        segments : tuple
+            columns defining offer segments
+        n_bins : int
+            number of histogram bins
+
+        Returns
+        -------
+        dict
+            chart name -> chart definition
+        """
+        offer_data = self._read_columns(
+            ['district', 'price', 'price_meter'] + list(segments))
+
+        def get_charts(data: pd.DataFrame, name: str, title: str = None) -> dict:
+            price_histograms = {c: self._get_histogram_data(data[c], n_bins)
+                                for c in ['price', 'price_meter']}
+            district_medians = data.groupby('district', observed=True)[['price', 'price_meter']]\
+                .median().dropna(how='all')
+            return {f"price_histograms{name}": {'kind': 'price_histograms',
+                                                 'data': price_histograms,
+                                                 'title': title},
+                    f"price_by_district{name}": {'kind': 'price_by_district',
+                                                  'data': {c: district_medians[c].dropna().to_dict()
+                                                           for c in ['price', 'price_meter']},
+                                                  'title': title}}
+
+        charts = get_charts(offer_data, '')
+        for district, district_data in offer_data.groupby('district', observed=True):
+            district_charts = get_charts(district_data, f"_district_{district}", district)
+            charts.update({k: v for k, v in district_charts.items()
+                           if k.startswith('price_histograms')})
+        for segment in segments:
+            for value, segment_data in offer_data.groupby(segment, observed=True):
+                charts.update(get_charts(segment_data, f"_{segment}_{value}",
+                                         f"{segment}: {value}"))
+        # Use names safe for files
+        return {re.sub(r'[^\w\-]+', '_', name): chart for name, chart in charts.items()}
+
+    def render_report(self, output_dir: str,
+                      formats: tuple = ('png',),
+                      segments: tuple = ('nrooms', 'market'),
+                      processes: int = None) -> list:
+        """Render report charts to files (headless, in parallel)
+
+        Charts with data unchanged since the last report are skipped.
+
+        Parameters
+        ----------
+        output_dir : str
+            directory where charts are saved
+        formats : tuple, optional
+            file formats e.g. ('png', 'svg'), by default ('png',)
+        segments : tuple, optional
+            columns defining offer segments, by default ('nrooms', 'market')
+        processes : int, optional
+            number of worker processes, by default number of CPUs
+
+        Returns
+        -------
+        list
+            rendered files
+        """
+        charts = self.get_report_charts(segments)
+        renderer = ReportRenderer(output_dir, formats=formats, processes=processes)
+        return renderer.render(charts)
 
     @staticmethod
     def show_plots():
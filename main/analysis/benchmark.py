@@ -0,0 +1,229 @@
+"""Benchmark of offer analysis on synthetic data
+
+For each data size, offer data is generated once (see `synthetic`) and
+analyzed in a fresh process: loading, price summary, price summary by
+district and plotting are timed, throughput (offers per second) and peak
+memory (RSS) are measured. Results are appended to a JSON lines file and
+compared with the previous result of the same size and format.
+Runs offline.
+
+Usage:
+    python -m main.analysis.benchmark [--sizes 100000 1000000] [--format json|parquet]
+        [--data-dir DIR] [--results FILE] [--tolerance 0.2]
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Logger
+logger = logging.getLogger(__name__)
+
+BENCHMARK_SIZES = [10**5, 10**6]
+BENCHMARK_STEPS = ['load', 'price_summary', 'price_district_summary', 'plots']
+DATA_DIR = Path('.') / "data" / "benchmark"
+RESULTS_FILE = DATA_DIR / "results.jsonl"
+
+
+def _get_peak_memory() -> float:
+    """Get peak memory (RSS) of current process [MB], None if not available"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10  # kB on Linux
+
+
+def benchmark_analysis(data_file: str) -> dict:
+    """Time analysis steps on offer data (run in fresh process)
+
+    Parameters
+    ----------
+    data_file : str
+        json file or parquet dataset with offer data
+
+    Returns
+    -------
+    dict
+        step -> time [s], step -> peak memory after step [MB]
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    from main.analysis.analyzer import OfferAnalyzer
+
+    seconds = {}
+    memory = {'start': _get_peak_memory()}
+
+    start_time = time.perf_counter()
+    ofan = OfferAnalyzer(data_file)
+    seconds['load'] = time.perf_counter() - start_time
+    memory['load'] = _get_peak_memory()
+
+    start_time = time.perf_counter()
+    ofan.get_price_summary()
+    seconds['price_summary'] = time.perf_counter() - start_time
+    memory['price_summary'] = _get_peak_memory()
+
+    start_time = time.perf_counter()
+    ofan.get_price_district_summary()
+    seconds['price_district_summary'] = time.perf_counter() - start_time
+    memory['price_district_summary'] = _get_peak_memory()
+
+    start_time = time.perf_counter()
+    with tempfile.TemporaryDirectory() as chart_dir:
+        for number in plt.get_fignums():
+            plt.figure(number).savefig(Path(chart_dir) / f"chart_{number}.png")
+    plt.close('all')
+    seconds['plots'] = time.perf_counter() - start_time
+    memory['plots'] = _get_peak_memory()
+    return {'seconds': seconds, 'peak_memory_mb': memory}
+
+
+def compare_results(result: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """Find analysis steps slower than in baseline
+
+    Parameters
+    ----------
+    result : dict
+        benchmark result
+    baseline : dict
+        earlier benchmark result of the same size and format
+    tolerance : float, optional
+        allowed relative slowdown, by default 0.2
+
+    Returns
+    -------
+    list
+        (step, baseline time, time, ratio) of slower steps
+    """
+    regressions = []
+    for step in BENCHMARK_STEPS:
+        before = baseline['seconds'].get(step)
+        after = result['seconds'].get(step)
+        if before and after and after > before * (1 + tolerance):
+            regressions.append((step, before, after, after / before))
+    return regressions
+
+
+def read_results(results_file: str) -> list:
+    """Read stored benchmark results
+
+    Parameters
+    ----------
+    results_file : str
+        JSON lines file with results
+
+    Returns
+    -------
+    list
+        results in order of runs
+    """
+    if not Path(results_file).exists():
+        return []
+    with open(results_file, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_benchmark(sizes: list = None,
+                  file_format: str = 'json',
+                  data_dir: str = DATA_DIR,
+                  results_file: str = RESULTS_FILE,
+                  tolerance: float = 0.2,
+                  seed: int = 0) -> list:
+    """Run benchmark for data sizes, store and compare results
+
+    Parameters
+    ----------
+    sizes : list, optional
+        numbers of offers, by default `BENCHMARK_SIZES`
+    file_format : str, optional
+        data format - json or parquet, by default 'json'
+    data_dir : str, optional
+        directory of generated data, by default data/benchmark
+    results_file : str, optional
+        JSON lines file with results, by default data/benchmark/results.jsonl
+    tolerance : float, optional
+        allowed relative slowdown against previous result, by default 0.2
+    seed : int, optional
+        random seed of generated data, by default 0
+
+    Returns
+    -------
+    list
+        results of this run
+    """
+    import numpy as np
+    import pandas as pd
+
+    from main.analysis.synthetic import write_offers
+
+    sizes = sizes or BENCHMARK_SIZES
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    previous = read_results(results_file)
+    context = multiprocessing.get_context('spawn')  # clean process memory per size
+    results = []
+    for n_offers in sizes:
+        data_file = data_dir / (f"offers_{n_offers}_{seed}.json" if file_format == 'json'
+                                else f"offers_{n_offers}_{seed}")
+        if not data_file.exists():
+            write_offers(data_file, n_offers, file_format, seed)
+
+        with context.Pool(1) as pool:
+            measurement = pool.apply(benchmark_analysis, (str(data_file),))
+        total = sum(measurement['seconds'].values())
+        result = {'timestamp': datetime.now().isoformat(timespec='seconds'),
+                  'n_offers': n_offers,
+                  'format': file_format,
+                  'seconds': measurement['seconds'],
+                  'offers_per_second': {step: n_offers / seconds if seconds else None
+                                        for step, seconds in measurement['seconds'].items()},
+                  'total_seconds': total,
+                  'peak_memory_mb': measurement['peak_memory_mb'],
+                  'versions': {'python': platform.python_version(),
+                               'pandas': pd.__version__,
+                               'numpy': np.__version__}}
+        results.append(result)
+        logger.info(f"{n_offers} offers ({file_format}): {total:.2f}s, "
+                    f"{n_offers / total:,.0f} offers/s, "
+                    f"peak memory {measurement['peak_memory_mb']['plots'] or 0:,.0f} MB")
+
+        baseline = next((r for r in reversed(previous)
+                         if r['n_offers'] == n_offers and r['format'] == file_format), None)
+        if baseline is not None:
+            for step, before, after, ratio in compare_results(result, baseline, tolerance):
+                logger.warning(f"Regression in {step} ({n_offers} offers): "
+                               f"{before:.2f}s -> {after:.2f}s ({ratio:.2f}x)")
+
+    Path(results_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(results_file, 'a', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+    return results
+
+
+if __name__ == '__main__':
+    # Worker process needs functions importable from the module (not __main__)
+    from main.analysis.benchmark import run_benchmark
+    from utils.logging_config import get_log_config
+
+    parser = argparse.ArgumentParser(description='Benchmark offer analysis on synthetic data')
+    parser.add_argument('--sizes', type=int, nargs='+', help='numbers of offers')
+    parser.add_argument('--format', default='json', choices=['json', 'parquet'],
+                        help='data format')
+    parser.add_argument('--data-dir', default=str(DATA_DIR), help='directory of generated data')
+    parser.add_argument('--results', default=str(RESULTS_FILE), help='JSON lines file with results')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown against previous result')
+    args = parser.parse_args()
+
+    get_log_config("logging.json")
+    run_benchmark(args.sizes, args.format, args.data_dir, args.results, args.tolerance)
@@ -0,0 +1,214 @@
+"""Cache analysis results keyed by data fingerprint
+
+Keys also include a version of the analysis code (hash of its source), so
+results cached before a change of the analysis are not used.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Sources whose logic determines analysis results (analysis package and offer schema)
+ANALYSIS_SOURCES = sorted(Path(__file__).parent.glob('*.py')) + \
+    [Path(__file__).parents[1] / 'schema.py']
+
+
+def get_code_version() -> str:
+    """Get version of analysis code
+
+    Returns
+    -------
+    str
+        hash of analysis sources
+    """
+    version = hashlib.sha256()
+    for source in ANALYSIS_SOURCES:
+        version.update(source.read_bytes())
+    return version.hexdigest()[:16]
+
+
+CODE_VERSION = get_code_version()
+
+
+def get_data_fingerprint(offer_datafile: str, block_size: int = 2**20) -> str:
+    """Get content hash of offer data
+
+    Parameters
+    ----------
+    offer_datafile : str
+        data file or dataset directory
+    block_size : int, optional
+        number of bytes read at once, by default 1MB
+
+    Returns
+    -------
+    str
+        SHA-256 of data content (file names and bytes for directories)
+    """
+    path = Path(offer_datafile)
+    data_files = sorted(p for p in path.rglob('*') if p.is_file()) \
+        if path.is_dir() else [path]
+    fingerprint = hashlib.sha256()
+    for data_file in data_files:
+        fingerprint.update(str(data_file.relative_to(path)).encode('utf-8')
+                           if path.is_dir() else b'')
+        with open(data_file, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                fingerprint.update(block)
+    return fingerprint.hexdigest()
+
+
+class SummaryCache(object):
+    """ Two-tier (memory and disk) cache with size-bounded LRU eviction """
+
+    def __init__(self, cache_dir: str = None,
+                 max_memory_bytes: int = 64 * 2**20,
+                 max_disk_bytes: int = 512 * 2**20):
+        """
+        Parameters
+        ----------
+        cache_dir : str, optional
+            directory for disk tier, by default None (memory only)
+        max_memory_bytes : int, optional
+            memory tier size limit, by default 64MB
+        max_disk_bytes : int, optional
+            disk tier size limit, by default 512MB
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()  # key -> pickled value (LRU order)
+        self.memory_bytes = 0
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def get_key(fingerprint: str, name: str, **params) -> str:
+        """Get cache key for result computed on data with given parameters
+
+        Parameters
+        ----------
+        fingerprint : str
+            data fingerprint
+        name : str
+            name of computed result e.g. method name
+
+        Returns
+        -------
+        str
+            cache key (of current analysis code version)
+        """
+        key_data = json.dumps({'fingerprint': fingerprint, 'name': name,
+                               'params': params, 'code_version': CODE_VERSION},
+                              sort_keys=True, default=str)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def get_fingerprint(self, offer_datafile: str) -> str:
+        """Get data fingerprint, reusing hash computed for unchanged files
+
+        Parameters
+        ----------
+        offer_datafile : str
+            data file or dataset directory
+
+        Returns
+        -------
+        str
+            data fingerprint
+        """
+        path = Path(offer_datafile).resolve()
+        data_files = sorted(p for p in path.rglob('*') if p.is_file()) \
+            if path.is_dir() else [path]
+        file_stats = [(str(p), p.stat().st_size, p.stat().st_mtime_ns)
+                      for p in data_files]
+        stat_key = self.get_key('', 'fingerprint', file_stats=file_stats)
+        fingerprint = self.get(stat_key)
+        if fingerprint is None:
+            fingerprint = get_data_fingerprint(path)
+            self.set(stat_key, fingerprint)
+        return fingerprint
+
+    def get(self, key: str):
+        """Get cached value
+
+        Parameters
+        ----------
+        key : str
+            cache key
+
+        Returns
+        -------
+        object
+            cached value, None if not found
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return pickle.loads(self.memory[key])
+        if self.cache_dir:
+            cache_file = self.cache_dir / f"{key}.pkl"
+            try:
+                payload = cache_file.read_bytes()
+            except FileNotFoundError:
+                return None
+            os.utime(cache_file)  # mark as recently used
+            self._set_memory(key, payload)
+            return pickle.loads(payload)
+        return None
+
+    def set(self, key: str, value):
+        """Store value in cache
+
+        Parameters
+        ----------
+        key : str
+            cache key
+        value : object
+            picklable value
+        """
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._set_memory(key, payload)
+        if self.cache_dir:
+            cache_file = self.cache_dir / f"{key}.pkl"
+            temp_file = cache_file.with_suffix('.tmp')
+            temp_file.write_bytes(payload)
+            os.replace(temp_file, cache_file)
+            self._evict_disk()
+
+    def _set_memory(self, key: str, payload: bytes):
+        """Store pickled value in memory tier, evict least recently used"""
+        if len(payload) > self.max_memory_bytes:
+            return
+        if key in self.memory:
+            self.memory_bytes -= len(self.memory.pop(key))
+        self.memory[key] = payload
+        self.memory_bytes += len(payload)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        """Remove least recently used files above disk tier size limit"""
+        cache_files = [(f.stat().st_mtime, f.stat().st_size, f)
+                       for f in self.cache_dir.glob('*.pkl')]
+        disk_bytes = sum(size for _, size, _ in cache_files)
+        for _, size, cache_file in sorted(cache_files):
+            if disk_bytes <= self.max_disk_bytes:
+                break
+            cache_file.unlink()
+            disk_bytes -= size
+            logger.debug(f"Removed cached result: {cache_file.name}")
+
+    def clear(self):
+        """Remove all cached values"""
+        self.memory.clear()
+        self.memory_bytes = 0
+        if self.cache_dir:
+            for cache_file in self.cache_dir.glob('*.pkl'):
+                cache_file.unlink()
@@ -0,0 +1,284 @@
+"""Summarize offer data larger than memory
+
+Offer records are streamed from many data files in chunks. Partial
+aggregates (counts, moments, histogram bins and quantile sketches) are
+computed per chunk and merged, so only one chunk is held in memory.
+"""
+
+import json
+import logging
+from glob import glob
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from main.analysis.dtypes import apply_schema
+from main.analysis.sketch import (DESCRIBE_STATS, FixedWidthHistogram,
+                                  KLLSketch, PriceSketch, PriceStats,
+                                  RunningMoments)
+
+# Logger
+logger = logging.getLogger(__name__)
+
+PRICE_LABELS = {'price': 'Price', 'price_meter': 'Price/m\u00B2'}
+
+
+def iter_json_records(data_file: str, buffer_size: int = 2**20):
+    """Read records one by one from file with JSON array
+
+    Parameters
+    ----------
+    data_file : str
+        .json file with list of records (as saved by `Scraper.export_data`)
+    buffer_size : int, optional
+        number of characters read at once, by default 1M
+
+    Yields
+    -------
+    dict
+        offer record
+    """
+    decoder = json.JSONDecoder()
+    with open(data_file, 'r', encoding='utf-8') as f:
+        buffer = f.read(buffer_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'File does not contain JSON array: {data_file}')
+        position = 1
+        end_of_file = False
+        while True:
+            # Skip separators between records
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if end_of_file:
+                    raise
+                more = f.read(buffer_size)
+                end_of_file = not more
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+            yield record
+
+
+def iter_chunks(data_files: list, columns: list, chunk_size: int = 100000):
+    """Read offer data in chunks
+
+    Parameters
+    ----------
+    data_files : list
+        .json, .jsonl files or parquet datasets
+    columns : list
+        columns to read
+    chunk_size : int, optional
+        number of records per chunk, by default 100000
+
+    Yields
+    -------
+    pd.DataFrame
+        chunk of offer data with declared dtypes
+    """
+    for data_file in data_files:
+        path = Path(data_file)
+        logger.info(f"Reading data from: {path.resolve()}")
+        if path.is_dir() or path.suffix == '.parquet':
+            import pyarrow.dataset as ds
+
+            dataset = ds.dataset(str(path), format='parquet',
+                                 partitioning='hive')
+            for batch in dataset.to_batches(columns=columns,
+                                            batch_size=chunk_size):
+                yield apply_schema(batch.to_pandas())
+        elif path.suffix == '.jsonl':
+            for chunk in pd.read_json(path, lines=True, dtype=False,
+                                      convert_dates=False, chunksize=chunk_size):
+                yield apply_schema(chunk.reindex(columns=columns))
+        else:
+            records = []
+            for record in iter_json_records(path):
+                records.append({c: record.get(c) for c in columns})
+                if len(records) == chunk_size:
+                    yield apply_schema(pd.DataFrame(records, columns=columns))
+                    records = []
+            if records:
+                yield apply_schema(pd.DataFrame(records, columns=columns))
+
+
+def sketch_values(values: np.ndarray, bin_width: float, k: int = 800) -> PriceSketch:
+    """Summarize batch of values using vectorized operations
+
+    Parameters
+    ----------
+    values : np.ndarray
+        observations (missing values are skipped)
+    bin_width : float
+        histogram bin width
+    k : int, optional
+        quantile sketch size parameter, by default 800
+
+    Returns
+    -------
+    PriceSketch
+        statistics of the batch
+    """
+    values = np.asarray(values, dtype='float64')
+    values = values[~np.isnan(values)]
+    sketch = PriceSketch(bin_width, k=k)
+    if len(values) == 0:
+        return sketch
+    mean = values.mean()
+    sketch.moments = RunningMoments(len(values), float(mean),
+                                    float(((values - mean) ** 2).sum()),
+                                    float(values.min()), float(values.max()))
+    sketch.quantiles = KLLSketch(k=k)
+    sketch.quantiles.update_many(values.tolist())
+    bins, counts = np.unique(np.floor(values / bin_width).astype('int64'),
+                             return_counts=True)
+    sketch.histogram = FixedWidthHistogram(bin_width)
+    sketch.histogram.counts = dict(zip(bins.tolist(), counts.tolist()))
+    return sketch
+
+
+def get_price_stats_summary(price_stats: PriceStats) -> pd.DataFrame:
+    """Get price summary table from price statistics
+
+    Parameters
+    ----------
+    price_stats : PriceStats
+        price statistics (e.g. collected during scraping)
+
+    Returns
+    -------
+    pd.DataFrame
+        Price descriptive statistics, as in `OfferAnalyzer.get_price_summary`
+    """
+    price_summary = pd.DataFrame(
+        {PRICE_LABELS[c]: stats for c, stats in price_stats.describe().items()},
+        index=DESCRIBE_STATS)
+    return price_summary
+
+
+def get_price_stats_district_summary(price_stats: PriceStats) -> pd.DataFrame:
+    """Get price by district table from price statistics
+
+    Parameters
+    ----------
+    price_stats : PriceStats
+        price statistics (e.g. collected during scraping)
+
+    Returns
+    -------
+    pd.DataFrame
+        Price descriptive statistics grouped by district,
+        as in `OfferAnalyzer.get_price_district_summary`
+    """
+    price_district_summary = pd.concat(
+        {PRICE_LABELS[c]: pd.DataFrame(stats, index=DESCRIBE_STATS).T
+         for c, stats in price_stats.describe_districts().items()},
+        axis=1)
+    price_district_summary.index.name = 'district'
+    price_district_summary = price_district_summary.sort_values(
+        by=('Price/m\u00B2', '50%'), ascending=False)
+    return price_district_summary
+
+
+class ChunkedOfferAnalyzer(object):
+    """ Summarize offer data from many files in a single streaming pass
+
+    Statistics are the same as in `OfferAnalyzer`. Count, mean, std, min
+    and max are exact, quartiles are estimated with quantile sketches
+    (exact for groups of up to `sketch_k` offers).
+    """
+
+    def __init__(self, offer_datafiles,
+                 districts: list = None,
+                 chunk_size: int = 100000,
+                 sketch_k: int = 800):
+        """
+        Parameters
+        ----------
+        offer_datafiles : str or list
+            data files, parquet datasets or glob pattern (e.g. 'data/*.json')
+        districts : list, optional
+            districts to analyze, by default all
+        chunk_size : int, optional
+            number of records held in memory, by default 100000
+        sketch_k : int, optional
+            quantile sketch size parameter, by default 800
+        """
+        if isinstance(offer_datafiles, (str, Path)):
+            offer_datafiles = sorted(glob(str(offer_datafiles))) or [offer_datafiles]
+        self.offer_datafiles = list(offer_datafiles)
+        self.districts = districts
+        self.chunk_size = chunk_size
+        self.sketch_k = sketch_k
+        self.price_stats = None  # statistics in total and per district
+
+    def _aggregate(self):
+        """Compute partial aggregates per chunk and merge them"""
+        self.price_stats = PriceStats(k=self.sketch_k)
+        n_records = 0
+        for chunk in iter_chunks(self.offer_datafiles,
+                                 ['district'] + list(PriceStats.PRICE_COLUMNS),
+                                 self.chunk_size):
+            if self.districts:
+                chunk = chunk.loc[chunk['district'].isin(self.districts)]
+            n_records += len(chunk)
+            for column, bin_width in PriceStats.PRICE_COLUMNS.items():
+                self.price_stats.merge_sketch(
+                    column, sketch_values(chunk[column].to_numpy(), bin_width, self.sketch_k))
+                for district, values in chunk.groupby('district', observed=True)[column]:
+                    self.price_stats.merge_sketch(
+                        column,
+                        sketch_values(values.to_numpy(), bin_width, self.sketch_k),
+                        district)
+            logger.debug(f"Aggregated {n_records} records")
+        logger.info(
+            f"Aggregated {n_records} records from {len(self.offer_datafiles)} files")
+
+    def get_price_summary(self) -> pd.DataFrame:
+        """Summarize price (total and per meter)
+
+        Returns
+        -------
+        pd.DataFrame
+            Price descriptive statistics
+        """
+        if self.price_stats is None:
+            self._aggregate()
+        price_summary = get_price_stats_summary(self.price_stats)
+        with pd.option_context('precision', 0):
+            logger.info(f"\n{price_summary}")
+        return price_summary
+
+    def get_price_district_summary(self) -> pd.DataFrame:
+        """Summarize price by district
+
+        Returns
+        -------
+        pd.DataFrame
+            Price descriptive statistics grouped by district
+        """
+        if self.price_stats is None:
+            self._aggregate()
+        price_district_summary = get_price_stats_district_summary(self.price_stats)
+        with pd.option_context('precision', 0):
+            logger.info(f"\n{price_district_summary}")
+        return price_district_summary
+
+    def get_price_histograms(self) -> dict:
+        """Get histogram bins of price (total and per meter)
+
+        Returns
+        -------
+        dict
+            column label -> (bin edges, counts)
+        """
+        if self.price_stats is None:
+            self._aggregate()
+        return {PRICE_LABELS[c]: s.histogram.get_bins()
+                for c, s in self.price_stats.total.items()}
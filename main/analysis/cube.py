@@ -0,0 +1,256 @@
+"""Precomputed aggregates of price over offer segments
+
+The cube holds counts, moments, histogram bins and quantile sketch items of
+price and price per meter for each combination of segment values (cell).
+Slices and roll-ups are answered from cells without reading offer data.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from main.analysis.sketch import DESCRIBE_STATS, KLLSketch, PriceStats, RunningMoments
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Segment columns of the cube
+CUBE_DIMENSIONS = ['district', 'nrooms', 'market', 'building_type', 'owner', 'floor_band']
+
+# Floor -> floor band
+FLOOR_BANDS = {'-1': 'basement', '0': 'ground',
+               '1': '1-3', '2': '1-3', '3': '1-3',
+               '4': '4-7', '5': '4-7', '6': '4-7', '7': '4-7',
+               '8': '8-10', '9': '8-10', '10': '8-10',
+               '>10': '>10'}
+
+# Label of missing segment value
+UNKNOWN = 'unknown'
+
+PRICE_LABELS = {'price': 'Price', 'price_meter': 'Price/m\u00B2'}
+
+
+def get_floor_band(floor: pd.Series) -> pd.Series:
+    """Group floors into bands
+
+    Parameters
+    ----------
+    floor : pd.Series
+        encoded floor e.g. '-1', '4', '>10'
+
+    Returns
+    -------
+    pd.Series
+        floor band e.g. 'basement', '4-7', '>10'
+    """
+    return floor.astype(object).map(FLOOR_BANDS).fillna(UNKNOWN)
+
+
+def weighted_quantiles(values: np.ndarray, weights: np.ndarray, qs: list) -> list:
+    """Get quantiles of weighted sketch items (as `KLLSketch.quantile`)
+
+    Parameters
+    ----------
+    values : np.ndarray
+        item values
+    weights : np.ndarray
+        item weights
+    qs : list
+        quantiles to compute
+
+    Returns
+    -------
+    list
+        quantile values (NaN if no items)
+    """
+    if len(values) == 0:
+        return [np.nan] * len(qs)
+    order = np.argsort(values, kind='mergesort')
+    values = values[order]
+    cumulative_weight = np.cumsum(weights[order])
+    last = len(values) - 1
+    result = []
+    for q in qs:
+        position = q * (cumulative_weight[-1] - 1)
+        lower = np.floor(position)
+        lower_value = values[min(np.searchsorted(cumulative_weight, lower, side='right'), last)]
+        upper_value = values[min(np.searchsorted(cumulative_weight, lower + 1, side='right'), last)] \
+            if position > lower else lower_value
+        result.append(lower_value + (upper_value - lower_value) * (position - lower))
+    return result
+
+
+class AggregateCube(object):
+    """ Price aggregates per offer segment, with slice and roll-up queries """
+
+    def __init__(self, offer_data: pd.DataFrame,
+                 dimensions: list = None,
+                 k: int = 200):
+        """
+        Parameters
+        ----------
+        offer_data : pd.DataFrame
+            offer data with price, price_meter, floor and segment columns
+        dimensions : list, optional
+            segment columns, by default `CUBE_DIMENSIONS`
+        k : int, optional
+            quantile sketch size parameter per cell, by default 200
+        """
+        self.dimensions = dimensions or CUBE_DIMENSIONS
+        self.k = k
+        self.cells = None  # cell segments and moments (count, mean, M2, min, max)
+        self.sketch_items = {}  # column -> cell id, value, weight
+        self.histograms = {}  # column -> cell id, bin, count
+        self._build(offer_data)
+
+    def _build(self, offer_data: pd.DataFrame):
+        """Aggregate offer data into cells"""
+        offer_data = offer_data.copy()
+        if 'floor_band' in self.dimensions:
+            offer_data['floor_band'] = get_floor_band(offer_data['floor'])
+        segments = pd.DataFrame({d: offer_data[d].astype(object).fillna(UNKNOWN).astype(str)
+                                 for d in self.dimensions})
+        cell_id = segments.groupby(self.dimensions, sort=True).ngroup()
+        self.cells = segments.groupby(cell_id).first()
+        self.cells.index.name = 'cell_id'
+
+        for column, bin_width in PriceStats.PRICE_COLUMNS.items():
+            values = offer_data[column].astype('float64')
+            valid = values.notna()
+            cell_values = pd.DataFrame({'cell_id': cell_id[valid], 'value': values[valid]})
+            # Mean and sum of squared differences from the mean (as `RunningMoments`)
+            moments = cell_values.groupby('cell_id').agg(
+                count=('value', 'size'), mean=('value', 'mean'), var=('value', 'var'),
+                min=('value', 'min'), max=('value', 'max'))
+            moments['m2'] = (moments.pop('var') * (moments['count'] - 1)).fillna(0)
+            moments = moments.reindex(self.cells.index)
+            moments[['count', 'mean', 'm2']] = moments[['count', 'mean', 'm2']].fillna(0)
+            for stat in moments.columns:
+                self.cells[f"{column}_{stat}"] = moments[stat]
+
+            # Quantile sketch items per cell
+            items = []
+            for cell, group_values in cell_values.groupby('cell_id')['value']:
+                sketch = KLLSketch(k=self.k)
+                sketch.update_many(group_values.tolist())
+                for level, level_values in enumerate(sketch.levels):
+                    items.extend((cell, v, 2 ** level) for v in level_values)
+            self.sketch_items[column] = pd.DataFrame(items, columns=['cell_id', 'value', 'weight'])
+
+            # Histogram bins per cell
+            cell_values['bin'] = np.floor(cell_values['value'] / bin_width).astype('int64')
+            self.histograms[column] = cell_values.groupby(['cell_id', 'bin']).size()\
+                .rename('count').reset_index()
+        logger.info(f"Built aggregate cube with {len(self.cells)} cells "
+                    f"over: {', '.join(self.dimensions)}")
+
+    def _select_cells(self, filters: dict) -> pd.DataFrame:
+        """Get cells matching segment filters
+
+        Parameters
+        ----------
+        filters : dict
+            dimension -> value or list of values
+
+        Returns
+        -------
+        pd.DataFrame
+            matching cells
+
+        Raises
+        ------
+        ValueError
+            if filter on unknown dimension specified
+        """
+        cells = self.cells
+        for dimension, values in filters.items():
+            if dimension not in self.dimensions:
+                raise ValueError(f'Incorrect cube dimension: {dimension}')
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            cells = cells.loc[cells[dimension].isin([str(v) for v in values])]
+        return cells
+
+    def query(self, by: list = None, **filters) -> pd.DataFrame:
+        """Summarize price for a slice of the cube, rolled up to given dimensions
+
+        Parameters
+        ----------
+        by : list, optional
+            dimensions to group by, by default None (total)
+        **filters
+            dimension -> value or list of values, e.g. market='Primary'
+
+        Returns
+        -------
+        pd.DataFrame
+            Price descriptive statistics per group
+            (same layout as `OfferAnalyzer.get_price_district_summary`)
+
+        Examples
+        --------
+        >>> cube.query(by=['district'], nrooms=['2', '3'], market='Primary')
+        """
+        by = list(by) if by else []
+        cells = self._select_cells(filters)
+        if by:
+            groups = cells.groupby(by[0] if len(by) == 1 else by, sort=True).groups
+        else:
+            groups = {'All': cells.index}
+        summary = {}
+        for column in PriceStats.PRICE_COLUMNS:
+            items = self.sketch_items[column]
+            items = items.loc[items['cell_id'].isin(cells.index)]
+            items_by_cell = items.groupby('cell_id').indices
+            stats = {}
+            for group, cell_ids in groups.items():
+                # Merge cell moments (no cancellation as in sum of squares)
+                moments = RunningMoments()
+                cell_moments = cells.loc[cell_ids, [f"{column}_count", f"{column}_mean",
+                                                    f"{column}_m2"]]
+                for cell_count, cell_mean, cell_m2 in cell_moments.itertuples(index=False):
+                    moments.merge(RunningMoments(cell_count, cell_mean, cell_m2))
+                count = moments.count
+                positions = [p for c in cell_ids for p in items_by_cell.get(c, [])]
+                q25, q50, q75 = weighted_quantiles(items['value'].to_numpy()[positions],
+                                                   items['weight'].to_numpy()[positions],
+                                                   [0.25, 0.5, 0.75])
+                stats[group] = {'count': count,
+                                'mean': moments.mean if count else np.nan,
+                                'std': moments.std,
+                                'min': cells.loc[cell_ids, f"{column}_min"].min(),
+                                '25%': q25, '50%': q50, '75%': q75,
+                                'max': cells.loc[cell_ids, f"{column}_max"].max()}
+            summary[PRICE_LABELS[column]] = pd.DataFrame(stats, index=DESCRIBE_STATS).T
+        cube_summary = pd.concat(summary, axis=1)
+        if len(by) > 1:
+            cube_summary.index = pd.MultiIndex.from_tuples(cube_summary.index, names=by)
+        else:
+            cube_summary.index.name = by[0] if by else None
+        return cube_summary
+
+    def histogram(self, column: str = 'price_meter', **filters) -> tuple:
+        """Get histogram bins of price for a slice of the cube
+
+        Parameters
+        ----------
+        column : str, optional
+            price variable (price/price_meter), by default 'price_meter'
+        **filters
+            dimension -> value or list of values
+
+        Returns
+        -------
+        tuple
+            (list of bin edges, list of counts)
+        """
+        cells = self._select_cells(filters)
+        bins = self.histograms[column]
+        counts = bins.loc[bins['cell_id'].isin(cells.index)].groupby('bin')['count'].sum()
+        if counts.empty:
+            return [], []
+        bin_width = PriceStats.PRICE_COLUMNS[column]
+        all_bins = range(counts.index.min(), counts.index.max() + 1)
+        counts = counts.reindex(all_bins, fill_value=0)
+        edges = [b * bin_width for b in range(all_bins.start, all_bins.stop + 1)]
+        return edges, counts.tolist()
@@ -0,0 +1,482 @@
+"""Near-duplicate offer detection across listings and portals
+
+The same flat is often posted several times (by different agencies, or on
+both OLX and Otodom) with slightly different titles and prices. Offers are
+compared only within blocks of equal district, number of rooms and rounded
+area (and run date, if present); areas are rounded on two grids shifted by
+half a square meter, so close areas near a rounding boundary share a block.
+Within a block, candidates are offers with an equal band of the MinHash
+signature of their title (LSH), and of those only neighbours in price order
+are compared, so the number of comparisons grows linearly with the number
+of offers. Candidates with similar titles, area and price (and the same
+floor, market, building type and furniture, where known) are joined into
+clusters, and each cluster gets a canonical offer ID - the link of its first
+offer. Every offer of a cluster is a duplicate of its first offer, pairs do
+not chain offers which are not alike.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from main.analysis.diff import get_offer_key
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Offer parameters which duplicates share (if known for both offers)
+MATCH_COLUMNS = ['floor', 'market', 'building_type', 'furniture']
+
+# Offer columns used to find duplicates
+DEDUP_COLUMNS = ['link', 'title', 'district', 'area', 'nrooms', 'price'] + MATCH_COLUMNS
+
+# Number of rooms -> block (OLX and Otodom encode more than 3 rooms differently)
+ROOM_BLOCKS = {'1': '1', '2': '2', '3': '3', '>3': '>3',
+               '4': '>3', '5': '>3', '6': '>3', '7': '>3', '8': '>3', '9': '>3', '10': '>3'}
+
+SHINGLE_BASE = 257  # base of rolling hash of title shingles
+HASH_MASK = 2**32 - 1
+
+
+def normalize_titles(titles: pd.Series) -> pd.Series:
+    """Lowercase titles, replace punctuation and repeated spaces with a space
+
+    Parameters
+    ----------
+    titles : pd.Series
+        offer titles
+
+    Returns
+    -------
+    pd.Series
+        normalized titles, missing titles as empty strings
+    """
+    return titles.fillna('').astype(str).str.lower()\
+        .str.replace(r'[\W_]+', ' ', regex=True).str.strip()
+
+
+def get_shingle_hashes(titles: pd.Series, k: int = 3) -> tuple:
+    """Hash character k-grams (shingles) of all titles at once
+
+    Parameters
+    ----------
+    titles : pd.Series
+        normalized titles
+    k : int, optional
+        shingle length [bytes], by default 3
+
+    Returns
+    -------
+    tuple
+        (32-bit shingle hashes of all titles, index of the first
+        shingle of each title); titles shorter than k are padded
+    """
+    encoded = titles.str.pad(k, side='right').str.encode('utf-8')
+    lengths = encoded.str.len().to_numpy(dtype=np.int64)
+    text = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+    ends = np.cumsum(lengths)
+    title_index = np.repeat(np.arange(len(lengths)), lengths)
+    positions = np.flatnonzero(np.arange(len(text)) + k <= ends[title_index])
+
+    hashes = np.zeros(len(positions), dtype=np.uint64)
+    for j in range(k):
+        hashes = (hashes * np.uint64(SHINGLE_BASE) + text[positions + j]) & np.uint64(HASH_MASK)
+    n_shingles = lengths - k + 1
+    return hashes, np.cumsum(n_shingles) - n_shingles
+
+
+class OfferDeduplicator(object):
+    """ Cluster near-duplicate offers, assign canonical offer IDs """
+
+    def __init__(self, num_perm: int = 32,
+                 bands: int = 8,
+                 shingle_size: int = 3,
+                 threshold: float = 0.6,
+                 area_tolerance: float = 0.5,
+                 price_tolerance: float = 0.1,
+                 window: int = 10,
+                 chunk_size: int = 100000,
+                 seed: int = 1):
+        """
+        Parameters
+        ----------
+        num_perm : int, optional
+            length of MinHash signature, by default 32
+        bands : int, optional
+            number of LSH bands (divides num_perm), by default 8
+        shingle_size : int, optional
+            length of title shingles [bytes], by default 3
+        threshold : float, optional
+            lowest estimated Jaccard similarity of duplicate titles, by default 0.6
+        area_tolerance : float, optional
+            largest area difference of duplicates [m²], by default 0.5
+        price_tolerance : float, optional
+            largest relative price difference of duplicates, by default 0.1
+        window : int, optional
+            number of following offers (in price order) compared with each
+            offer of a LSH bucket, by default 10
+        chunk_size : int, optional
+            number of titles hashed at once, by default 100000
+        seed : int, optional
+            random seed of MinHash permutations, by default 1
+
+        Raises
+        ------
+        ValueError
+            if number of bands does not divide signature length
+        """
+        if num_perm % bands:
+            raise ValueError(f'Number of bands ({bands}) must divide signature length ({num_perm})')
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.area_tolerance = area_tolerance
+        self.price_tolerance = price_tolerance
+        self.window = window
+        self.chunk_size = chunk_size
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hash functions (odd multipliers) in place of permutations
+        self.hash_a = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.hash_b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self.stats = {'offers': 0, 'candidates': 0, 'matches': 0, 'duplicates': 0}
+
+    def get_signatures(self, titles: pd.Series) -> np.ndarray:
+        """Get MinHash signatures of titles
+
+        Parameters
+        ----------
+        titles : pd.Series
+            offer titles
+
+        Returns
+        -------
+        np.ndarray
+            signatures, array of shape (number of titles, num_perm)
+        """
+        titles = normalize_titles(titles)
+        signatures = np.empty((len(titles), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(titles), self.chunk_size):
+            hashes, offsets = get_shingle_hashes(titles.iloc[start:start + self.chunk_size],
+                                                 self.shingle_size)
+            rows = slice(start, start + len(offsets))
+            for i in range(self.num_perm):
+                hashed = (hashes * self.hash_a[i] + self.hash_b[i]) >> np.uint64(32)  # wraps around 2**64
+                signatures[rows, i] = np.minimum.reduceat(hashed.astype(np.uint32), offsets)
+        return signatures
+
+    @staticmethod
+    def get_blocks(offer_data: pd.DataFrame, area_shift: float = 0) -> np.ndarray:
+        """Get block of each offer, only offers in the same block are compared
+
+        Parameters
+        ----------
+        offer_data : pd.DataFrame
+            offer data with district, nrooms and area (and run_date)
+        area_shift : float, optional
+            shift of area rounding grid [m²], by default 0
+
+        Returns
+        -------
+        np.ndarray
+            block number, -1 for offers without district, rooms or area
+        """
+        block_data = pd.DataFrame({
+            'district': offer_data['district'].astype(str).where(offer_data['district'].notna()),
+            'nrooms': offer_data['nrooms'].astype(str).map(ROOM_BLOCKS),
+            'area': np.round(pd.to_numeric(offer_data['area'], errors='coerce') + area_shift)},
+            index=offer_data.index)
+        if 'run_date' in offer_data.columns:
+            block_data['run_date'] = offer_data['run_date'].astype(str)
+        return block_data.groupby(list(block_data.columns), sort=False).ngroup()\
+            .fillna(-1).to_numpy(dtype=np.int64)  # missing keys are not grouped
+
+    def _get_band_keys(self, signatures: np.ndarray, band: int) -> np.ndarray:
+        """Hash rows of signature band into single key"""
+        rows = self.num_perm // self.bands
+        keys = np.zeros(len(signatures), dtype=np.uint64)
+        for row in range(band * rows, (band + 1) * rows):
+            keys = keys * np.uint64(1000003) + signatures[:, row]  # wraps around 2**64
+        return keys
+
+    def iter_candidates(self, blockings: list, signatures: np.ndarray,
+                        prices: np.ndarray):
+        """Find candidate pairs - offers in the same block and LSH bucket,
+        near each other in price order
+
+        Parameters
+        ----------
+        blockings : list
+            arrays with block of each offer (-1 - not compared),
+            pairs are searched in each blocking
+        signatures : np.ndarray
+            MinHash signatures of titles
+        prices : np.ndarray
+            offer prices
+
+        Yields
+        ------
+        tuple
+            (band, pairs of offer positions (first < second), shape (n, 2));
+            a pair may be found in several bands and blockings
+        """
+        price_order = np.argsort(prices, kind='stable')
+        for band in range(self.bands):
+            band_keys = self._get_band_keys(signatures, band)
+            for blocks in blockings:
+                # Bucket key of block and band, offers sorted by key then price
+                keys = band_keys * np.uint64(1000003) + (blocks + 1).astype(np.uint64)
+                compared = price_order[blocks[price_order] >= 0]
+                order = compared[np.argsort(keys[compared], kind='stable')]
+                sorted_keys = keys[order]
+                for offset in range(1, min(self.window, len(order) - 1) + 1):
+                    same = sorted_keys[:-offset] == sorted_keys[offset:]
+                    first = order[:-offset][same]
+                    second = order[offset:][same]
+                    yield band, np.column_stack([np.minimum(first, second),
+                                                 np.maximum(first, second)])
+
+    def get_features(self, offer_data: pd.DataFrame) -> dict:
+        """Get offer features compared to find duplicates
+
+        Parameters
+        ----------
+        offer_data : pd.DataFrame
+            offer data with `DEDUP_COLUMNS`
+
+        Returns
+        -------
+        dict
+            MinHash signatures of titles, areas, prices and codes of
+            `MATCH_COLUMNS` (-1 if missing) of offers
+        """
+        columns = offer_data.columns.intersection(MATCH_COLUMNS)
+        codes = np.empty((len(offer_data), len(columns)), dtype=np.int64)
+        for i, column in enumerate(columns):
+            codes[:, i] = pd.factorize(offer_data[column])[0]  # -1 if missing
+        areas = pd.to_numeric(offer_data['area'], errors='coerce')
+        prices = pd.to_numeric(offer_data['price'], errors='coerce')
+        return {'signatures': self.get_signatures(offer_data['title']),
+                'areas': areas.to_numpy(dtype=np.float64),
+                'prices': prices.to_numpy(dtype=np.float64),
+                'codes': codes}
+
+    def is_match(self, first: np.ndarray, second: np.ndarray, features: dict) -> np.ndarray:
+        """Check if offers have similar titles, area and price,
+        and equal known parameters
+
+        Parameters
+        ----------
+        first, second : np.ndarray
+            positions of compared offers
+        features : dict
+            offer features (see `get_features`)
+
+        Returns
+        -------
+        np.ndarray
+            True for offers which are duplicates
+        """
+        signatures, areas, prices, codes = (features[f] for f in ['signatures', 'areas',
+                                                                  'prices', 'codes'])
+        price_difference = np.abs(prices[first] - prices[second]) / \
+            np.maximum(prices[first], prices[second])
+        first_codes, second_codes = codes[first], codes[second]
+        with np.errstate(invalid='ignore'):
+            match = ((first_codes == second_codes) |
+                     (first_codes < 0) | (second_codes < 0)).all(axis=1) & \
+                (np.abs(areas[first] - areas[second]) <= self.area_tolerance) & \
+                ((price_difference <= self.price_tolerance) |
+                 np.isnan(prices[first]) | np.isnan(prices[second]))
+        # Titles are compared last, only for offers with similar parameters
+        similar = np.flatnonzero(match)
+        match[similar] = (signatures[first[similar]] == signatures[second[similar]]).mean(axis=1) \
+            >= self.threshold
+        return match
+
+    def get_matches(self, blockings: list, features: dict) -> np.ndarray:
+        """Find duplicate pairs
+
+        Candidates are verified as soon as they are found and duplicate pairs
+        are merged after each band, so memory use grows with the number of
+        duplicate pairs, not of candidate pairs.
+
+        Parameters
+        ----------
+        blockings : list
+            arrays with block of each offer (-1 - not compared)
+        features : dict
+            offer features (see `get_features`)
+
+        Returns
+        -------
+        np.ndarray
+            unique pairs of duplicate offers (first < second), shape (n, 2)
+        """
+        n_offers = len(features['signatures'])
+        pair_codes = [np.empty(0, dtype=np.int64)]  # pairs of previous bands, then of band
+        last_band = 0
+        self.stats['candidates'] = 0
+        for band, pairs in self.iter_candidates(blockings, features['signatures'],
+                                                np.nan_to_num(features['prices'])):
+            if band != last_band:
+                pair_codes = [np.unique(np.concatenate(pair_codes))]
+                last_band = band
+            self.stats['candidates'] += len(pairs)
+            pairs = pairs[self.is_match(pairs[:, 0], pairs[:, 1], features)]
+            pair_codes.append(pairs[:, 0].astype(np.int64) * n_offers + pairs[:, 1])
+        pair_codes = np.unique(np.concatenate(pair_codes))
+        return np.column_stack([pair_codes // n_offers, pair_codes % n_offers])
+
+    @staticmethod
+    def get_clusters(n_offers: int, pairs: np.ndarray) -> np.ndarray:
+        """Join duplicate pairs into clusters (connected components)
+
+        Parameters
+        ----------
+        n_offers : int
+            number of offers
+        pairs : np.ndarray
+            pairs of duplicate offers
+
+        Returns
+        -------
+        np.ndarray
+            position of the first offer of cluster, for each offer
+        """
+        labels = np.arange(n_offers)
+        first, second = pairs[:, 0], pairs[:, 1]
+        while True:
+            # Propagate smallest label over pairs, then shortcut label chains
+            pair_labels = np.minimum(labels[first], labels[second])
+            new_labels = labels.copy()
+            np.minimum.at(new_labels, first, pair_labels)
+            np.minimum.at(new_labels, second, pair_labels)
+            new_labels = new_labels[new_labels]
+            while True:
+                shortcut = new_labels[new_labels]
+                if np.array_equal(shortcut, new_labels):
+                    break
+                new_labels = shortcut
+            if np.array_equal(new_labels, labels):
+                return labels
+            labels = new_labels
+
+    def get_checked_clusters(self, matches: np.ndarray, features: dict) -> np.ndarray:
+        """Join duplicate pairs into clusters, each offer being a duplicate
+        of the first offer of its cluster
+
+        Pairs of duplicates may chain offers which are not alike (each
+        within tolerance of the next one). Offers which do not match the
+        first offer of their cluster are clustered again among themselves,
+        until all offers match the first offer of their cluster.
+
+        Parameters
+        ----------
+        matches : np.ndarray
+            pairs of duplicate offers
+        features : dict
+            offer features (see `get_features`)
+
+        Returns
+        -------
+        np.ndarray
+            position of the first offer of cluster, for each offer
+        """
+        n_offers = len(features['signatures'])
+        labels = self.get_clusters(n_offers, matches)
+        members = np.flatnonzero(labels != np.arange(n_offers))
+        while len(members):
+            far = members[~self.is_match(labels[members], members, features)]
+            if not len(far):
+                break
+            # Pairs of far offers, by position among far offers
+            far_positions = np.full(n_offers, -1)
+            far_positions[far] = np.arange(len(far))
+            matches = far_positions[matches]
+            matches = matches[(matches >= 0).all(axis=1)]
+            labels[far] = far[self.get_clusters(len(far), matches)]
+            members = far[labels[far] != far]
+            matches = far[matches]
+        return labels
+
+    def get_canonical_ids(self, offer_data: pd.DataFrame) -> pd.Series:
+        """Get canonical offer ID of each offer
+
+        Parameters
+        ----------
+        offer_data : pd.DataFrame
+            offer data with `DEDUP_COLUMNS` (and run_date)
+
+        Returns
+        -------
+        pd.Series
+            link (without query string) of the first offer of cluster,
+            offers without duplicates get their own link
+        """
+        features = self.get_features(offer_data)
+        blockings = [self.get_blocks(offer_data, area_shift) for area_shift in (0, 0.5)]
+        matches = self.get_matches(blockings, features)
+        labels = self.get_checked_clusters(matches, features)
+
+        keys = get_offer_key(offer_data['link']).to_numpy()
+        canonical_ids = pd.Series(keys[labels], index=offer_data.index, name='canonical_id')
+        self.stats.update({'offers': len(offer_data),
+                           'matches': len(matches),
+                           'duplicates': int((labels != np.arange(len(labels))).sum())})
+        logger.info(f"Found {self.stats['duplicates']} duplicates of {self.stats['offers']} offers "
+                    f"({self.stats['candidates']} candidate pairs compared)")
+        return canonical_ids
+
+
+def add_canonical_id(offer_data: pd.DataFrame, **params) -> pd.DataFrame:
+    """Add canonical offer ID to offer data
+
+    Parameters
+    ----------
+    offer_data : pd.DataFrame
+        offer data with `DEDUP_COLUMNS`
+    **params
+        parameters of `OfferDeduplicator`
+
+    Returns
+    -------
+    pd.DataFrame
+        offer data with canonical_id column
+
+    Examples
+    --------
+    >>> offer_data = add_canonical_id(offer_data)
+    >>> offer_data.groupby('canonical_id')['price'].min()
+    """
+    return offer_data.assign(canonical_id=OfferDeduplicator(**params).get_canonical_ids(offer_data))
+
+
+def get_false_duplicate_share(n_offers: int = 100000, seed: int = 0, **params) -> float:
+    """Check precision on synthetic offers without duplicates
+
+    Offers of `main.analysis.synthetic.generate_offers` are all different
+    flats (with generic titles), so every offer marked as duplicate is a
+    false duplicate.
+
+    Parameters
+    ----------
+    n_offers : int, optional
+        number of offers, by default 100000
+    seed : int, optional
+        random seed, by default 0
+    **params
+        parameters of `OfferDeduplicator`
+
+    Returns
+    -------
+    float
+        share of offers marked as duplicates
+    """
+    from main.analysis.synthetic import generate_offers
+
+    offer_data = pd.DataFrame(list(generate_offers(n_offers, seed)))
+    deduplicator = OfferDeduplicator(**params)
+    deduplicator.get_canonical_ids(offer_data)
+    return deduplicator.stats['duplicates'] / n_offers
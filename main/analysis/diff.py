@@ -0,0 +1,275 @@
+"""Compare offer snapshots of consecutive scraping runs
+
+Offers are matched by key (ad link without query string and fragment),
+all comparisons are done on whole columns at once.
+"""
+
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from main.analysis.dtypes import apply_schema
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Column identifying an offer across snapshots
+DIFF_KEY = 'link'
+
+# Offer fields compared for attribute changes
+ATTRIBUTE_FIELDS = ['title', 'district', 'area', 'furniture', 'owner', 'floor',
+                    'nrooms', 'market', 'building_type']
+
+# Columns of price change history
+PRICE_HISTORY_COLUMNS = ['key', 'district', 'run_date_before', 'run_date_after',
+                         'price_before', 'price_after', 'price_change', 'price_change_pct']
+
+
+def get_offer_key(links: pd.Series) -> pd.Series:
+    """Get offer key from ad links
+
+    Parameters
+    ----------
+    links : pd.Series
+        ad links
+
+    Returns
+    -------
+    pd.Series
+        links without query string and fragment
+    """
+    links = links.astype(str)
+    has_suffix = links.str.contains('[?#]', regex=True)
+    if has_suffix.any():
+        links = links.where(~has_suffix, links[has_suffix].str.replace(r'[?#].*$', '', regex=True))
+    return links
+
+
+def get_run_dates(offer_datafile: str) -> list:
+    """Get run dates stored in parquet dataset
+
+    Parameters
+    ----------
+    offer_datafile : str
+        parquet dataset (directory / .parquet file)
+
+    Returns
+    -------
+    list
+        sorted run dates (YYYY-MM-DD)
+    """
+    path = Path(offer_datafile)
+    if path.is_dir():
+        return sorted(p.name.split('=', 1)[1] for p in path.glob('run_date=*') if p.is_dir())
+    run_dates = pd.read_parquet(path, engine='pyarrow', columns=['run_date'])['run_date']
+    return sorted(run_dates.astype(str).unique())
+
+
+def read_snapshot(offer_datafile: str,
+                  run_date: str = None,
+                  districts: list = None) -> pd.DataFrame:
+    """Read offer data of a single scraping run
+
+    Parameters
+    ----------
+    offer_datafile : str
+        .json file or parquet dataset (directory / .parquet file)
+    run_date : str, optional
+        run date (YYYY-MM-DD) read from parquet dataset, by default the latest
+    districts : list, optional
+        districts to read, by default all
+
+    Returns
+    -------
+    pd.DataFrame
+        offer data with declared dtypes
+
+    Raises
+    ------
+    ValueError
+        if parquet dataset has no data of given run date
+    """
+    path = Path(offer_datafile)
+    if path.is_dir() or path.suffix == '.parquet':
+        run_dates = get_run_dates(path)
+        run_date = str(run_date) if run_date else (run_dates[-1] if run_dates else None)
+        if run_date not in run_dates:
+            raise ValueError(f'No data of run date {run_date} in: {path.resolve()}')
+        filters = [('run_date', '=', run_date)]
+        if districts:
+            filters.append(('district', 'in', list(districts)))
+        offer_data = pd.read_parquet(path, engine='pyarrow', filters=filters)
+        offer_data['run_date'] = offer_data['run_date'].astype(str)
+    else:
+        offer_data = pd.read_json(path, dtype=False, convert_dates=False)
+        if districts:
+            offer_data = offer_data.loc[offer_data['district'].isin(districts)]
+    logger.info(f"Read snapshot of {len(offer_data)} offers from: {path.resolve()}"
+                + (f" (run date {run_date})" if run_date else ''))
+    return apply_schema(offer_data)
+
+
+def _values_differ(before: pd.Series, after: pd.Series) -> np.ndarray:
+    """Compare columns element-wise, missing values are equal to each other"""
+    if before.dtype.name == 'category' or after.dtype.name == 'category':
+        before, after = before.astype(object), after.astype(object)
+    before_missing, after_missing = before.isna().to_numpy(), after.isna().to_numpy()
+    differ = (before.to_numpy() != after.to_numpy())
+    return (differ & ~(before_missing & after_missing)) | (before_missing != after_missing)
+
+
+class SnapshotDiff(object):
+    """ New, removed, re-priced and changed offers between two snapshots """
+
+    def __init__(self, data_before: pd.DataFrame,
+                 data_after: pd.DataFrame,
+                 run_date_before: str = 'before',
+                 run_date_after: str = 'after'):
+        """
+        Parameters
+        ----------
+        data_before : pd.DataFrame
+            earlier snapshot of offer data
+        data_after : pd.DataFrame
+            later snapshot of offer data
+        run_date_before : str, optional
+            label of earlier snapshot, by default 'before'
+        run_date_after : str, optional
+            label of later snapshot, by default 'after'
+        """
+        self.run_date_before = str(run_date_before)
+        self.run_date_after = str(run_date_after)
+        self.new = None  # offers only in later snapshot
+        self.removed = None  # offers only in earlier snapshot
+        self.price_changed = None  # offers with changed price (before and after)
+        self.attribute_changed = None  # offers with changed attributes (before and after)
+        self._compare(data_before, data_after)
+
+    @staticmethod
+    def _index_by_key(offer_data: pd.DataFrame) -> pd.DataFrame:
+        """Index offers by key, keep last of repeated offers"""
+        offer_data = offer_data.assign(key=get_offer_key(offer_data[DIFF_KEY]))
+        return offer_data.drop_duplicates('key', keep='last').set_index('key')
+
+    def _compare(self, data_before: pd.DataFrame, data_after: pd.DataFrame):
+        """Match offers by key and compare price and attributes"""
+        before = self._index_by_key(data_before)
+        after = self._index_by_key(data_after)
+        in_before = before.index.isin(after.index)
+        in_after = after.index.isin(before.index)
+        self.new = after.loc[~in_after]
+        self.removed = before.loc[~in_before]
+
+        common = after.index[in_after]
+        before, after = before.loc[common], after.loc[common]
+        price_differs = _values_differ(before['price'], after['price'])
+        self.price_changed = pd.concat({'before': before.loc[price_differs],
+                                        'after': after.loc[price_differs]}, axis=1)
+
+        fields = [f for f in ATTRIBUTE_FIELDS if f in before.columns and f in after.columns]
+        changed_fields = pd.DataFrame({f: _values_differ(before[f], after[f]) for f in fields},
+                                      index=common)
+        attribute_differs = changed_fields.any(axis=1).to_numpy()
+        self.attribute_changed = pd.concat({'before': before.loc[attribute_differs, fields],
+                                            'after': after.loc[attribute_differs, fields]}, axis=1)
+        # Names of changed fields joined with commas, e.g. 'area,floor'
+        field_names = np.array([f"{f}," for f in fields], dtype=object)
+        self.attribute_changed['changed_fields'] = pd.Series(
+            changed_fields.loc[attribute_differs].to_numpy().astype(object).dot(field_names),
+            index=self.attribute_changed.index, dtype=object).str.rstrip(',')
+        logger.info(f"Compared snapshots {self.run_date_before} and {self.run_date_after}: "
+                    + ', '.join(f"{k}={v}" for k, v in self.get_counts().items()))
+
+    def get_counts(self) -> pd.Series:
+        """Get number of offers in each change set
+
+        Returns
+        -------
+        pd.Series
+            number of new, removed, re-priced and changed offers
+        """
+        return pd.Series({'new': len(self.new),
+                          'removed': len(self.removed),
+                          'price_changed': len(self.price_changed),
+                          'attribute_changed': len(self.attribute_changed)})
+
+    def get_price_history(self) -> pd.DataFrame:
+        """Get price changes as history table rows
+
+        Returns
+        -------
+        pd.DataFrame
+            key, district, run dates, price before and after, change and change [%]
+        """
+        price_before = self.price_changed[('before', 'price')].astype('float64')
+        price_after = self.price_changed[('after', 'price')].astype('float64')
+        price_history = pd.DataFrame({
+            'key': self.price_changed.index,
+            'district': self.price_changed[('after', 'district')].astype(object).to_numpy(),
+            'run_date_before': self.run_date_before,
+            'run_date_after': self.run_date_after,
+            'price_before': price_before.to_numpy(),
+            'price_after': price_after.to_numpy(),
+            'price_change': (price_after - price_before).to_numpy(),
+            'price_change_pct': ((price_after / price_before - 1) * 100).to_numpy()},
+            columns=PRICE_HISTORY_COLUMNS)
+        return price_history
+
+
+def diff_snapshots(datafile_before: str,
+                   datafile_after: str = None,
+                   run_date_before: str = None,
+                   run_date_after: str = None,
+                   districts: list = None) -> SnapshotDiff:
+    """Compare two snapshots read from files or from parquet dataset
+
+    If `datafile_after` is not given, the two latest runs (or the given
+    run dates) stored in the `datafile_before` dataset are compared.
+
+    Parameters
+    ----------
+    datafile_before : str
+        earlier snapshot (.json file) or parquet dataset
+    datafile_after : str, optional
+        later snapshot (.json file) or parquet dataset, by default None
+    run_date_before : str, optional
+        run date of earlier snapshot (parquet dataset only)
+    run_date_after : str, optional
+        run date of later snapshot (parquet dataset only)
+    districts : list, optional
+        districts to compare, by default all
+
+    Returns
+    -------
+    SnapshotDiff
+        snapshot differences
+
+    Raises
+    ------
+    ValueError
+        if dataset holds less than two runs to compare
+    """
+    if datafile_after is None:
+        run_dates = get_run_dates(datafile_before)
+        run_date_after = run_date_after or (run_dates[-1] if run_dates else None)
+        if run_date_before is None:
+            earlier_dates = [d for d in run_dates if d < str(run_date_after)]
+            if not earlier_dates:
+                raise ValueError(f'No run before {run_date_after} in: '
+                                 f'{Path(datafile_before).resolve()}')
+            run_date_before = earlier_dates[-1]
+        datafile_after = datafile_before
+    data_before = read_snapshot(datafile_before, run_date_before, districts)
+    data_after = read_snapshot(datafile_after, run_date_after, districts)
+    return SnapshotDiff(data_before, data_after,
+                        _get_snapshot_label(data_before, datafile_before),
+                        _get_snapshot_label(data_after, datafile_after))
+
+
+def _get_snapshot_label(offer_data: pd.DataFrame, offer_datafile: str) -> str:
+    """Label snapshot with its run date, file name if not known"""
+    if 'run_date' in offer_data.columns and len(offer_data):
+        return str(offer_data['run_date'].iloc[0])
+    return Path(offer_datafile).stem
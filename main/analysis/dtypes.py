@@ -0,0 +1,78 @@
+"""Apply declared offer schema to loaded data
+"""
+
+import logging
+
+import pandas as pd
+
+from main.schema import OFFER_FIELDS, get_pandas_dtype
+
+# Logger
+logger = logging.getLogger(__name__)
+
+
+def apply_schema(offer_data: pd.DataFrame) -> pd.DataFrame:
+    """Convert offer data columns to declared dtypes
+
+    Columns missing from the schema are left unchanged.
+
+    Parameters
+    ----------
+    offer_data : pd.DataFrame
+        offer data as loaded from file
+
+    Returns
+    -------
+    pd.DataFrame
+        offer data with memory-optimized dtypes
+    """
+    offer_data = offer_data.copy()
+    for column in offer_data.columns.intersection(list(OFFER_FIELDS)):
+        field_type = OFFER_FIELDS[column]
+        dtype = get_pandas_dtype(column)
+        if str(offer_data[column].dtype) == dtype:
+            continue
+        if field_type == 'date':
+            # Vectorized parsing with known format (no per-value inference)
+            offer_data[column] = pd.to_datetime(offer_data[column],
+                                                format='%Y-%m-%d',
+                                                errors='coerce')
+        elif field_type == 'float':
+            offer_data[column] = pd.to_numeric(
+                offer_data[column], errors='coerce').astype(dtype)
+        elif field_type == 'category':
+            # Keep missing values as NaN, store remaining values as strings
+            column_data = offer_data[column]
+            offer_data[column] = column_data.where(
+                column_data.isna(), column_data.astype(str)).astype(dtype)
+        else:
+            offer_data[column] = offer_data[column].astype(dtype)
+    return offer_data
+
+
+def get_memory_report(data_before: pd.DataFrame,
+                      data_after: pd.DataFrame) -> pd.DataFrame:
+    """Compare memory use of offer data before and after applying schema
+
+    Parameters
+    ----------
+    data_before : pd.DataFrame
+        offer data as loaded from file
+    data_after : pd.DataFrame
+        offer data with declared dtypes
+
+    Returns
+    -------
+    pd.DataFrame
+        dtype and memory use (bytes) per column, with total
+    """
+    memory_report = pd.DataFrame({
+        'dtype_before': data_before.dtypes.astype(str),
+        'dtype_after': data_after.dtypes.astype(str),
+        'bytes_before': data_before.memory_usage(index=False, deep=True),
+        'bytes_after': data_after.memory_usage(index=False, deep=True)})
+    memory_report.loc['Total', ['bytes_before', 'bytes_after']] = \
+        memory_report[['bytes_before', 'bytes_after']].sum()
+    memory_report['ratio'] = memory_report['bytes_after'] / \
+        memory_report['bytes_before']
+    return memory_report
@@ -0,0 +1,169 @@
+"""Decode raw offer data in batch
+
+Raw data is collected with `OLXScraper(..., raw=True)`. Whole columns are
+decoded at once using the lookup tables from `main.webscraping.codes`,
+so historical raw data can be re-normalized after a mapping fix
+without scraping again.
+"""
+
+import json
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+from main.webscraping.codes import (DEFAULT_CODES, DIGIT_FIELDS, MONTH_CODES,
+                                    NUMERIC_FIELDS, SUBSTRING_FIELDS, VALUE_CODES)
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Offer fields encoded with lookup tables
+CODE_FIELDS = ['furniture', 'owner', 'floor', 'nrooms', 'market', 'building_type']
+
+
+def _as_text(raw_values: pd.Series) -> pd.Series:
+    """Convert values to strings, keep missing values"""
+    return raw_values.where(raw_values.isna(), raw_values.astype(str))
+
+
+def normalize_numbers(raw_values: pd.Series) -> pd.Series:
+    """Decode numbers written as text e.g. '350 000 zł', '45,5 m²'
+
+    Parameters
+    ----------
+    raw_values : pd.Series
+        raw text values
+
+    Returns
+    -------
+    pd.Series
+        decoded numbers (NaN if missing or invalid)
+    """
+    numbers = _as_text(raw_values).str.replace(',', '.', regex=False)\
+        .str.replace(r'[^\d\.]', '', regex=True)
+    return pd.to_numeric(numbers, errors='coerce')
+
+
+def normalize_codes(raw_values: pd.Series,
+                    domains: pd.Series,
+                    field: str) -> pd.Series:
+    """Encode offer parameter values using lookup tables for each domain
+
+    Parameters
+    ----------
+    raw_values : pd.Series
+        raw values of offer parameter
+    domains : pd.Series
+        domain where each offer is published
+    field : str
+        offer field e.g. floor
+
+    Returns
+    -------
+    pd.Series
+        encoded values
+    """
+    raw_values = _as_text(raw_values)
+    encoded = raw_values.copy()
+    for domain in domains.dropna().unique():
+        in_domain = domains == domain
+        values = raw_values.loc[in_domain]
+        if field in DIGIT_FIELDS.get(domain, []):
+            encoded.loc[in_domain] = values.str.replace(
+                r'[^\d]', '', regex=True)
+            continue
+        codes = VALUE_CODES.get(domain, {}).get(field, {})
+        mapped = values.map(codes)
+        if field in SUBSTRING_FIELDS.get(domain, []):
+            for key, code in codes.items():
+                mapped.loc[mapped.isna() & values.str.contains(key, regex=False, na=False)] = code
+        not_coded = mapped.isna() & values.notna()
+        default = DEFAULT_CODES.get(field)
+        mapped.loc[not_coded] = values.loc[not_coded] if default is None else default
+        encoded.loc[in_domain] = mapped
+    return encoded
+
+
+def normalize_dates(raw_values: pd.Series, captured: pd.Series) -> pd.Series:
+    """Decode advertisement dates e.g. 'dzisiaj 12:30', '12  cze'
+
+    Parameters
+    ----------
+    raw_values : pd.Series
+        dates as shown on advertisement page
+    captured : pd.Series
+        days when pages were fetched
+
+    Returns
+    -------
+    pd.Series
+        days when advertisements were added
+    """
+    captured = pd.to_datetime(captured, errors='coerce')
+    raw_values = _as_text(raw_values).str.strip()
+    day_month = raw_values.str.extract(r'^(?P<day>\d{1,2})\s+(?P<month>\w+)')
+    month = day_month['month'].map(MONTH_CODES)
+    # Dates without year refer to the last 12 months
+    year = captured.dt.year - (month > captured.dt.month).astype(int)
+    ad_dates = pd.to_datetime(pd.DataFrame({'year': year,
+                                            'month': month,
+                                            'day': pd.to_numeric(day_month['day'])}),
+                              errors='coerce')
+    today = raw_values.str.startswith('dzisiaj').fillna(False)
+    yesterday = raw_values.str.startswith('wczoraj').fillna(False)
+    ad_dates.loc[today] = captured.loc[today]
+    ad_dates.loc[yesterday] = captured.loc[yesterday] - pd.Timedelta(days=1)
+    return ad_dates
+
+
+def normalize_offers(raw_data: pd.DataFrame) -> pd.DataFrame:
+    """Decode raw offer data
+
+    Parameters
+    ----------
+    raw_data : pd.DataFrame
+        offer data collected in raw mode
+
+    Returns
+    -------
+    pd.DataFrame
+        offer data with the same values as collected in standard mode
+    """
+    offer_data = raw_data.drop(columns=['captured'], errors='ignore')
+    for column in raw_data.columns.intersection(NUMERIC_FIELDS):
+        offer_data[column] = normalize_numbers(raw_data[column])
+    for column in raw_data.columns.intersection(CODE_FIELDS):
+        offer_data[column] = normalize_codes(raw_data[column],
+                                             raw_data['domain'],
+                                             column)
+    if 'district' in raw_data.columns:
+        offer_data['district'] = _as_text(raw_data['district'])\
+            .str.split(',').str[1].str.strip()
+    if 'date' in raw_data.columns:
+        captured = raw_data['captured'] if 'captured' in raw_data.columns \
+            else pd.Series(pd.Timestamp.today().normalize(), index=raw_data.index)
+        offer_data['date'] = normalize_dates(raw_data['date'], captured)
+    logger.info(f"Normalized {len(offer_data)} raw offers")
+    return offer_data
+
+
+def normalize_data_file(raw_datafile: str, data_file: str):
+    """Decode raw offer data file and save it in standard format
+
+    Parameters
+    ----------
+    raw_datafile : str
+        .json file with offer data collected in raw mode
+    data_file : str
+        .json file where decoded offer data will be saved
+    """
+    raw_data = pd.read_json(raw_datafile, dtype=False, convert_dates=False)
+    offer_data = normalize_offers(raw_data)
+    offer_data['date'] = offer_data['date'].dt.strftime('%Y-%m-%d')
+    offer_data = offer_data.astype(object).where(offer_data.notna(), None)
+    with open(data_file, 'w', encoding='utf-8') as f:
+        json.dump(offer_data.to_dict('records'), f, indent=4,
+                  default=str, sort_keys=True)
+    logger.info(
+        f"Normalized offer data has been saved into file: {Path(data_file).resolve()}")
@@ -0,0 +1,212 @@
+"""Draw offer data charts on matplotlib figures
+
+Functions use the object-oriented Figure/Axes API only (no pyplot state),
+so charts can be drawn both in interactive sessions and in headless
+worker processes.
+"""
+
+import matplotlib.style as mstyle
+import matplotlib.ticker as ticker
+import numpy as np
+from matplotlib.figure import Figure
+
+# Style and colors of price charts
+CHART_STYLE = 'bmh'
+PRICE_CHARTS = {'price': {'label': 'Price',
+                          'x_tick_interval': 50000,
+                          'color': 'darkcyan'},
+                'price_meter': {'label': 'Price/m\u00B2',
+                                'x_tick_interval': 1000,
+                                'color': 'sienna'}}
+
+
+def plot_price_histogram(ax, histogram_data: dict,
+                         title: str,
+                         x_tick_interval: int,
+                         **kwargs):
+    """ Plot histogram of price
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        axes to draw on
+    histogram_data : dict
+        bin counts and edges, median price and number of observations
+    title : str
+        plot title
+    x_tick_interval : int
+        interval for x axis
+    """
+    hist_y = np.asarray(histogram_data['counts'])
+    hist_x = np.asarray(histogram_data['edges'])
+    if len(hist_y) == 0:
+        ax.set_title(title)
+        return
+
+    ax.hist(hist_x[:-1], bins=hist_x, weights=hist_y, alpha=0.9, **kwargs)
+
+    ax.grid(linewidth=0.5)
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+
+    ax.set_title(title)
+    ax.set_xlabel("price")
+    ax.set_ylabel("number of offers")
+
+    # Format X axis
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.xaxis.set_major_locator(
+        ticker.MultipleLocator(base=x_tick_interval))
+    ax.xaxis.set_major_formatter(ticker.StrMethodFormatter('{x:,.0f}'))
+
+    # Add median price
+    median_price = histogram_data['median']
+    ax.axvline(median_price, color='midnightblue', linewidth=2)
+    ax.text(median_price, np.quantile(hist_y, 0.25),
+            s=f"Median price={median_price:,.0f} z\u0142",
+            rotation=90,
+            horizontalalignment="right",
+            verticalalignment="bottom")
+
+    # Add number of observations
+    ax.text(hist_x.min(), hist_y.max() * 0.9,
+            s=f"Total number of offers={histogram_data['n_obs']}",
+            horizontalalignment="left")
+
+
+def plot_price_by_district(ax, district_medians: dict,
+                           column_name: str,
+                           x_tick_interval: int,
+                           **kwargs):
+    """Plot price median by district
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        axes to draw on
+    district_medians : dict
+        district -> median price
+    column_name : str
+        price label
+    x_tick_interval : int
+        interval for x axis
+    """
+    chart_data = sorted(district_medians.items(), key=lambda d: d[1])
+    ax.barh([d for d, _ in chart_data], [m for _, m in chart_data], **kwargs)
+
+    ax.grid(axis='y')
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+
+    ax.set_title(f"{column_name} median")
+
+    # Format X axis
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.xaxis.set_major_locator(
+        ticker.MultipleLocator(base=x_tick_interval))
+    ax.xaxis.set_major_formatter(ticker.StrMethodFormatter('{x:,.0f}'))
+
+
+def plot_price_trend(ax, district_trends: dict,
+                     column_name: str,
+                     **kwargs):
+    """Plot price trend by district
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        axes to draw on
+    district_trends : dict
+        district -> dates (YYYY-MM-DD) and trend values
+    column_name : str
+        price label
+    """
+    for district, trend in sorted(district_trends.items()):
+        ax.plot(np.array(trend['dates'], dtype='datetime64[D]'), trend['values'],
+                label=district, **kwargs)
+
+    ax.grid(linewidth=0.5)
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+
+    ax.set_title(f"{column_name} median trend")
+    ax.legend(loc='upper left', fontsize='small', ncol=2)
+
+    # Format axes
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.yaxis.set_major_formatter(ticker.StrMethodFormatter('{x:,.0f}'))
+
+
+def draw_price_histograms(fig: Figure, price_histograms: dict, title: str = None):
+    """Draw histograms of price and price per meter
+
+    Parameters
+    ----------
+    fig : Figure
+        figure to draw on
+    price_histograms : dict
+        column (price/price_meter) -> histogram data
+    title : str, optional
+        figure title e.g. segment name, by default None
+    """
+    with mstyle.context(CHART_STYLE):
+        axes = fig.subplots(nrows=2, ncols=1)
+        for ax, (column, chart) in zip(axes, PRICE_CHARTS.items()):
+            plot_price_histogram(ax, price_histograms[column],
+                                 title=f"{chart['label']} distribution",
+                                 x_tick_interval=chart['x_tick_interval'],
+                                 color=chart['color'])
+    if title:
+        fig.suptitle(title)
+    fig.tight_layout()
+
+
+def draw_price_by_district(fig: Figure, district_medians: dict, title: str = None):
+    """Draw median price and price per meter by district
+
+    Parameters
+    ----------
+    fig : Figure
+        figure to draw on
+    district_medians : dict
+        column (price/price_meter) -> district -> median price
+    title : str, optional
+        figure title e.g. segment name, by default None
+    """
+    with mstyle.context(CHART_STYLE):
+        axes = fig.subplots(nrows=2, ncols=1)
+        for ax, (column, chart) in zip(axes, PRICE_CHARTS.items()):
+            plot_price_by_district(ax, district_medians[column],
+                                   chart['label'],
+                                   chart['x_tick_interval'],
+                                   color=chart['color'])
+    if title:
+        fig.suptitle(title)
+    fig.tight_layout()
+
+
+def draw_price_trend(fig: Figure, price_trends: dict, title: str = None):
+    """Draw trend of median price and price per meter by district
+
+    Parameters
+    ----------
+    fig : Figure
+        figure to draw on
+    price_trends : dict
+        column (price/price_meter) -> district -> dates and trend values
+    title : str, optional
+        figure title e.g. window length, by default None
+    """
+    with mstyle.context(CHART_STYLE):
+        axes = fig.subplots(nrows=2, ncols=1)
+        for ax, (column, chart) in zip(axes, PRICE_CHARTS.items()):
+            plot_price_trend(ax, price_trends[column], chart['label'])
+    if title:
+        fig.suptitle(title)
+    fig.tight_layout()
+
+
+# Chart kind -> drawing function
+CHART_KINDS = {'price_histograms': draw_price_histograms,
+               'price_by_district': draw_price_by_district,
+               'price_trend': draw_price_trend}
@@ -0,0 +1,140 @@
+"""Render offer data charts to files without display
+
+Charts are drawn with the Agg backend in a pool of worker processes.
+A manifest in the output directory stores the fingerprint of each chart's
+data, so charts with unchanged data are not rendered again.
+"""
+
+import hashlib
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Logger
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def _to_json(value):
+    """Convert numpy values to JSON-serializable types"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def get_chart_fingerprint(chart: dict) -> str:
+    """Get hash of chart data and formatting
+
+    Parameters
+    ----------
+    chart : dict
+        chart definition (kind, data, title)
+
+    Returns
+    -------
+    str
+        SHA-256 of chart definition
+    """
+    chart_json = json.dumps(chart, sort_keys=True, default=_to_json)
+    return hashlib.sha256(chart_json.encode('utf-8')).hexdigest()
+
+
+def render_chart(chart: dict, output_files: list, figsize: tuple = (10, 7)):
+    """Draw chart and save it to files (run in worker process)
+
+    Parameters
+    ----------
+    chart : dict
+        chart definition: kind (see `main.analysis.plots.CHART_KINDS`),
+        data and optional title
+    output_files : list
+        files to save, format taken from suffix (e.g. .png, .svg)
+    figsize : tuple, optional
+        figure size in inches, by default (10, 7)
+
+    Returns
+    -------
+    list
+        saved files
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from main.analysis.plots import CHART_KINDS
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    CHART_KINDS[chart['kind']](fig, chart['data'], title=chart.get('title'))
+    for output_file in output_files:
+        fig.savefig(output_file)
+    return output_files
+
+
+class ReportRenderer(object):
+    """ Render charts to files in parallel, skipping unchanged charts """
+
+    def __init__(self, output_dir: str,
+                 formats: tuple = ('png',),
+                 processes: int = None):
+        """
+        Parameters
+        ----------
+        output_dir : str
+            directory where charts are saved
+        formats : tuple, optional
+            file formats, by default ('png',)
+        processes : int, optional
+            number of worker processes, by default number of CPUs
+        """
+        self.output_dir = Path(output_dir)
+        self.formats = formats
+        self.processes = processes
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_file = self.output_dir / MANIFEST_FILE
+
+    def _read_manifest(self) -> dict:
+        if self.manifest_file.exists():
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def render(self, charts: dict) -> list:
+        """Render charts with changed data
+
+        Parameters
+        ----------
+        charts : dict
+            chart name (used as file name) -> chart definition
+
+        Returns
+        -------
+        list
+            rendered files
+        """
+        manifest = self._read_manifest()
+        tasks = []
+        for name, chart in charts.items():
+            fingerprint = get_chart_fingerprint(chart)
+            output_files = [str(self.output_dir / f"{name}.{f}") for f in self.formats]
+            if manifest.get(name) == fingerprint and \
+                    all(Path(f).exists() for f in output_files):
+                logger.debug(f"Chart not changed: {name}")
+                continue
+            tasks.append((name, fingerprint, chart, output_files))
+        logger.info(
+            f"Rendering {len(tasks)} of {len(charts)} charts into: {self.output_dir.resolve()}")
+
+        rendered_files = []
+        if tasks:
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                results = executor.map(render_chart,
+                                       [t[2] for t in tasks],
+                                       [t[3] for t in tasks])
+                for (name, fingerprint, _, _), files in zip(tasks, results):
+                    manifest[name] = fingerprint
+                    rendered_files.extend(files)
+            with open(self.manifest_file, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=4, sort_keys=True)
+        return rendered_files
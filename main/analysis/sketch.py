@@ -0,0 +1,509 @@
+"""Mergeable summaries of price data
+
+Summaries are updated value by value (or in batches), merged across chunks,
+files or worker processes and serialized to plain dictionaries. Module has
+no third-party dependencies, so it can be used by the scraper as well.
+"""
+
+import json
+import math
+import random
+from bisect import bisect_right
+
+# Statistics in the order used by pd.DataFrame.describe
+DESCRIBE_STATS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+
+class RunningMoments(object):
+    """ Count, mean, variance and range of a stream of values """
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0,
+                 min_value: float = math.inf, max_value: float = -math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2  # sum of squared differences from the mean
+        self.min = min_value
+        self.max = max_value
+
+    def update(self, value: float):
+        """Add value
+
+        Parameters
+        ----------
+        value : float
+            new observation
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'RunningMoments'):
+        """Add moments computed on another part of data
+
+        Parameters
+        ----------
+        other : RunningMoments
+            moments to merge
+        """
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation (NaN for less than 2 values)"""
+        if self.count < 2:
+            return math.nan
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'RunningMoments':
+        return cls(data['count'], data['mean'], data['m2'],
+                   data['min'], data['max'])
+
+
+class KLLSketch(object):
+    """ Quantile sketch (KLL) with bounded memory
+
+    Holds at most about 3 * k values. Quantiles are exact as long as
+    no more than k values were added, otherwise rank error is roughly
+    1.7 / k (e.g. 0.2% for k=800).
+    """
+
+    CAPACITY_DECAY = 2 / 3
+
+    def __init__(self, k: int = 800, seed: int = 0):
+        self.k = k
+        self.levels = [[]]  # values at level h have weight 2**h
+        self.count = 0
+        self._random = random.Random(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * self.CAPACITY_DECAY ** depth)))
+
+    def _size(self) -> int:
+        return sum(len(level) for level in self.levels)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _compress(self):
+        """Compact levels until sketch fits its capacity"""
+        while self._size() > self._max_size():
+            for h, level in enumerate(self.levels):
+                if len(level) >= self._capacity(h):
+                    break
+            if h + 1 == len(self.levels):
+                self.levels.append([])
+            level.sort()
+            # Odd value stays at its level, every other value is promoted
+            kept = [level.pop()] if len(level) % 2 else []
+            offset = self._random.randint(0, 1)
+            self.levels[h + 1].extend(level[offset::2])
+            self.levels[h] = kept
+
+    def update(self, value: float):
+        """Add value
+
+        Parameters
+        ----------
+        value : float
+            new observation
+        """
+        self.levels[0].append(value)
+        self.count += 1
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def update_many(self, values: list):
+        """Add batch of values
+
+        Parameters
+        ----------
+        values : list
+            new observations
+        """
+        values = list(values)
+        self.levels[0].extend(values)
+        self.count += len(values)
+        self._compress()
+
+    def merge(self, other: 'KLLSketch'):
+        """Add values summarized by another sketch
+
+        Parameters
+        ----------
+        other : KLLSketch
+            sketch to merge
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, level in enumerate(other.levels):
+            self.levels[h].extend(level)
+        self.count += other.count
+        self._compress()
+
+    def quantile(self, q: float) -> float:
+        """Get quantile with linear interpolation (as pd.Series.quantile)
+
+        Parameters
+        ----------
+        q : float
+            quantile to compute, between 0 and 1
+
+        Returns
+        -------
+        float
+            estimated quantile, NaN if sketch is empty
+        """
+        items = sorted((value, 2 ** h)
+                       for h, level in enumerate(self.levels) for value in level)
+        if not items:
+            return math.nan
+        values = [v for v, _ in items]
+        cumulative_weight = []
+        total_weight = 0
+        for _, weight in items:
+            total_weight += weight
+            cumulative_weight.append(total_weight)
+
+        def value_at(position):
+            return values[min(bisect_right(cumulative_weight, position), len(values) - 1)]
+
+        position = q * (total_weight - 1)
+        lower = math.floor(position)
+        lower_value = value_at(lower)
+        upper_value = value_at(lower + 1) if position > lower else lower_value
+        return lower_value + (upper_value - lower_value) * (position - lower)
+
+    def to_dict(self) -> dict:
+        return {'k': self.k, 'levels': self.levels, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'KLLSketch':
+        sketch = cls(k=data['k'])
+        sketch.levels = [list(level) for level in data['levels']]
+        sketch.count = data['count']
+        return sketch
+
+
+class FixedWidthHistogram(object):
+    """ Histogram with fixed bin width (bins aligned at zero) """
+
+    def __init__(self, bin_width: float):
+        self.bin_width = bin_width
+        self.counts = {}  # bin number -> count
+
+    def update(self, value: float):
+        """Add value
+
+        Parameters
+        ----------
+        value : float
+            new observation
+        """
+        bin_number = int(math.floor(value / self.bin_width))
+        self.counts[bin_number] = self.counts.get(bin_number, 0) + 1
+
+    def update_many(self, values: list):
+        """Add batch of values
+
+        Parameters
+        ----------
+        values : list
+            new observations
+        """
+        for value in values:
+            self.update(value)
+
+    def merge(self, other: 'FixedWidthHistogram'):
+        """Add counts from another histogram with the same bin width
+
+        Parameters
+        ----------
+        other : FixedWidthHistogram
+            histogram to merge
+
+        Raises
+        ------
+        ValueError
+            if bin widths differ
+        """
+        if other.bin_width != self.bin_width:
+            raise ValueError('Histograms have different bin width')
+        for bin_number, count in other.counts.items():
+            self.counts[bin_number] = self.counts.get(bin_number, 0) + count
+
+    def get_bins(self) -> tuple:
+        """Get bin edges and counts
+
+        Returns
+        -------
+        tuple
+            (list of bin edges, list of counts), len(edges) = len(counts) + 1
+        """
+        if not self.counts:
+            return [], []
+        first, last = min(self.counts), max(self.counts)
+        counts = [self.counts.get(b, 0) for b in range(first, last + 1)]
+        edges = [b * self.bin_width for b in range(first, last + 2)]
+        return edges, counts
+
+    def to_dict(self) -> dict:
+        return {'bin_width': self.bin_width,
+                'counts': {str(b): c for b, c in self.counts.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'FixedWidthHistogram':
+        histogram = cls(data['bin_width'])
+        histogram.counts = {int(b): c for b, c in data['counts'].items()}
+        return histogram
+
+
+class PriceSketch(object):
+    """ Mergeable descriptive statistics of one price variable """
+
+    def __init__(self, bin_width: float, k: int = 800):
+        self.moments = RunningMoments()
+        self.quantiles = KLLSketch(k=k)
+        self.histogram = FixedWidthHistogram(bin_width)
+
+    def update(self, value: float):
+        """Add value, missing values are skipped
+
+        Parameters
+        ----------
+        value : float
+            new observation
+        """
+        if value is None or value != value:
+            return
+        self.moments.update(value)
+        self.quantiles.update(value)
+        self.histogram.update(value)
+
+    def update_many(self, values: list):
+        """Add batch of values, missing values are skipped
+
+        Parameters
+        ----------
+        values : list
+            new observations
+        """
+        values = [v for v in values if v is not None and v == v]
+        for value in values:
+            self.moments.update(value)
+        self.quantiles.update_many(values)
+        self.histogram.update_many(values)
+
+    def merge(self, other: 'PriceSketch'):
+        """Add statistics computed on another part of data
+
+        Parameters
+        ----------
+        other : PriceSketch
+            sketch to merge
+        """
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+        self.histogram.merge(other.histogram)
+
+    def describe(self) -> dict:
+        """Get descriptive statistics
+
+        Returns
+        -------
+        dict
+            statistics named as in pd.DataFrame.describe
+        """
+        empty = self.moments.count == 0
+        return {'count': float(self.moments.count),
+                'mean': math.nan if empty else self.moments.mean,
+                'std': self.moments.std,
+                'min': math.nan if empty else self.moments.min,
+                '25%': self.quantiles.quantile(0.25),
+                '50%': self.quantiles.quantile(0.5),
+                '75%': self.quantiles.quantile(0.75),
+                'max': math.nan if empty else self.moments.max}
+
+    def to_dict(self) -> dict:
+        return {'moments': self.moments.to_dict(),
+                'quantiles': self.quantiles.to_dict(),
+                'histogram': self.histogram.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'PriceSketch':
+        sketch = cls(bin_width=data['histogram']['bin_width'])
+        sketch.moments = RunningMoments.from_dict(data['moments'])
+        sketch.quantiles = KLLSketch.from_dict(data['quantiles'])
+        sketch.histogram = FixedWidthHistogram.from_dict(data['histogram'])
+        return sketch
+
+
+class PriceStats(object):
+    """ Price statistics in total and per district, updated offer by offer
+
+    Can be queried at any time (e.g. during scraping) and merged with
+    statistics collected by other processes.
+    """
+
+    # Price variables with histogram bin width
+    PRICE_COLUMNS = {'price': 10000, 'price_meter': 100}
+
+    def __init__(self, k: int = 800):
+        self.k = k
+        self.total = self._new_sketches()  # column -> PriceSketch
+        self.districts = {}  # district -> column -> PriceSketch
+
+    def _new_sketches(self) -> dict:
+        return {c: PriceSketch(w, k=self.k) for c, w in self.PRICE_COLUMNS.items()}
+
+    def update(self, offer_params: dict):
+        """Add offer, non-numeric prices (e.g. raw text) are skipped
+
+        Parameters
+        ----------
+        offer_params : dict
+            offer record with price, price_meter and district
+        """
+        district = offer_params.get('district')
+        if district is not None and district not in self.districts:
+            self.districts[district] = self._new_sketches()
+        for column in self.PRICE_COLUMNS:
+            value = offer_params.get(column)
+            if not isinstance(value, (int, float)):
+                continue
+            self.total[column].update(value)
+            if district is not None:
+                self.districts[district][column].update(value)
+
+    def merge_sketch(self, column: str, sketch: PriceSketch, district: str = None):
+        """Add statistics of one price variable computed on part of data
+
+        Parameters
+        ----------
+        column : str
+            price variable (price/price_meter)
+        sketch : PriceSketch
+            statistics to merge
+        district : str, optional
+            district of the data, by default None (total)
+        """
+        if district is None:
+            self.total[column].merge(sketch)
+            return
+        if district not in self.districts:
+            self.districts[district] = self._new_sketches()
+        self.districts[district][column].merge(sketch)
+
+    def merge(self, other: 'PriceStats'):
+        """Add statistics collected by another process
+
+        Parameters
+        ----------
+        other : PriceStats
+            statistics to merge
+        """
+        for column, sketch in other.total.items():
+            self.merge_sketch(column, sketch)
+        for district, sketches in other.districts.items():
+            for column, sketch in sketches.items():
+                self.merge_sketch(column, sketch, district)
+
+    def describe(self) -> dict:
+        """Get descriptive statistics in total
+
+        Returns
+        -------
+        dict
+            column -> statistics
+        """
+        return {c: s.describe() for c, s in self.total.items()}
+
+    def describe_districts(self) -> dict:
+        """Get descriptive statistics per district
+
+        Returns
+        -------
+        dict
+            column -> district -> statistics
+        """
+        return {c: {d: s[c].describe() for d, s in self.districts.items()}
+                for c in self.PRICE_COLUMNS}
+
+    def median(self, column: str = 'price_meter', district: str = None) -> float:
+        """Get current median
+
+        Parameters
+        ----------
+        column : str, optional
+            price variable, by default 'price_meter'
+        district : str, optional
+            district, by default None (total)
+
+        Returns
+        -------
+        float
+            median (NaN if no offers collected)
+        """
+        sketches = self.total if district is None else self.districts.get(district)
+        if sketches is None:
+            return math.nan
+        return sketches[column].quantiles.quantile(0.5)
+
+    def to_dict(self) -> dict:
+        return {'k': self.k,
+                'total': {c: s.to_dict() for c, s in self.total.items()},
+                'districts': {d: {c: s.to_dict() for c, s in sketches.items()}
+                              for d, sketches in self.districts.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'PriceStats':
+        price_stats = cls(k=data['k'])
+        price_stats.total = {c: PriceSketch.from_dict(s)
+                             for c, s in data['total'].items()}
+        price_stats.districts = {d: {c: PriceSketch.from_dict(s) for c, s in sketches.items()}
+                                 for d, sketches in data['districts'].items()}
+        return price_stats
+
+    def save(self, stats_file: str):
+        """Save statistics into .json file
+
+        Parameters
+        ----------
+        stats_file : str
+            path to json file
+        """
+        with open(stats_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, stats_file: str) -> 'PriceStats':
+        """Read statistics from .json file
+
+        Parameters
+        ----------
+        stats_file : str
+            path to json file
+
+        Returns
+        -------
+        PriceStats
+            price statistics
+        """
+        with open(stats_file, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
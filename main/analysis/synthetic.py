@@ -0,0 +1,167 @@
+"""Synthetic offer data for benchmarks
+
+Offers are generated with the fields and encoded values of scraped data:
+ad fields of OLX listings, offer fields of OLX and Otodom offer pages
+(Otodom offers have no furniture and owner, different floor and rooms
+codes), skewed price distributions per district and missing values.
+Data is saved with the scraper export, so files have the exact export format.
+"""
+
+import logging
+from datetime import date, timedelta
+
+import numpy as np
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# District -> (share of offers, median price per square meter)
+DISTRICTS = {'Śródmieście': (0.10, 16500),
+             'Wola': (0.12, 12500),
+             'Mokotów': (0.13, 12300),
+             'Żoliborz': (0.05, 13200),
+             'Ochota': (0.06, 11800),
+             'Praga-Północ': (0.04, 10700),
+             'Praga-Południe': (0.09, 10300),
+             'Bemowo': (0.07, 9900),
+             'Bielany': (0.06, 10400),
+             'Ursynów': (0.07, 10600),
+             'Wilanów': (0.05, 11200),
+             'Targówek': (0.05, 8900),
+             'Włochy': (0.04, 9600),
+             'Białołęka': (0.07, 7600)}
+
+# Encoded values and their shares, per domain
+OLX_CODES = {'floor': (['-1', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '>10'],
+                       [.01, .12, .15, .15, .13, .11, .09, .06, .05, .04, .03, .02, .04]),
+             'nrooms': (['1', '2', '3', '>3'], [.15, .42, .31, .12]),
+             'furniture': (['Yes', 'No'], [.6, .4]),
+             'owner': (['Private', 'Business'], [.55, .45])}
+OTODOM_CODES = {'floor': (['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '>10'],
+                          [.13, .15, .15, .13, .11, .09, .06, .05, .04, .03, .02, .04]),
+                'nrooms': (['1', '2', '3', '4', '5'], [.12, .40, .32, .12, .04])}
+COMMON_CODES = {'market': (['Primary', 'Secondary'], [.35, .65]),
+                'building_type': (['Block', 'Tenement', 'Apartment', 'Other'], [.55, .15, .2, .1])}
+
+OFFER_PARAMS = ['price_meter', 'area', 'furniture', 'owner', 'floor',
+                'nrooms', 'market', 'building_type']
+
+
+def generate_offers(n_offers: int, seed: int = 0,
+                    run_date: date = None,
+                    otodom_share: float = 0.1,
+                    missing_share: float = 0.03,
+                    listing_only_share: float = 0.01,
+                    chunk_size: int = 100000):
+    """Generate offers one by one (in chunks drawn at once)
+
+    Parameters
+    ----------
+    n_offers : int
+        number of offers
+    seed : int, optional
+        random seed, by default 0
+    run_date : date, optional
+        date of scraping run, by default today
+    otodom_share : float, optional
+        share of offers hosted on Otodom, by default 0.1
+    missing_share : float, optional
+        share of offers with a parameter not found, by default 0.03
+    listing_only_share : float, optional
+        share of offers without offer page data, by default 0.01
+    chunk_size : int, optional
+        number of offers drawn at once, by default 100000
+
+    Yields
+    ------
+    dict
+        offer parameters (as collected by scraper)
+    """
+    run_date = run_date or date.today()
+    rng = np.random.default_rng(seed)
+    districts = list(DISTRICTS)
+    district_shares = np.array([DISTRICTS[d][0] for d in districts])
+    district_shares /= district_shares.sum()
+    district_prices = np.array([DISTRICTS[d][1] for d in districts])
+
+    def draw(codes: dict, field: str, size: int) -> np.ndarray:
+        values, shares = codes[field]
+        return rng.choice(values, size=size, p=np.array(shares) / sum(shares))
+
+    for start in range(0, n_offers, chunk_size):
+        size = min(chunk_size, n_offers - start)
+        district = rng.choice(len(districts), size=size, p=district_shares)
+        otodom = rng.random(size) < otodom_share
+        area = np.round(np.clip(rng.lognormal(np.log(52), 0.35, size), 14, 250), 1)
+        price_meter = np.round(district_prices[district] * rng.lognormal(0, 0.18, size))
+        price = np.round(price_meter * area, -3)
+        age = rng.geometric(0.15, size) - 1
+        promoted = rng.random(size) < 0.2
+        missing = np.where(rng.random(size) < missing_share,
+                           rng.integers(0, len(OFFER_PARAMS), size), -1)
+        listing_only = rng.random(size) < listing_only_share
+        codes = {field: draw(OLX_CODES, field, size) for field in OLX_CODES}
+        otodom_codes = {field: draw(OTODOM_CODES, field, size) for field in OTODOM_CODES}
+        common_codes = {field: draw(COMMON_CODES, field, size) for field in COMMON_CODES}
+
+        for i in range(size):
+            offer_id = start + i
+            domain = 'www.otodom.pl' if otodom[i] else 'www.olx.pl'
+            path = 'pl/oferta' if otodom[i] else 'd/oferta'
+            nrooms = otodom_codes['nrooms'][i] if otodom[i] else codes['nrooms'][i]
+            offer_pars = {'type': 'internal',
+                          'class': 'promoted' if promoted[i] else 'standard',
+                          'link': f"https://{domain}/{path}/mieszkanie-ID{offer_id}.html",
+                          'domain': domain,
+                          'date': run_date - timedelta(days=int(age[i])),
+                          'price': float(price[i]),
+                          'title': f"Mieszkanie {nrooms} pok. {districts[district[i]]}",
+                          'district': districts[district[i]]}
+            if listing_only[i]:
+                offer_pars['listing_only'] = True
+                yield offer_pars
+                continue
+            offer_pars.update({'price_meter': float(price_meter[i]),
+                               'area': float(area[i]),
+                               'furniture': None if otodom[i] else codes['furniture'][i],
+                               'owner': None if otodom[i] else codes['owner'][i],
+                               'floor': otodom_codes['floor'][i] if otodom[i] else codes['floor'][i],
+                               'nrooms': nrooms,
+                               'market': common_codes['market'][i],
+                               'building_type': common_codes['building_type'][i]})
+            if missing[i] >= 0:
+                del offer_pars[OFFER_PARAMS[missing[i]]]  # parameter not found on page
+            yield offer_pars
+
+
+def write_offers(data_file: str, n_offers: int,
+                 file_format: str = 'json',
+                 seed: int = 0,
+                 run_date: date = None) -> int:
+    """Generate offers and save them with the scraper export
+
+    Parameters
+    ----------
+    data_file : str
+        json file (or parquet dataset directory)
+    n_offers : int
+        number of offers
+    file_format : str, optional
+        output format - json or parquet, by default 'json'
+    seed : int, optional
+        random seed, by default 0
+    run_date : date, optional
+        date of scraping run, by default today
+
+    Returns
+    -------
+    int
+        number of saved offers
+    """
+    from main.webscraping.scraper import Scraper
+
+    exporter = Scraper('https://www.olx.pl/')
+    exporter.run_date = run_date or date.today()
+    logger.info(f"Generating {n_offers} synthetic offers into: {data_file}")
+    return exporter.export_data(data_file, file_format,
+                                offers=generate_offers(n_offers, seed, exporter.run_date))
@@ -0,0 +1,190 @@
+"""Daily price time series per district, maintained incrementally
+
+Each update summarizes only days completed after the last materialized
+day (watermark), so history is never recomputed. Series are stored as csv.
+"""
+
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Price columns and daily statistics of the series
+SERIES_COLUMNS = ['price', 'price_meter']
+SERIES_STATS = {'count': None, '25%': 0.25, '50%': 0.5, '75%': 0.75}
+
+# District label of series over all districts
+ALL_DISTRICTS = 'All'
+
+
+def summarize_days(offer_data: pd.DataFrame) -> pd.DataFrame:
+    """Calculate daily price statistics per district and over all districts
+
+    Parameters
+    ----------
+    offer_data : pd.DataFrame
+        offer data with date, district and price columns
+
+    Returns
+    -------
+    pd.DataFrame
+        statistics (e.g. price_50%) indexed by date and district
+    """
+    offer_data = offer_data.assign(date=offer_data['date'].dt.normalize(),
+                                   district=offer_data['district'].astype(object))
+    all_districts = offer_data.assign(district=ALL_DISTRICTS)
+    grouped = pd.concat([offer_data, all_districts]).groupby(['date', 'district'])
+    daily_stats = {}
+    for column in SERIES_COLUMNS:
+        values = grouped[column]
+        daily_stats[f"{column}_count"] = values.count()
+        quantiles = values.quantile([q for q in SERIES_STATS.values() if q]).unstack()
+        for stat, q in SERIES_STATS.items():
+            if q:
+                daily_stats[f"{column}_{stat}"] = quantiles[q]
+    return pd.DataFrame(daily_stats)
+
+
+class PriceTimeSeries(object):
+    """ Materialized daily price statistics per district """
+
+    def __init__(self, series_file: str = None):
+        """
+        Parameters
+        ----------
+        series_file : str, optional
+            .csv file with stored series, by default None (not stored)
+        """
+        self.series_file = Path(series_file) if series_file else None
+        self.series = None  # statistics indexed by date and district
+        if self.series_file and self.series_file.exists():
+            self.series = pd.read_csv(self.series_file, parse_dates=['date'])\
+                .set_index(['date', 'district'])
+            logger.info(f"Loaded price series until {self.watermark:%Y-%m-%d} from: "
+                        f"{self.series_file.resolve()}")
+
+    @property
+    def watermark(self) -> pd.Timestamp:
+        """Last materialized day (None for empty series)"""
+        if self.series is None or self.series.empty:
+            return None
+        return self.series.index.get_level_values('date').max()
+
+    def update(self, offer_data: pd.DataFrame, complete_until: str = None) -> int:
+        """Append days completed after watermark
+
+        Parameters
+        ----------
+        offer_data : pd.DataFrame
+            offer data of a run (date, district, price, price_meter)
+        complete_until : str, optional
+            last day with complete data (YYYY-MM-DD), by default
+            the day before the run date (or latest date in data)
+
+        Returns
+        -------
+        int
+            number of appended days
+        """
+        dates = offer_data['date']
+        if complete_until is None:
+            if 'run_date' in offer_data.columns:
+                complete_until = pd.to_datetime(offer_data['run_date'].astype(str)).max() \
+                    - pd.Timedelta(days=1)
+            else:
+                complete_until = dates.max()
+        complete_until = pd.Timestamp(complete_until).normalize()
+        selected = dates.notna() & (dates.dt.normalize() <= complete_until)
+        if self.watermark is not None:
+            selected &= dates.dt.normalize() > self.watermark
+        if not selected.any():
+            logger.info("No completed days after watermark, price series not changed")
+            return 0
+
+        new_days = summarize_days(offer_data.loc[selected])
+        self.series = new_days if self.series is None else pd.concat([self.series, new_days])
+        n_days = new_days.index.get_level_values('date').nunique()
+        logger.info(f"Appended {n_days} days to price series, watermark: {self.watermark:%Y-%m-%d}")
+        return n_days
+
+    def save(self):
+        """Store series in csv file"""
+        if self.series_file is None:
+            raise ValueError('Series file not set')
+        self.series_file.parent.mkdir(parents=True, exist_ok=True)
+        self.series.sort_index().to_csv(self.series_file, date_format='%Y-%m-%d')
+        logger.info(f"Saved price series to: {self.series_file.resolve()}")
+
+    def get_trend(self, column: str = 'price_meter',
+                  stat: str = '50%',
+                  window: int = 7,
+                  districts: list = None) -> pd.DataFrame:
+        """Get rolling-window trend of daily statistic
+
+        Daily values are averaged over the window weighted by number
+        of offers per day.
+
+        Parameters
+        ----------
+        column : str, optional
+            price variable (price/price_meter), by default 'price_meter'
+        stat : str, optional
+            daily statistic (25%/50%/75%/count), by default '50%'
+        window : int, optional
+            window length in days, by default 7
+        districts : list, optional
+            districts to include, by default all (and total)
+
+        Returns
+        -------
+        pd.DataFrame
+            trend indexed by date, district in columns
+
+        Raises
+        ------
+        ValueError
+            if statistic is not stored in series
+        """
+        if stat not in SERIES_STATS:
+            raise ValueError(f"Incorrect statistic: {stat}. Use one of: {', '.join(SERIES_STATS)}")
+        if self.series is None:
+            return pd.DataFrame()
+        counts = self.series[f"{column}_count"].unstack('district')
+        if districts:
+            counts = counts.reindex(columns=list(districts))
+        # Calendar days without offers count as empty
+        counts = counts.asfreq('D').fillna(0)
+        rolling_counts = counts.rolling(window, min_periods=1).sum()
+        if stat == 'count':
+            return rolling_counts
+        values = self.series[f"{column}_{stat}"].unstack('district')\
+            .reindex(index=counts.index, columns=counts.columns)
+        weighted_sum = (values * counts).fillna(0).rolling(window, min_periods=1).sum()
+        return (weighted_sum / rolling_counts).where(rolling_counts > 0)
+
+    def get_chart_data(self, window: int = 7, districts: list = None) -> dict:
+        """Get trend data for plotting
+
+        Parameters
+        ----------
+        window : int, optional
+            window length in days, by default 7
+        districts : list, optional
+            districts to include, by default all (and total)
+
+        Returns
+        -------
+        dict
+            column (price/price_meter) -> district -> dates and median trend
+        """
+        chart_data = {}
+        for column in SERIES_COLUMNS:
+            trend = self.get_trend(column, '50%', window, districts)
+            chart_data[column] = {
+                district: {'dates': values.dropna().index.strftime('%Y-%m-%d').tolist(),
+                           'values': values.dropna().tolist()}
+                for district, values in trend.items()}
+        return chart_data
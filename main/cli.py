@@ -0,0 +1,235 @@
+""" Command line interface
+
+Subcommands import only the modules they need: scraping does not load
+pandas or matplotlib, analysis does not load the scraper.
+
+Usage:
+    python -m main.cli scrape --config filters.json [--output FILE] [--format json|parquet]
+        [--raw] [--archive ARCHIVE_DIR] [--memo MEMO_FILE] [--deadline SECONDS] [--memory-limit MB]
+    python -m main.cli analyze <data_file> [--districts D ...] [--dedup] [--plots]
+    python -m main.cli report <data_file> <output_dir> [--formats png svg] [--segments nrooms market]
+        [--dedup]
+    python -m main.cli watch --config filters.json [--events FILE] [--max-pages N] [--duration SECONDS]
+    python -m main.cli run --config filters.json [--output FILE]
+
+Config file (json) holds selected filters and optionally URL of searched listing:
+    {"filters": {"Cena do": "700000", "Dzielnica": ["Wola", "Ochota"]},
+     "base_url": "https://www.olx.pl/nieruchomosci/mieszkania/sprzedaz/warszawa/"}
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+START_TIME = time.perf_counter()  # start of CLI
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Time from CLI start to command start [s]
+STARTUP_BUDGET = 1.0
+
+DATA_FILE = Path('.') / "data" / "scraper_data.json"
+
+
+def read_config(config_file: str) -> dict:
+    """Read scraping config
+
+    Parameters
+    ----------
+    config_file : str
+        json file with filters (selected filters) and base_url (optional)
+
+    Returns
+    -------
+    dict
+        config
+
+    Raises
+    ------
+    ValueError
+        if config has no filters
+    """
+    with open(config_file, encoding='utf-8') as f:
+        config = json.load(f)
+    if not isinstance(config.get('filters'), dict):
+        raise ValueError(f'Config has no filters: {config_file}')
+    return config
+
+
+def _get_scraper(args: argparse.Namespace):
+    """Create scraper for config and options of command"""
+    from main.webscraping.scraper import OLXScraper
+
+    config = read_config(args.config)
+    options = {'raw': getattr(args, 'raw', False),
+               'base_url': args.base_url or config.get('base_url', OLXScraper.BASE_URL)}
+    if getattr(args, 'archive', None):
+        from main.webscraping.archive import PageArchive
+        options['archive'] = PageArchive(args.archive)
+    if getattr(args, 'memo', None):
+        from main.webscraping.memo import ParseMemo
+        options['memo'] = ParseMemo(args.memo)
+    if getattr(args, 'memory_limit', None):
+        from main.webscraping.memory import MemoryBudget
+        options['memory_budget'] = MemoryBudget(args.memory_limit)
+    if getattr(args, 'deadline', None):
+        from main.webscraping.hedge import HedgedFetcher
+        max_in_flight = options['memory_budget'].max_in_flight if 'memory_budget' in options else 1
+        options['fetcher'] = HedgedFetcher(deadline=args.deadline, max_in_flight=max_in_flight)
+    return OLXScraper(config['filters'], **options)
+
+
+def scrape(args: argparse.Namespace) -> int:
+    """Scrape offers and save them while crawling"""
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with _get_scraper(args) as scraper:
+        scraper.export_data(args.output, args.format, offers=scraper.iter_offers())
+    return 0
+
+
+def analyze(args: argparse.Namespace) -> int:
+    """Print price summaries"""
+    from main.analysis.analyzer import OfferAnalyzer
+
+    ofan = OfferAnalyzer(args.data_file, districts=args.districts,
+                         run_date_from=args.run_date_from, run_date_to=args.run_date_to,
+                         dedup=args.dedup)
+    print(ofan.get_price_summary())
+    print(ofan.get_price_district_summary())
+    if args.plots:
+        ofan.show_plots()
+    return 0
+
+
+def report(args: argparse.Namespace) -> int:
+    """Render report charts to files"""
+    from main.analysis.analyzer import OfferAnalyzer
+
+    ofan = OfferAnalyzer(args.data_file, districts=args.districts,
+                         run_date_from=args.run_date_from, run_date_to=args.run_date_to,
+                         dedup=args.dedup)
+    files = ofan.render_report(args.output_dir, formats=tuple(args.formats),
+                               segments=tuple(args.segments), processes=args.processes)
+    logger.info(f"{len(files)} charts rendered into: {Path(args.output_dir).resolve()}")
+    return 0
+
+
+def watch(args: argparse.Namespace) -> int:
+    """Watch newest ads and emit new offers"""
+    with _get_scraper(args) as scraper:
+        scraper.watch(args.events, max_pages=args.max_pages, duration=args.duration)
+    return 0
+
+
+def run(args: argparse.Namespace) -> int:
+    """Scrape offers, then show price summaries and plots"""
+    scrape(args)
+    args.data_file = args.output
+    args.districts = args.run_date_from = args.run_date_to = None
+    args.dedup = False
+    args.plots = True
+    return analyze(args)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Get parser of command line arguments
+
+    Returns
+    -------
+    argparse.ArgumentParser
+        parser with subcommands
+    """
+    parser = argparse.ArgumentParser(prog='python -m main.cli',
+                                     description='Flat offer scraper and analyzer')
+    parser.add_argument('--log-config', default='logging.json', help='logging config file (.json)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_scraper_options(command_parser: argparse.ArgumentParser):
+        command_parser.add_argument('--config', required=True,
+                                    help='json file with filters and base_url')
+        command_parser.add_argument('--base-url', help='URL of searched listing (city and category)')
+        command_parser.add_argument('--archive', help='archive directory of fetched pages')
+        command_parser.add_argument('--memo', help='memo file of parsed offer parameters')
+        command_parser.add_argument('--deadline', type=float,
+                                    help='deadline of offer page [s], with hedged requests')
+        command_parser.add_argument('--memory-limit', type=float,
+                                    help='memory budget of crawl [MB], offer pages are requested '
+                                         'ahead as far as it allows')
+
+    def add_data_options(command_parser: argparse.ArgumentParser):
+        command_parser.add_argument('data_file', help='json file or parquet dataset with offer data')
+        command_parser.add_argument('--districts', nargs='+', help='districts to analyze')
+        command_parser.add_argument('--from', dest='run_date_from', help='first run date (YYYY-MM-DD)')
+        command_parser.add_argument('--to', dest='run_date_to', help='last run date (YYYY-MM-DD)')
+        command_parser.add_argument('--dedup', action='store_true',
+                                    help='count near-duplicate offers of the same flat once')
+
+    for name, description in [('scrape', 'scrape offers into file'),
+                              ('run', 'scrape offers, show price summaries and plots')]:
+        command_parser = commands.add_parser(name, help=description)
+        add_scraper_options(command_parser)
+        command_parser.add_argument('--output', default=str(DATA_FILE),
+                                    help='output json file or parquet dataset directory')
+        command_parser.add_argument('--format', default='json', choices=['json', 'parquet'],
+                                    help='output format')
+        command_parser.add_argument('--raw', action='store_true',
+                                    help='capture raw text of offer parameters')
+
+    command_parser = commands.add_parser('analyze', help='print price summaries')
+    add_data_options(command_parser)
+    command_parser.add_argument('--plots', action='store_true', help='show plots')
+
+    command_parser = commands.add_parser('report', help='render report charts to files')
+    add_data_options(command_parser)
+    command_parser.add_argument('output_dir', help='directory where charts are saved')
+    command_parser.add_argument('--formats', nargs='+', default=['png'], help='file formats')
+    command_parser.add_argument('--segments', nargs='+', default=['nrooms', 'market'],
+                                help='columns defining offer segments')
+    command_parser.add_argument('--processes', type=int, help='number of worker processes')
+
+    command_parser = commands.add_parser('watch', help='watch newest ads, emit new offers')
+    add_scraper_options(command_parser)
+    command_parser.add_argument('--events', help='JSONL file for new offers, by default stdout')
+    command_parser.add_argument('--max-pages', type=int, default=3,
+                                help='maximum number of pages read per poll')
+    command_parser.add_argument('--duration', type=float, help='watching time [s]')
+    return parser
+
+
+COMMANDS = {'scrape': scrape,
+            'analyze': analyze,
+            'report': report,
+            'watch': watch,
+            'run': run}
+
+
+def main(argv: list = None) -> int:
+    """Run command
+
+    Parameters
+    ----------
+    argv : list, optional
+        command line arguments, by default `sys.argv[1:]`
+
+    Returns
+    -------
+    int
+        exit code
+    """
+    args = get_parser().parse_args(argv)
+    from utils.logging_config import get_log_config
+
+    get_log_config(args.log_config)
+    startup_time = time.perf_counter() - START_TIME
+    logger.debug(f"Startup of `{args.command}` took {startup_time:.3f}s")
+    if startup_time > STARTUP_BUDGET:
+        logger.warning(f"Startup took {startup_time:.2f}s, over budget of {STARTUP_BUDGET}s")
+    return COMMANDS[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
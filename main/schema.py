@@ -0,0 +1,103 @@
+""" Offer record schema shared by data export and analysis """
+
+from datetime import date
+
+# Offer fields and their logical types (as exported by the scraper)
+OFFER_FIELDS = {'type': 'category',
+                'class': 'category',
+                'link': 'string',
+                'domain': 'category',
+                'date': 'date',
+                'price': 'float',
+                'title': 'string',
+                'district': 'category',
+                'price_meter': 'float',
+                'area': 'float',
+                'furniture': 'category',
+                'owner': 'category',
+                'floor': 'category',
+                'nrooms': 'category',
+                'market': 'category',
+                'building_type': 'category'}
+
+# Memory-optimized pandas dtypes for logical types
+# (low-cardinality fields as categoricals, NaN-aware floats)
+PANDAS_DTYPES = {'category': 'category',
+                 'string': 'object',
+                 'date': 'datetime64[ns]',
+                 'float': 'float64'}
+
+# Fields stored with a narrower dtype than their logical type. Prices keep
+# float64 (sums and variances over many offers lose precision in float32)
+PANDAS_FIELD_DTYPES = {'area': 'float32'}
+
+# Columns used to partition columnar datasets (directory per value)
+PARTITION_FIELDS = ['run_date', 'district']
+
+
+def get_arrow_schema(fields: list = None):
+    """Get explicit Arrow schema for offer records
+
+    Parameters
+    ----------
+    fields : list, optional
+        offer fields to include, by default all fields from `OFFER_FIELDS`
+
+    Returns
+    -------
+    pyarrow.Schema
+        Arrow schema for offer data
+    """
+    import pyarrow as pa
+
+    arrow_types = {'category': pa.dictionary(pa.int32(), pa.string()),
+                   'string': pa.string(),
+                   'date': pa.date32(),
+                   'float': pa.float64()}
+    fields = fields or list(OFFER_FIELDS)
+    schema = pa.schema([pa.field(f, arrow_types[OFFER_FIELDS[f]])
+                        for f in fields])
+    return schema
+
+
+def get_pandas_dtype(field: str) -> str:
+    """Get memory-optimized pandas dtype of offer field
+
+    Parameters
+    ----------
+    field : str
+        offer field name
+
+    Returns
+    -------
+    str
+        pandas dtype
+    """
+    return PANDAS_FIELD_DTYPES.get(field, PANDAS_DTYPES[OFFER_FIELDS[field]])
+
+
+def coerce_value(field: str, value):
+    """Convert scraped value to the type declared for the field
+
+    Parameters
+    ----------
+    field : str
+        offer field name
+    value
+        scraped value
+
+    Returns
+    -------
+    str/float/datetime.date or None
+        value matching field type, None if missing
+    """
+    if value is None or value == '':
+        return None
+    field_type = OFFER_FIELDS[field]
+    if field_type == 'float':
+        return float(value)
+    elif field_type == 'date':
+        if isinstance(value, str):
+            return date.fromisoformat(value[:10])
+        return value
+    return str(value)
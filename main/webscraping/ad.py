@@ -1,17 +1,47 @@
-""" Parsing advertisement pages """
+""" Parsing advertisement pages
 
-import locale
-from datetime import date, datetime, timedelta
+Fields of listing ads are declared as XPath expressions relative to an ad
+row, compiled once and evaluated on the lxml tree of a listing page.
+"""
+
+from datetime import date
 from urllib.parse import urlparse
 
-import bs4
 import requests
+from lxml import etree
+
+from main.webscraping.codes import decode_ad_date, decode_ad_district, decode_number
+from main.webscraping.page import parse_html
+
+
+def _has_class(name: str) -> str:
+    """XPath condition for element with CSS class"""
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+def _text_after_icon(icon: str) -> str:
+    """XPath of text following icon"""
+    return f'string((.//i[@data-icon="{icon}"])[1]/following-sibling::node()[1][self::text()])'
+
+
+# Ad rows of OLX listing page
+OLX_ROWS = etree.XPath(f'(//table[@id="offers_table"])[1]//tr[{_has_class("wrap")}]')
 
-from utils.set_locale import set_locale
+# Raw ad field -> XPath relative to ad row (OLX)
+OLX_AD_FIELDS = {'rel': 'string(@rel)',
+                 'promoted': f'boolean(.//td[{_has_class("offer")} and {_has_class("promoted")}])',
+                 'link': 'string((.//a[@data-cy="listing-ad-title"])[1]/@href)',
+                 'title': 'string((.//a[@data-cy="listing-ad-title"])[1])',
+                 'price': f'string((.//p[{_has_class("price")}])[1])',
+                 'date': _text_after_icon('clock'),
+                 'location': _text_after_icon('location-filled')}
+# Plain strings are returned (smart strings keep a reference to the page tree)
+OLX_AD_SELECTORS = {field: etree.XPath(path, smart_strings=False)
+                    for field, path in OLX_AD_FIELDS.items()}
 
 
-def get_ads(domain: str, ads_response: requests.models.Response) -> bs4.element.ResultSet:
-    """Get HTML for ads
+def get_ads(domain: str, ads_response: requests.models.Response) -> list:
+    """Get raw values of ads on listing page
 
     Parameters
     ----------
@@ -22,8 +52,8 @@ def get_ads(domain: str, ads_response: requests.models.Response) -> bs4.element.
 
     Returns
     -------
-    bs4.element.ResultSet
-        raw data with advertisements
+    list
+        raw values of advertisement fields (dict per ad, see `OLX_AD_FIELDS`)
 
     Raises
     ------
@@ -31,9 +61,9 @@ def get_ads(domain: str, ads_response: requests.models.Response) -> bs4.element.
         If unuspported domain specified
     """
     if domain == 'www.olx.pl':
-        ad_content = bs4.BeautifulSoup(ads_response.text, 'lxml').find(
-            'table', {'id': 'offers_table'})
-        ad_wrappers = ad_content.find_all('tr', {'class': 'wrap'})
+        page = parse_html(ads_response)
+        ad_wrappers = [{field: selector(row) for field, selector in OLX_AD_SELECTORS.items()}
+                       for row in OLX_ROWS(page)]
     elif domain == 'www.otodom.pl':
         ad_wrappers = None
     else:
@@ -44,8 +74,11 @@ def get_ads(domain: str, ads_response: requests.models.Response) -> bs4.element.
 class OLXAd(object):
     """ Flat advertisement for OLX """
 
-    def __init__(self, ad_wrapper: bs4.element.Tag):
-        self.ad_wrapper = ad_wrapper
+    def __init__(self, ad_wrapper: dict, raw: bool = False,
+                 captured: date = None):
+        self.ad_wrapper = ad_wrapper  # raw values of ad fields (see `get_ads`)
+        self.raw = raw  # keep raw text of date, price and district
+        self.captured = captured  # day when page was fetched (default today)
         self.ad_params = {}
 
     def get_ad_params(self):
@@ -78,8 +111,7 @@ class OLXAd(object):
         str
             Advertisement class (promoted or standard)
         """
-        ad_class = 'promoted' if self.ad_wrapper.find(
-            'td', {'class': 'offer promoted '}) else 'standard'
+        ad_class = 'promoted' if self.ad_wrapper['promoted'] else 'standard'
         return ad_class
 
     def _get_ad_link(self):
@@ -90,8 +122,7 @@ class OLXAd(object):
         str
             Advertisement URL
         """
-        ad_link = self.ad_wrapper.find(
-            'a', {'data-cy': 'listing-ad-title'})['href']
+        ad_link = self.ad_wrapper['link']
         return ad_link
 
     def _get_ad_domain(self):
@@ -111,21 +142,12 @@ class OLXAd(object):
         Returns
         -------
         datetime.date
-            Day when advertisement was added
+            Day when advertisement was added (raw text in raw mode)
         """
-        ad_date = self.ad_wrapper.find(
-            'i', {'data-icon': 'clock'}).next_sibling.strip()
-        if ad_date.startswith('dzisiaj'):
-            ad_date_day = date.today()
-        elif ad_date.startswith('wczoraj'):
-            ad_date_day = date.today() - timedelta(days=1)
-        else:
-            with set_locale(locale.LC_ALL, 'pl_PL.UTF-8'):
-                parsed_date = datetime.strptime(ad_date, '%d  %b').date()
-            parsed_month = parsed_date.month
-            current_month = date.today().month
-            ad_year = date.today().year if current_month >= parsed_month else date.today().year - 1
-            ad_date_day = parsed_date.replace(year=ad_year)
+        ad_date = self.ad_wrapper['date'].strip()
+        if self.raw:
+            return ad_date
+        ad_date_day = decode_ad_date(ad_date, self.captured)
         return ad_date_day
 
     def _get_ad_price(self):
@@ -134,11 +156,12 @@ class OLXAd(object):
         Returns
         -------
         float
-            Price from advertisement (total)
+            Price from advertisement (total, raw text in raw mode)
         """
-        ad_price = self.ad_wrapper.find('p', {'class': 'price'}).text.strip()
-        ad_price_float = float(ad_price.replace(
-            'zł', '').replace(' ', '').replace(',', '.'))
+        ad_price = self.ad_wrapper['price'].strip()
+        if self.raw:
+            return ad_price
+        ad_price_float = decode_number(ad_price)
         return ad_price_float
 
     def _get_ad_title(self):
@@ -149,8 +172,7 @@ class OLXAd(object):
         str
             Advertisement title
         """
-        ad_title = self.ad_wrapper.find(
-            'a', {'data-cy': 'listing-ad-title'}).text.strip()
+        ad_title = self.ad_wrapper['title'].strip()
         return ad_title
 
     def _get_ad_district(self):
@@ -159,9 +181,10 @@ class OLXAd(object):
         Returns
         -------
         str
-            Warsaw district where flat is located
+            Warsaw district where flat is located (raw location in raw mode)
         """
-        ad_district_with_city = self.ad_wrapper.find(
-            'i', {'data-icon': 'location-filled'}).next_sibling.strip()
-        ad_district = ad_district_with_city.split(',')[1].strip()
+        ad_district_with_city = self.ad_wrapper['location'].strip()
+        if self.raw:
+            return ad_district_with_city
+        ad_district = decode_ad_district(ad_district_with_city)
         return ad_district
@@ -0,0 +1,279 @@
+""" Archive of fetched pages
+
+Page bodies are stored once per content (SHA-256), compressed with zstd.
+A SQLite index records every fetch: run date, page kind, URL and content hash.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+from datetime import date, datetime
+from pathlib import Path
+
+import requests
+
+from main.webscraping.page import get_encoding
+
+# Logger
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.sqlite'
+OBJECTS_DIR = 'objects'
+PAGE_KINDS = ['listing', 'offer']
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    run_date TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    final_url TEXT NOT NULL,
+    status INTEGER,
+    encoding TEXT,
+    sha256 TEXT NOT NULL,
+    fetched_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_kind ON pages (kind, run_date);
+CREATE INDEX IF NOT EXISTS pages_url ON pages (url, run_date);
+CREATE TABLE IF NOT EXISTS objects (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL
+);
+"""
+
+
+class ArchivedResponse(object):
+    """ Archived page with the response attributes used by parsers """
+
+    def __init__(self, url: str, content: bytes, encoding: str = None,
+                 status_code: int = 200):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.status_code = status_code
+
+    @property
+    def text(self) -> str:
+        """Page body decoded with encoding of original page"""
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+
+class PageArchive(object):
+    """ Content-addressed, zstd-compressed archive of listing and offer pages """
+
+    def __init__(self, archive_dir: str, level: int = 9):
+        """
+        Parameters
+        ----------
+        archive_dir : str
+            archive directory (index and objects)
+        level : int, optional
+            zstd compression level, by default 9
+        """
+        self.archive_dir = Path(archive_dir)
+        self.objects_dir = self.archive_dir / OBJECTS_DIR
+        self.level = level
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        # Index may be used from another thread (e.g. async crawl), one at a time
+        self.index = sqlite3.connect(str(self.archive_dir / INDEX_FILE), timeout=30,
+                                     check_same_thread=False)
+        self.lock = threading.RLock()
+        self.index.row_factory = sqlite3.Row
+        self.index.executescript(INDEX_SCHEMA)
+
+    def _object_path(self, sha256: str) -> Path:
+        return self.objects_dir / sha256[:2] / f"{sha256}.zst"
+
+    def put_object(self, content: bytes) -> str:
+        """Store page body if not stored yet
+
+        The body is written to a temporary file of the writer and renamed,
+        so processes storing the same page at once do not interfere.
+
+        Parameters
+        ----------
+        content : bytes
+            page body
+
+        Returns
+        -------
+        str
+            SHA-256 of page body
+        """
+        import zstandard
+
+        sha256 = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(sha256)
+        if not object_path.exists():
+            object_path.parent.mkdir(exist_ok=True)
+            compressed = zstandard.ZstdCompressor(level=self.level).compress(content)
+            with tempfile.NamedTemporaryFile(dir=object_path.parent, suffix='.tmp',
+                                             delete=False) as temp_file:
+                temp_file.write(compressed)
+            temp_path = Path(temp_file.name)
+            try:
+                temp_path.replace(object_path)
+            except OSError:
+                # Object stored by another process in the meantime is kept
+                temp_path.unlink()
+                if not object_path.exists():
+                    raise
+            with self.lock:
+                self.index.execute('INSERT OR IGNORE INTO objects VALUES (?, ?, ?)',
+                                   (sha256, len(content), len(compressed)))
+        return sha256
+
+    def get_object(self, sha256: str) -> bytes:
+        """Get page body
+
+        Parameters
+        ----------
+        sha256 : str
+            SHA-256 of page body
+
+        Returns
+        -------
+        bytes
+            page body
+        """
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(self._object_path(sha256).read_bytes())
+
+    def store(self, site: requests.models.Response, kind: str,
+              run_date: date, url: str = None) -> int:
+        """Archive fetched page
+
+        The encoding parsers decode the page with (`get_encoding`) is stored,
+        not the response default (ISO-8859-1 for text without charset).
+
+        Parameters
+        ----------
+        site : requests.models.Response
+            response from website
+        kind : str
+            page kind (listing/offer)
+        run_date : date
+            date of scraping run
+        url : str, optional
+            requested URL (e.g. ad link before redirect), by default response URL
+
+        Returns
+        -------
+        int
+            page id
+
+        Raises
+        ------
+        ValueError
+            if unsupported page kind specified
+        """
+        if kind not in PAGE_KINDS:
+            raise ValueError(f'Incorrect page kind: {kind}')
+        sha256 = self.put_object(site.content)
+        with self.lock, self.index:
+            cursor = self.index.execute(
+                'INSERT INTO pages (run_date, kind, url, final_url, status, encoding, sha256, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (str(run_date), kind, url or site.url, site.url,
+                 getattr(site, 'status_code', None), get_encoding(site), sha256,
+                 datetime.now().isoformat(timespec='seconds')))
+        return cursor.lastrowid
+
+    def _to_response(self, page: sqlite3.Row) -> ArchivedResponse:
+        return ArchivedResponse(page['final_url'], self.get_object(page['sha256']),
+                                page['encoding'], page['status'])
+
+    def get_page(self, page_id: int) -> ArchivedResponse:
+        """Get archived page by id
+
+        Parameters
+        ----------
+        page_id : int
+            page id
+
+        Returns
+        -------
+        ArchivedResponse
+            archived page
+        """
+        with self.lock:
+            page = self.index.execute('SELECT * FROM pages WHERE id = ?', (page_id,)).fetchone()
+        return self._to_response(page) if page else None
+
+    def find_page(self, url: str, kind: str, run_date: date) -> ArchivedResponse:
+        """Get page fetched from URL in a scraping run (last fetch if repeated)
+
+        Parameters
+        ----------
+        url : str
+            requested URL
+        kind : str
+            page kind (listing/offer)
+        run_date : date
+            date of scraping run
+
+        Returns
+        -------
+        ArchivedResponse
+            archived page, None if not found
+        """
+        with self.lock:
+            page = self.index.execute(
+                'SELECT * FROM pages WHERE url = ? AND kind = ? AND run_date = ? '
+                'ORDER BY id DESC LIMIT 1', (url, kind, str(run_date))).fetchone()
+        return self._to_response(page) if page else None
+
+    def get_pages(self, kind: str,
+                  run_date_from: str = None,
+                  run_date_to: str = None) -> list:
+        """Get index entries of archived pages
+
+        Parameters
+        ----------
+        kind : str
+            page kind (listing/offer)
+        run_date_from : str, optional
+            first run date (YYYY-MM-DD), by default None
+        run_date_to : str, optional
+            last run date (YYYY-MM-DD), by default None
+
+        Returns
+        -------
+        list
+            (page id, run date) in order of fetching
+        """
+        query = 'SELECT id, run_date FROM pages WHERE kind = ?'
+        params = [kind]
+        if run_date_from:
+            query += ' AND run_date >= ?'
+            params.append(str(run_date_from))
+        if run_date_to:
+            query += ' AND run_date <= ?'
+            params.append(str(run_date_to))
+        with self.lock:
+            return [tuple(row) for row in self.index.execute(query + ' ORDER BY id', params)]
+
+    def get_stats(self) -> dict:
+        """Get archive size
+
+        Returns
+        -------
+        dict
+            number of fetched pages and stored objects, page and stored bytes
+        """
+        with self.lock:
+            pages, page_bytes = self.index.execute(
+                'SELECT COUNT(*), COALESCE(SUM(o.size), 0) FROM pages p '
+                'JOIN objects o ON o.sha256 = p.sha256').fetchone()
+            objects, stored_bytes = self.index.execute(
+                'SELECT COUNT(*), COALESCE(SUM(stored_size), 0) FROM objects').fetchone()
+        return {'pages': pages, 'objects': objects,
+                'page_bytes': page_bytes, 'stored_bytes': stored_bytes}
+
+    def close(self):
+        """Close index"""
+        self.index.close()
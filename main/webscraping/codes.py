@@ -0,0 +1,142 @@
+""" Decoding raw values found on advertisement and offer pages """
+
+import logging
+import re
+from datetime import date, timedelta
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Raw value -> encoded value, per domain and offer field
+VALUE_CODES = {'www.olx.pl': {'floor': {'Suterena': '-1',
+                                        'Parter': '0',
+                                        'Powyżej 10': '>10'},
+                              'nrooms': {'1 pokój': '1',
+                                         '2 pokoje': '2',
+                                         '3 pokoje': '3',
+                                         '4 i więcej': '>3'},
+                              'market': {'Pierwotny': 'Primary'},
+                              'owner': {'Osoby prywatnej': 'Private'},
+                              'furniture': {'Tak': 'Yes',
+                                            'Nie': 'No'},
+                              'building_type': {'Blok': 'Block',
+                                                'Kamienica': 'Tenement',
+                                                'Apartamentowiec': 'Apartment'}},
+               'www.otodom.pl': {'floor': {'parter': '0',
+                                           '> 10': '>10'},
+                                 'market': {'pierwotny': 'Primary'},
+                                 'building_type': {'blok': 'Block',
+                                                   'kamienica': 'Tenement',
+                                                   'apartamentowiec': 'Apartment'}}}
+
+# Encoded value for raw values missing from lookup table
+# (fields not listed here keep their raw value)
+DEFAULT_CODES = {'market': 'Secondary',
+                 'owner': 'Business',
+                 'building_type': 'Other'}
+
+# Fields reduced to digits only, per domain
+DIGIT_FIELDS = {'www.otodom.pl': ['nrooms']}
+
+# Fields coded by raw values containing a lookup key (e.g. 'pierwotny'
+# in 'rynek pierwotny'), per domain
+SUBSTRING_FIELDS = {'www.otodom.pl': ['market']}
+
+# Fields holding numbers written as text (e.g. '45,5 m²', '350 000 zł')
+NUMERIC_FIELDS = ['price', 'price_meter', 'area']
+
+# Polish month abbreviations used in advertisement dates
+MONTH_CODES = {'sty': 1, 'lut': 2, 'mar': 3, 'kwi': 4, 'maj': 5, 'cze': 6,
+               'lip': 7, 'sie': 8, 'wrz': 9, 'paź': 10, 'lis': 11, 'gru': 12}
+
+NON_NUMERIC_PATTERN = re.compile(r'[^\d\.]')
+NON_DIGIT_PATTERN = re.compile(r'[^\d]')
+
+
+def decode_number(raw_value: str) -> float:
+    """Get number from text
+
+    Parameters
+    ----------
+    raw_value : str
+        number with unit, spaces and decimal comma e.g. '45,5 m²'
+
+    Returns
+    -------
+    float
+        decoded number
+    """
+    return float(NON_NUMERIC_PATTERN.sub('', raw_value.replace(',', '.')))
+
+
+def decode_code(domain: str, field: str, raw_value: str) -> str:
+    """Encode raw offer parameter value using lookup tables
+
+    Parameters
+    ----------
+    domain : str
+        domain where offer is published e.g. www.olx.pl
+    field : str
+        offer field e.g. floor
+    raw_value : str
+        value found on offer page
+
+    Returns
+    -------
+    str
+        encoded value, None if raw value is missing
+    """
+    if raw_value is None:
+        return None
+    if field in DIGIT_FIELDS.get(domain, []):
+        return NON_DIGIT_PATTERN.sub('', raw_value)
+    codes = VALUE_CODES.get(domain, {}).get(field, {})
+    if field in SUBSTRING_FIELDS.get(domain, []):
+        raw_value = next((key for key in codes if key in raw_value), raw_value)
+    return codes.get(raw_value, DEFAULT_CODES.get(field, raw_value))
+
+
+def decode_ad_date(raw_value: str, captured: date = None) -> date:
+    """Get date when advertisement was added
+
+    Parameters
+    ----------
+    raw_value : str
+        date as shown on page e.g. 'dzisiaj 12:30', 'wczoraj 08:15', '12  cze'
+    captured : date, optional
+        day when page was fetched, by default today
+
+    Returns
+    -------
+    datetime.date
+        day when advertisement was added, None if date is not recognized
+    """
+    captured = captured or date.today()
+    if raw_value.startswith('dzisiaj'):
+        return captured
+    elif raw_value.startswith('wczoraj'):
+        return captured - timedelta(days=1)
+    try:
+        day, month = raw_value.split()
+        month = MONTH_CODES[month.strip('.')]
+        year = captured.year if captured.month >= month else captured.year - 1
+        return date(year, month, int(day))
+    except (ValueError, KeyError):
+        logger.warning(f"Advertisement date not recognized: {raw_value!r}")
+        return None
+
+
+def decode_ad_district(raw_value: str) -> str:
+    """Get district from location
+
+    Parameters
+    ----------
+    raw_value : str
+        location as shown on page e.g. 'Warszawa, Mokotów'
+
+    Returns
+    -------
+    str
+        district
+    """
+    return raw_value.split(',')[1].strip()
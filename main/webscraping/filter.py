@@ -6,7 +6,8 @@ import urllib.parse
 from pprint import pformat
 
 import requests
-from bs4 import BeautifulSoup
+
+from main.webscraping.page import parse_soup
 
 # logger
 logger = logging.getLogger(__name__)
@@ -16,17 +17,29 @@ class OLXFilter(object):
     """ Manage website filters for OLX """
 
     BASE_URL = "https://www.olx.pl/nieruchomosci/mieszkania/sprzedaz/warszawa/"
-    BASE_SITE = requests.get(BASE_URL)
-    BASE_CONTENT = BeautifulSoup(BASE_SITE.text, 'lxml')
     SEARCH_PATTERN = re.compile(r'search\[.+\]')  # pattern for filters
 
-    def __init__(self, filters_selected: dict):
+    def __init__(self, filters_selected: dict, base_url: str = BASE_URL):
+        """
+        Parameters
+        ----------
+        filters_selected : dict
+            filters specified for scraping
+        base_url : str, optional
+            URL of searched listing (city and category),
+            by default flats for sale in Warsaw
+        """
+        self.base_url = base_url
         self.filters = {}  # dictionary to store filter parameters
         self.filters_selected = filters_selected  # filters specified for scraping
         self.url_params = []  # filters passed to GET method (list of dicts)
+        self.base_content = None  # search page (fetched when filters are read)
 
     def get_filters(self):
         """ Get all filters for website """
+        if self.base_content is None:
+            base_site = requests.get(self.base_url)
+            self.base_content = parse_soup(base_site)
         self.filters = self._get_filters_main()
         self.filters.update(self._get_filters_district())
         self.filters.update(self._get_filters_owner())
@@ -34,7 +47,7 @@ class OLXFilter(object):
         self.filters.update(self._get_filters_order())
         self.filters.update(self._get_filters_page())
         logger.debug(
-            f"Available filters for www.olx.pl are:\n{pformat(self.filters)}")
+            f"Available filters for {self.base_url} are:\n{pformat(self.filters)}")
 
     def _get_filters_main(self):
         """Get filters from page
@@ -46,7 +59,7 @@ class OLXFilter(object):
         """
 
         filters = {}
-        for param in self.BASE_CONTENT.find(
+        for param in self.base_content.find(
             class_="clr multifilters subSelectActive").find_all(
                 class_=re.compile("param param(Select|Float)")):
             filter_code = param['data-name']
@@ -104,14 +117,16 @@ class OLXFilter(object):
         Returns
         -------
         dict
-            Dictionary with districts for filtering
+            Dictionary with districts for filtering (empty if not available)
         """
         districts = {'Dzielnica': {'param': '', 'values': {}}}
-        districts['Dzielnica']['values'] = {d.text: d['href'].split('=')[-1] for d in self.BASE_CONTENT.find_all(
+        if self.base_content.find('a', {'href': re.compile('district_id')}) is None:
+            return {}  # city without districts
+        districts['Dzielnica']['values'] = {d.text: d['href'].split('=')[-1] for d in self.base_content.find_all(
             'a', {'href': re.compile('district_id')})}
         districts['Dzielnica']['param'] = re.search(self.SEARCH_PATTERN,
                                                     urllib.parse.unquote(
-                                                        self.BASE_CONTENT.find(
+                                                        self.base_content.find(
                                                             'a', {'href': re.compile(
                                                                 'district_id')})['href'])).group()
         return districts
@@ -126,10 +141,10 @@ class OLXFilter(object):
         """
         owners = {'Właściciel': {'param': '', 'values': {}}}
         owners['Właściciel']['values'] = {list(d.stripped_strings)[0]: d['href'].split('=')[-1] for d in
-                                          self.BASE_CONTENT.find_all('a', class_='fleft tab tdnone topTabOffer')}
+                                          self.base_content.find_all('a', class_='fleft tab tdnone topTabOffer')}
         owners['Właściciel']['param'] = re.search(self.SEARCH_PATTERN,
                                                   urllib.parse.unquote(
-                                                      self.BASE_CONTENT.find(
+                                                      self.base_content.find(
                                                           'a', class_='fleft tab tdnone topTabOffer')['href'])).group()
         return owners
 
@@ -141,9 +156,9 @@ class OLXFilter(object):
         dict
             Dictionary with photo filter (photo-only)
         """
-        photos = {'Tylko ze zdjęciem': {'param': self.BASE_CONTENT.find(
+        photos = {'Tylko ze zdjęciem': {'param': self.base_content.find(
             'input', id='photo-only')['name'],
-            'values': self.BASE_CONTENT.find(
+            'values': self.base_content.find(
             'input', id='photo-only')['value']}}
         return photos
 
@@ -0,0 +1,203 @@
+""" Crawl frontier with priorities and time/request budget
+
+Listing pages and offers waiting to be fetched are kept in a priority queue.
+Newer listing pages and ads matching search criteria are fetched first, so
+a crawl stopped by its budget keeps the most valuable data.
+"""
+
+import heapq
+import itertools
+import logging
+import time
+from datetime import date
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Task kinds
+LISTING = 'listing'
+OFFER = 'offer'
+
+# Priority of first listing page and its decay with page number
+LISTING_PRIORITY = 1.0
+PAGE_DECAY = 0.9
+
+# Priority weight of ads not matching a criterion
+MISMATCH_WEIGHT = 0.3
+
+
+def get_listing_priority(page: int) -> float:
+    """Get priority of listing page (newest ads first)
+
+    Parameters
+    ----------
+    page : int
+        page number
+
+    Returns
+    -------
+    float
+        priority (1 for first page)
+    """
+    return LISTING_PRIORITY * PAGE_DECAY ** (page - 1)
+
+
+def get_criteria(filters_selected: dict) -> dict:
+    """Get search criteria from selected filters
+
+    Parameters
+    ----------
+    filters_selected : dict
+        filters specified for scraping
+
+    Returns
+    -------
+    dict
+        price_min, price_max and districts
+    """
+    districts = filters_selected.get('Dzielnica')
+    price_min = filters_selected.get('Cena od')
+    price_max = filters_selected.get('Cena do')
+    return {'price_min': float(price_min) if price_min else None,
+            'price_max': float(price_max) if price_max else None,
+            'districts': [districts] if isinstance(districts, str) else districts}
+
+
+def get_ad_priority(ad_params: dict, criteria: dict = None, today: date = None) -> float:
+    """Get priority of offer based on listing-level ad parameters
+
+    Parameters
+    ----------
+    ad_params : dict
+        advertisement parameters (date, price, district)
+    criteria : dict, optional
+        price_min, price_max and districts of interest, by default None
+    today : date, optional
+        reference day for ad age, by default today
+
+    Returns
+    -------
+    float
+        priority between 0 and 1, higher for newer and matching ads
+    """
+    criteria = criteria or {}
+    today = today or date.today()
+    ad_date = ad_params.get('date')
+    age = (today - ad_date).days if isinstance(ad_date, date) else 30
+    priority = 0.5 + 0.5 / (1 + max(age, 0))
+
+    price = ad_params.get('price')
+    if isinstance(price, (int, float)):
+        if criteria.get('price_min') is not None and price < criteria['price_min']:
+            priority *= MISMATCH_WEIGHT
+        if criteria.get('price_max') is not None and price > criteria['price_max']:
+            priority *= MISMATCH_WEIGHT
+    if criteria.get('districts') and ad_params.get('district') not in criteria['districts']:
+        priority *= MISMATCH_WEIGHT
+    return priority
+
+
+class CrawlBudget(object):
+    """ Time and request limits of a crawl """
+
+    def __init__(self, max_seconds: float = None,
+                 max_requests: int = None,
+                 clock=time.monotonic):
+        """
+        Parameters
+        ----------
+        max_seconds : float, optional
+            crawl time limit [s], by default None (no limit)
+        max_requests : int, optional
+            limit of requests sent, by default None (no limit)
+        clock : callable, optional
+            time source [s], by default time.monotonic
+        """
+        self.max_seconds = max_seconds
+        self.max_requests = max_requests
+        self.clock = clock
+        self.start_time = clock()
+        self.requests = 0
+        self.request_time = 0.0  # total time of requests [s]
+
+    @property
+    def elapsed(self) -> float:
+        """Time since start of crawl [s]"""
+        return self.clock() - self.start_time
+
+    def can_fetch(self) -> bool:
+        """Check if next request fits in budget
+
+        Returns
+        -------
+        bool
+            True if request limit is not reached and average request
+            time fits in remaining time
+        """
+        if self.max_requests is not None and self.requests >= self.max_requests:
+            return False
+        if self.max_seconds is not None:
+            mean_request_time = self.request_time / self.requests if self.requests else 0
+            if self.elapsed + mean_request_time > self.max_seconds:
+                return False
+        return True
+
+    def record(self, duration: float):
+        """Record sent request
+
+        Parameters
+        ----------
+        duration : float
+            time of request and parsing [s]
+        """
+        self.requests += 1
+        self.request_time += duration
+
+
+class CrawlFrontier(object):
+    """ Priority queue of listing pages and offers to fetch """
+
+    def __init__(self):
+        self.queue = []  # heap of (-priority, order, kind, task)
+        self.order = itertools.count()  # FIFO among equal priorities
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def push(self, kind: str, priority: float, task: dict):
+        """Add task
+
+        Parameters
+        ----------
+        kind : str
+            task kind (listing/offer)
+        priority : float
+            task priority, higher first
+        task : dict
+            task data e.g. query and page, or ad parameters
+        """
+        heapq.heappush(self.queue, (-priority, next(self.order), kind, task))
+
+    def pop(self) -> tuple:
+        """Get task with highest priority
+
+        Returns
+        -------
+        tuple
+            (kind, priority, task)
+        """
+        priority, _, kind, task = heapq.heappop(self.queue)
+        return kind, -priority, task
+
+    def get_remaining(self) -> dict:
+        """Get tasks not fetched, by priority
+
+        Returns
+        -------
+        dict
+            kind (listing/offer) -> list of tasks with priority
+        """
+        remaining = {LISTING: [], OFFER: []}
+        for priority, _, kind, task in sorted(self.queue):
+            remaining[kind].append(dict(task, priority=-priority))
+        return remaining
@@ -0,0 +1,211 @@
+""" Hedged offer page requests with deadlines
+
+A request not answered within a percentile of recent latencies of its domain
+is sent again, the first response wins. The share of hedged requests is
+limited by a budget. A request not answered before its deadline is given up,
+so a few slow pages do not stall the run.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import requests
+
+# Logger
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker(object):
+    """ Recent request latencies per domain """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Parameters
+        ----------
+        window : int, optional
+            number of recent latencies kept per domain, by default 200
+        min_samples : int, optional
+            number of latencies needed to estimate percentile, by default 20
+        """
+        self.min_samples = min_samples
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+        self.lock = threading.Lock()  # latencies are recorded by request threads
+
+    def record(self, domain: str, latency: float):
+        """Record latency of completed request
+
+        Parameters
+        ----------
+        domain : str
+            requested domain
+        latency : float
+            response time [s]
+        """
+        with self.lock:
+            self.latencies[domain].append(latency)
+
+    def get_percentile(self, domain: str, percentile: float) -> float:
+        """Get percentile of recent latencies
+
+        Parameters
+        ----------
+        domain : str
+            requested domain
+        percentile : float
+            percentile (0-100)
+
+        Returns
+        -------
+        float
+            latency [s], None if too few requests were recorded
+        """
+        with self.lock:
+            latencies = sorted(self.latencies.get(domain, []))
+        if len(latencies) < self.min_samples:
+            return None
+        # Linear interpolation between closest ranks (as numpy.percentile)
+        rank = (len(latencies) - 1) * percentile / 100
+        lower = int(rank)
+        upper = min(lower + 1, len(latencies) - 1)
+        return latencies[lower] + (latencies[upper] - latencies[lower]) * (rank - lower)
+
+
+class HedgedFetcher(object):
+    """ Page fetcher with hedged requests and deadline
+
+    Latency of every request is recorded when it completes, including
+    requests which lost to their hedge (a request timed out counts with
+    the time waited), so percentiles are not biased towards fast responses.
+    Requests time out at the deadline of their page, so late requests do
+    not hold threads needed by later pages. Use as a context manager or
+    call `close` to stop threads.
+    """
+
+    def __init__(self, percentile: float = 95,
+                 deadline: float = 10,
+                 hedge_budget: float = 0.1,
+                 min_delay: float = 0.05,
+                 tracker: LatencyTracker = None,
+                 max_in_flight: int = 1):
+        """
+        Parameters
+        ----------
+        percentile : float, optional
+            percentile of recent latencies after which request is hedged
+            (0-100), by default 95
+        deadline : float, optional
+            time after which page is given up [s], by default 10
+        hedge_budget : float, optional
+            maximum share of requests sent again, by default 0.1
+        min_delay : float, optional
+            shortest time before request is hedged [s], by default 0.05
+        tracker : LatencyTracker, optional
+            recent latencies per domain, by default `LatencyTracker()`
+        max_in_flight : int, optional
+            number of pages fetched at once (e.g. `MemoryBudget.max_in_flight`
+            if offer pages are requested ahead), by default 1. Each page has
+            its request and at most one hedge in flight
+        """
+        self.percentile = percentile
+        self.deadline = deadline
+        self.hedge_budget = hedge_budget
+        self.min_delay = min_delay
+        self.tracker = tracker or LatencyTracker()
+        self.executor = ThreadPoolExecutor(max_workers=2 * max_in_flight)
+        self.stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'timed_out': 0}
+        self.lock = threading.Lock()  # pages are fetched from several threads
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _count(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def _get(self, url: str, domain: str, end_time: float) -> requests.models.Response:
+        """Send request with time left to deadline, record its latency when it completes"""
+        start_time = time.monotonic()
+        if start_time >= end_time:
+            raise requests.Timeout(f"Deadline passed before request was sent: {url}")
+        try:
+            site = requests.get(url, timeout=end_time - start_time)
+        except requests.Timeout:
+            self.tracker.record(domain, time.monotonic() - start_time)
+            raise
+        self.tracker.record(domain, time.monotonic() - start_time)
+        return site
+
+    def _get_hedge_delay(self, domain: str) -> float:
+        """Get time before request is hedged [s], None if it is not hedged"""
+        with self.lock:
+            if self.stats['hedged'] >= self.hedge_budget * self.stats['requests']:
+                return None
+        delay = self.tracker.get_percentile(domain, self.percentile)
+        return max(delay, self.min_delay) if delay is not None else None
+
+    def fetch(self, url: str) -> requests.models.Response:
+        """Get page, send request again if answer is late
+
+        Parameters
+        ----------
+        url : str
+            page URL
+
+        Returns
+        -------
+        requests.models.Response
+            first response, None if page was not received before deadline
+
+        Raises
+        ------
+        Exception
+            error of request if all sent requests failed (except timeouts)
+        """
+        domain = urlparse(url).netloc
+        start_time = time.monotonic()
+        end_time = start_time + self.deadline
+        self._count('requests')
+        pending = {self.executor.submit(self._get, url, domain, end_time)}
+        hedge = None
+        error = None
+
+        hedge_delay = self._get_hedge_delay(domain)
+        if hedge_delay is not None and hedge_delay < self.deadline:
+            done, pending = wait(pending, timeout=hedge_delay)
+            if not done:
+                hedge = self.executor.submit(self._get, url, domain, end_time)
+                pending.add(hedge)
+                self._count('hedged')
+                logger.debug(f"Request hedged after {hedge_delay:.2f}s: {url}")
+            pending |= done
+
+        while pending:
+            done, pending = wait(pending, timeout=max(end_time - time.monotonic(), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is not None:
+                    if not isinstance(future.exception(), requests.Timeout):
+                        error = future.exception()  # timed out request is not an error
+                    continue
+                if future is hedge:
+                    self._count('hedge_wins')
+                return future.result()
+
+        if error is not None and not pending:
+            raise error
+        self._count('timed_out')
+        logger.warning(f"No response within {self.deadline}s deadline: {url}")
+        return None
+
+    def close(self):
+        """Stop threads (requests sent are not waited for)"""
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,172 @@
+""" Memo of parsed offer parameters
+
+Offer parameters are stored under a hash of the page body (with whitespace
+normalized) and of the parser version, so byte-identical or
+whitespace-only different pages are not parsed again. The parser version is
+a hash of the parsing modules' source, any change to them invalidates the memo.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+from main.webscraping import ad, codes, memory, offer, page
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Modules whose logic determines parsed offer parameters
+# (with page decoding and parse tree release used by parsers)
+PARSER_MODULES = [ad, codes, memory, offer, page]
+
+WHITESPACE_PATTERN = re.compile(rb'\s+')
+INTERTAG_PATTERN = re.compile(rb'>\s+<')
+
+
+def get_parser_version() -> str:
+    """Get version of parsing logic
+
+    Returns
+    -------
+    str
+        hash of parsing modules' source code
+    """
+    version = hashlib.sha256()
+    for module in PARSER_MODULES:
+        version.update(Path(module.__file__).read_bytes())
+    return version.hexdigest()[:16]
+
+
+PARSER_VERSION = get_parser_version()
+
+
+def normalize_body(content: bytes) -> bytes:
+    """Remove whitespace between tags, collapse other whitespace runs
+
+    Parameters
+    ----------
+    content : bytes
+        page body
+
+    Returns
+    -------
+    bytes
+        page body without formatting whitespace
+    """
+    return INTERTAG_PATTERN.sub(b'><', WHITESPACE_PATTERN.sub(b' ', content)).strip()
+
+
+class ParseMemo(object):
+    """ Parsed offer parameters keyed by page content and parser version """
+
+    def __init__(self, memo_file: str = None):
+        """
+        Parameters
+        ----------
+        memo_file : str, optional
+            SQLite file storing the memo, by default None (memory only)
+        """
+        self.memo_file = Path(memo_file) if memo_file else None
+        self.memo = {}  # key -> offer parameters (memory only)
+        self.hits = 0
+        self.misses = 0
+        self.index = None
+        self.lock = threading.Lock()
+        if self.memo_file:
+            self.memo_file.parent.mkdir(parents=True, exist_ok=True)
+            # Memo may be used from another thread (e.g. async crawl), one at a time
+            self.index = sqlite3.connect(str(self.memo_file), timeout=30,
+                                         check_same_thread=False)
+            self.index.execute('PRAGMA journal_mode=WAL')
+            self.index.execute('CREATE TABLE IF NOT EXISTS memo '
+                               '(key TEXT PRIMARY KEY, parser_version TEXT, offer_params TEXT)')
+
+    @staticmethod
+    def get_key(domain: str, content: bytes, raw: bool = False) -> str:
+        """Get memo key of offer page
+
+        Parameters
+        ----------
+        domain : str
+            domain where offer is published e.g. www.olx.pl
+        content : bytes
+            page body
+        raw : bool, optional
+            offer parameters captured as raw text, by default False
+
+        Returns
+        -------
+        str
+            SHA-256 of parser version, parsing mode and normalized page body
+        """
+        key = hashlib.sha256(f"{PARSER_VERSION}|{domain}|{int(raw)}|".encode('utf-8'))
+        key.update(normalize_body(content))
+        return key.hexdigest()
+
+    def get(self, key: str) -> dict:
+        """Get memoized offer parameters
+
+        Parameters
+        ----------
+        key : str
+            memo key
+
+        Returns
+        -------
+        dict
+            offer parameters, None if page was not parsed yet
+        """
+        if self.index is None:
+            offer_params = self.memo.get(key)
+        else:
+            with self.lock:
+                row = self.index.execute('SELECT offer_params FROM memo WHERE key = ?',
+                                         (key,)).fetchone()
+            offer_params = json.loads(row[0]) if row else None
+        if offer_params is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(offer_params)
+
+    def set(self, key: str, offer_params: dict):
+        """Store parsed offer parameters
+
+        Parameters
+        ----------
+        key : str
+            memo key
+        offer_params : dict
+            offer parameters
+        """
+        if self.index is None:
+            self.memo[key] = dict(offer_params)
+            return
+        with self.lock, self.index:
+            self.index.execute('INSERT OR REPLACE INTO memo VALUES (?, ?, ?)',
+                               (key, PARSER_VERSION, json.dumps(offer_params, default=str)))
+
+    def prune(self) -> int:
+        """Remove entries of other parser versions
+
+        Returns
+        -------
+        int
+            number of removed entries
+        """
+        if self.index is None:
+            return 0
+        with self.lock, self.index:
+            removed = self.index.execute('DELETE FROM memo WHERE parser_version != ?',
+                                         (PARSER_VERSION,)).rowcount
+        logger.info(f"Removed {removed} memo entries of previous parser versions")
+        return removed
+
+    def close(self):
+        """Close memo file"""
+        if self.index is not None:
+            self.index.close()
@@ -0,0 +1,190 @@
+""" Memory budget of a crawl
+
+Resident memory (RSS) of the process is measured while the crawl runs.
+Offer pages are requested ahead only as far as the memory left in the
+budget allows (estimated from the size of recent pages), and parse trees are
+released as soon as offer parameters are extracted (see `release_tree`), so
+memory use stays flat at any crawl size.
+"""
+
+import gc
+import logging
+import os
+
+import bs4
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Memory of parsed page relative to page body size
+PARSE_FACTOR = 10
+# Fewest pages fetched between garbage collections over budget
+COLLECT_INTERVAL = 20
+
+
+def get_rss() -> float:
+    """Get current resident memory (RSS) of process [MB]
+
+    Returns
+    -------
+    float
+        RSS, peak RSS if current RSS is not available (non-Linux),
+        None if neither is available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return get_peak_rss()
+
+
+def get_peak_rss() -> float:
+    """Get peak resident memory (RSS) of process [MB], None if not available"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10  # kB on Linux
+
+
+def release_tree(wrapper):
+    """Destroy the whole parse tree of a page element
+
+    Trees of BeautifulSoup hold reference cycles (parent - children) and are
+    otherwise freed only when garbage collection runs.
+
+    Parameters
+    ----------
+    wrapper : bs4.element.Tag or lxml.html.HtmlElement
+        element of page (other values are ignored)
+    """
+    if isinstance(wrapper, bs4.element.Tag):
+        while wrapper.parent is not None:
+            wrapper = wrapper.parent
+        # Decomposing the document object alone does not reach its elements
+        for element in list(wrapper.contents):
+            if isinstance(element, bs4.element.Tag):
+                element.decompose()
+            else:
+                element.extract()
+        wrapper.decompose()
+    elif hasattr(wrapper, 'getroottree'):
+        wrapper.getroottree().getroot().clear()
+
+
+class MemoryBudget(object):
+    """ Limit of resident memory (RSS) of crawl, caps pages in flight """
+
+    def __init__(self, limit_mb: float,
+                 max_in_flight: int = 4,
+                 page_mb: float = 2.0):
+        """
+        Parameters
+        ----------
+        limit_mb : float
+            memory budget of process [MB]
+        max_in_flight : int, optional
+            largest number of offer pages requested ahead, by default 4
+        page_mb : float, optional
+            initial estimate of memory of fetched and parsed page [MB],
+            by default 2.0. Updated with size of fetched pages
+
+        Raises
+        ------
+        ValueError
+            if budget is not positive
+        """
+        if limit_mb <= 0:
+            raise ValueError(f'Memory budget must be positive: {limit_mb}')
+        self.limit_mb = limit_mb
+        self.max_in_flight = max_in_flight
+        self.page_mb = page_mb
+        self.start_rss = get_rss()
+        self.peak_rss = self.start_rss
+        self.stats = {'pages': 0, 'throttled': 0, 'collections': 0}
+        self._collected_at = -COLLECT_INTERVAL  # pages fetched at last collection
+        if self.start_rss is not None and self.start_rss >= limit_mb:
+            logger.warning(f"Memory use at start ({self.start_rss:.0f} MB) is over "
+                           f"budget of {limit_mb:.0f} MB")
+
+    def check(self) -> float:
+        """Measure memory use, record peak
+
+        Returns
+        -------
+        float
+            RSS [MB], None if not available
+        """
+        rss = get_rss()
+        if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+            self.peak_rss = rss
+        return rss
+
+    def record_page(self, n_bytes: int):
+        """Update estimate of page memory with size of fetched page
+
+        Parameters
+        ----------
+        n_bytes : int
+            size of page body [bytes]
+        """
+        self.stats['pages'] += 1
+        page_mb = n_bytes * PARSE_FACTOR / 2**20
+        self.page_mb += (page_mb - self.page_mb) / min(self.stats['pages'], 20)  # recent pages
+
+    def get_in_flight_limit(self) -> int:
+        """Get number of pages which can be in flight (fetched, not yet parsed)
+
+        Garbage is collected if memory use is over budget (at most once
+        per `COLLECT_INTERVAL` pages).
+
+        Returns
+        -------
+        int
+            pages that fit in memory left in budget, at least 1
+            and at most `max_in_flight`
+        """
+        rss = self.check()
+        if rss is None:
+            return 1
+        if rss >= self.limit_mb and self.stats['pages'] - self._collected_at >= COLLECT_INTERVAL:
+            gc.collect()
+            self._collected_at = self.stats['pages']
+            self.stats['collections'] += 1
+            rss = self.check()
+        limit = max(1, min(self.max_in_flight, int((self.limit_mb - rss) / self.page_mb)))
+        if limit < self.max_in_flight:
+            self.stats['throttled'] += 1
+        return limit
+
+    def get_report(self) -> dict:
+        """Get memory use of crawl
+
+        Returns
+        -------
+        dict
+            budget, RSS at start, now and at peak [MB], number of
+            fetched pages, throttled requests and garbage collections
+        """
+        rss = self.check()
+        peak_rss = get_peak_rss()  # includes peaks between checks
+        return {'limit_mb': self.limit_mb,
+                'start_rss_mb': self.start_rss,
+                'rss_mb': rss,
+                'peak_rss_mb': max(peak_rss, self.peak_rss) if peak_rss and self.peak_rss
+                else self.peak_rss,
+                **self.stats}
+
+    def log_report(self):
+        """ Log memory use of crawl """
+        report = self.get_report()
+        if report['peak_rss_mb'] is None:
+            logger.info("Memory use not available")
+            return
+        message = (f"Peak memory {report['peak_rss_mb']:.0f} MB of {report['limit_mb']:.0f} MB "
+                   f"budget (now {report['rss_mb']:.0f} MB), {report['pages']} pages, "
+                   f"{report['throttled']} throttled, {report['collections']} collections")
+        if report['peak_rss_mb'] > report['limit_mb']:
+            logger.warning(f"Over budget: {message}")
+        else:
+            logger.info(message)
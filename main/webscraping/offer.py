@@ -1,13 +1,82 @@
 """ Parsing offer pages """
 
+import json
 import logging
 import re
 
 import bs4
 import requests
 
+from main.webscraping.codes import decode_code, decode_number
+from main.webscraping.memory import release_tree
+from main.webscraping.page import get_encoding, parse_soup
+
 logger = logging.getLogger(__name__)
 
+# Script tag with ad data embedded in Otodom offer page (JSON)
+NEXT_DATA_MARKER = 'id="__NEXT_DATA__"'
+# Otodom ad characteristic key -> offer field
+OTODOM_CHARACTERISTICS = {'price_per_m': 'price_meter',
+                          'm': 'area',
+                          'floor_no': 'floor',
+                          'rooms_num': 'nrooms',
+                          'market': 'market',
+                          'building_type': 'building_type'}
+
+
+def get_embedded_json(content: bytes, encoding: str = 'utf-8',
+                      marker: str = NEXT_DATA_MARKER) -> dict:
+    """Get JSON embedded in script tag, without parsing the whole page
+
+    Parameters
+    ----------
+    content : bytes
+        page body
+    encoding : str, optional
+        page encoding, by default utf-8
+    marker : str, optional
+        attribute identifying the script tag, by default Next.js data
+
+    Returns
+    -------
+    dict
+        embedded data, None if not found or not valid JSON
+    """
+    start = content.find(marker.encode('ascii'))
+    if start == -1:
+        return None
+    start = content.find(b'>', start) + 1
+    end = content.find(b'</script>', start)
+    if start == 0 or end == -1:
+        return None
+    try:
+        return json.loads(content[start:end].decode(encoding))
+    except ValueError:
+        return None
+
+
+def get_otodom_params(offer_response: requests.models.Response) -> dict:
+    """Get raw text of offer parameters from ad data embedded in Otodom page
+
+    Parameters
+    ----------
+    offer_response : requests.models.Response
+        response from Otodom offer website
+
+    Returns
+    -------
+    dict
+        offer field -> parameter value as shown on offer page,
+        None if page has no embedded ad data
+    """
+    try:
+        ad_data = get_embedded_json(offer_response.content, get_encoding(offer_response))
+        characteristics = ad_data['props']['pageProps']['ad']['characteristics']
+    except (KeyError, TypeError):
+        return None
+    return {OTODOM_CHARACTERISTICS[c['key']]: c.get('localizedValue') or c.get('value')
+            for c in characteristics if c.get('key') in OTODOM_CHARACTERISTICS}
+
 
 def get_offer(domain: str, offer_response: requests.models.Response) -> bs4.element.Tag:
     """Get offer wrapper (HTML) from offer page
@@ -22,7 +91,8 @@ def get_offer(domain: str, offer_response: requests.models.Response) -> bs4.elem
     Returns
     -------
     bs4.element.Tag
-        raw offer data
+        raw offer data (for Otodom dict of raw parameter values
+        if ad data is embedded in page)
 
     Raises
     ------
@@ -30,12 +100,13 @@ def get_offer(domain: str, offer_response: requests.models.Response) -> bs4.elem
         if unsupported domain specified
     """
     if domain == 'www.olx.pl':
-        offer_wrapper = bs4.BeautifulSoup(offer_response.text, 'lxml').find(
+        offer_wrapper = parse_soup(offer_response).find(
             'div', {'class': 'offerdescription clr',
                     'id': 'offerdescription'})
     elif domain == 'www.otodom.pl':
-        offer_wrapper = bs4.BeautifulSoup(
-            offer_response.text, 'lxml').find('article')
+        offer_wrapper = get_otodom_params(offer_response)
+        if offer_wrapper is None:
+            offer_wrapper = parse_soup(offer_response).find('article')
     else:
         raise ValueError('Incorrect domain name')
     return offer_wrapper
@@ -44,106 +115,91 @@ def get_offer(domain: str, offer_response: requests.models.Response) -> bs4.elem
 class Offer(object):
     """ Flat offer - parent class """
 
-    def __init__(self, offer_wrapper: bs4.element.Tag):
+    DOMAIN = None
+    # Offer field -> parameter name on offer page (set by child class)
+    PARAM_NAMES = {}
+
+    def __init__(self, offer_wrapper: bs4.element.Tag, raw: bool = False):
         self.offer_wrapper = offer_wrapper
+        self.raw = raw  # keep raw parameter text instead of encoded values
         self.offer_params = {}
 
     def get_offer_params(self):
         """ Get parameters of offer if found """
-        try:
-            self.offer_params['price_meter'] = self._get_offer_price_meter()
-        except Exception as e:
-            logger.exception(e)
-            logger.error(f"Parameter `price_meter` not found")
-
-        try:
-            self.offer_params['area'] = self._get_offer_area()
-        except Exception as e:
-            logger.exception(e)
-            logger.error(f"Parameter `area` not found")
-
-        try:
-            self.offer_params['furniture'] = self._get_offer_furniture()
-        except Exception as e:
-            logger.exception(e)
-            logger.error(f"Parameter `furniture` not found")
-
-        try:
-            self.offer_params['owner'] = self._get_offer_owner()
-        except Exception as e:
-            logger.exception(e)
-            logger.error(f"Parameter `owner` not found")
-
-        try:
-            self.offer_params['floor'] = self._get_offer_floor()
-        except Exception as e:
-            logger.exception(e)
-            logger.error(f"Parameter `floor` not found")
-
-        try:
-            self.offer_params['nrooms'] = self._get_offer_nrooms()
-        except Exception as e:
-            logger.exception(e)
-            logger.error(f"Parameter `nrooms` not found")
-
-        try:
-            self.offer_params['market'] = self._get_offer_market()
-        except Exception as e:
-            logger.exception(e)
-            logger.error(f"Parameter `market` not found")
-
-        try:
-            self.offer_params['building_type'] = self._get_offer_buildtype()
-        except Exception as e:
-            logger.exception(e)
-            logger.error(f"Parameter `building_type` not found")
-
-    # Methods overwritten by child class
-    def _get_offer_price_meter(self):
-        return None
-
-    def _get_offer_area(self):
-        return None
+        param_getters = {'price_meter': self._get_offer_price_meter,
+                         'area': self._get_offer_area,
+                         'furniture': self._get_offer_furniture,
+                         'owner': self._get_offer_owner,
+                         'floor': self._get_offer_floor,
+                         'nrooms': self._get_offer_nrooms,
+                         'market': self._get_offer_market,
+                         'building_type': self._get_offer_buildtype}
+        for param, getter in param_getters.items():
+            try:
+                if self.raw:
+                    self.offer_params[param] = self._get_raw_value(param)
+                else:
+                    self.offer_params[param] = getter()
+            except Exception as e:
+                logger.exception(e)
+                logger.error(f"Parameter `{param}` not found")
+
+    def release(self):
+        """ Destroy parse tree of offer page, keep parameters found """
+        release_tree(self.offer_wrapper)
+        self.offer_wrapper = None
+
+    def _get_raw_value(self, param: str) -> str:
+        """Get raw text of offer parameter
 
-    def _get_offer_furniture(self):
-        return None
-
-    def _get_offer_owner(self):
-        return None
-
-    def _get_offer_floor(self):
-        return None
+        Parameters
+        ----------
+        param : str
+            offer field e.g. floor
 
-    def _get_offer_nrooms(self):
-        return None
+        Returns
+        -------
+        str
+            parameter value as shown on offer page,
+            None if parameter is not published by the domain
+        """
+        if param not in self.PARAM_NAMES:
+            return None
+        return self._get_param_value(self.PARAM_NAMES[param])
 
-    def _get_offer_market(self):
-        return None
+    def _get_param_value(self, par_name: str) -> str:
+        return None  # Overwritten by child class
 
-    def _get_offer_buildtype(self):
-        return None
+    def _get_number(self, param: str) -> float:
+        """Get numeric offer parameter
 
+        Parameters
+        ----------
+        param : str
+            offer field e.g. area
 
-class OLXOffer(Offer):
-    """ Flat offer for OLX """
+        Returns
+        -------
+        float
+            decoded number, None if not published
+        """
+        raw_value = self._get_raw_value(param)
+        return decode_number(raw_value) if raw_value is not None else None
 
-    def _get_param_value(self, par_name: str) -> str:
-        """Find parameter value based on its name
+    def _get_code(self, param: str) -> str:
+        """Get encoded offer parameter
 
         Parameters
         ----------
-        par_name : str
-            Offer parameter name
+        param : str
+            offer field e.g. floor
 
         Returns
         -------
         str
-            parameter value for given offer
+            encoded value, None if not published
         """
-        par_value = self.offer_wrapper.find(
-            'span', class_="offer-details__name", text=par_name)\
-                .find_next_sibling().text.strip()
-        return par_value
+        return decode_code(self.DOMAIN, param, self._get_raw_value(param))
 
     def _get_offer_price_meter(self):
         """Get price per square meter
@@ -153,11 +209,7 @@ class OLXOffer(Offer):
         float
             price per square meter
         """
-        offer_price_meter = self._get_param_value(
-            'Cena za m\u00B2')
-        offer_price_meter_float = float(
-            re.sub(r'[^\d\.]', '', offer_price_meter))
-        return offer_price_meter_float
+        return self._get_number('price_meter')
 
     def _get_offer_area(self):
         """Get area
@@ -167,10 +219,7 @@ class OLXOffer(Offer):
         float
             flat area (square meter)
         """
-        offer_area = self._get_param_value('Powierzchnia')
-        offer_area_float = float(
-            re.sub(r'[^\d\.]', '', offer_area.replace(',', '.')))
-        return offer_area_float
+        return self._get_number('area')
 
     def _get_offer_furniture(self):
         """Get flag for furniture
@@ -180,9 +229,7 @@ class OLXOffer(Offer):
         str
             Furniture flag - Yes (with) / No (without)
         """
-        offer_furniture = self._get_param_value('Umeblowane')
-        offer_furniture_flag = 1 if offer_furniture == 'Yes' else 'No'
-        return offer_furniture_flag
+        return self._get_code('furniture')
 
     def _get_offer_owner(self):
         """Get offer owner type
@@ -192,9 +239,7 @@ class OLXOffer(Offer):
         str
             offer owner (private/business)
         """
-        offer_owner = self._get_param_value('Oferta od')
-        offer_owner_encoded = 'Private' if offer_owner == 'Osoby prywatnej' else 'Business'
-        return offer_owner_encoded
+        return self._get_code('owner')
 
     def _get_offer_floor(self):
         """Get floor number
@@ -204,16 +249,7 @@ class OLXOffer(Offer):
         str
             Floor number
         """
-        offer_floor = self._get_param_value('Poziom')
-        if offer_floor == 'Suterena':
-            offer_floor_encoded = '-1'
-        elif offer_floor == 'Parter':
-            offer_floor_encoded = '0'
-        elif offer_floor == 'Powyżej 10':
-            offer_floor_encoded = '>10'
-        else:
-            offer_floor_encoded = offer_floor
-        return offer_floor_encoded
+        return self._get_code('floor')
 
     def _get_offer_nrooms(self):
         """Get number of rooms
@@ -223,18 +259,7 @@ class OLXOffer(Offer):
         str
             number of rooms in the flat
         """
-        nrooms = self._get_param_value('Liczba pokoi')
-        if nrooms == '1 pokój':
-            nrooms_encoded = '1'
-        elif nrooms == '2 pokoje':
-            nrooms_encoded = '2'
-        elif nrooms == '3 pokoje':
-            nrooms_encoded = '3'
-        elif nrooms == '4 i więcej':
-            nrooms_encoded = '>3'
-        else:
-            nrooms_encoded = nrooms
-        return nrooms_encoded
+        return self._get_code('nrooms')
 
     def _get_offer_market(self):
         """Get market
@@ -244,9 +269,7 @@ class OLXOffer(Offer):
         str
             Market (primary/secondary)
         """
-        market = self._get_param_value('Rynek')
-        market_encoded = 'Primary' if market == 'Pierwotny' else 'Secondary'
-        return market_encoded
+        return self._get_code('market')
 
     def _get_offer_buildtype(self):
         """Get building type
@@ -256,37 +279,21 @@ class OLXOffer(Offer):
         str
             building type
         """
-        building_type = self._get_param_value('Rodzaj zabudowy')
-        if building_type == 'Blok':
-            building_type_encoded = 'Block'
-        elif building_type == 'Kamienica':
-            building_type_encoded = 'Tenement'
-        elif building_type == 'Apartamentowiec':
-            building_type_encoded = 'Apartment'
-        elif building_type is not None:
-            building_type_encoded = 'Other'
-        else:
-            building_type_encoded = building_type
-        return building_type_encoded
+        return self._get_code('building_type')
 
 
-class OtodomOffer(Offer):
-    """ Flat offer for Otodom """
-
-    def _get_offer_price_meter(self):
-        """Get price per square meter
+class OLXOffer(Offer):
+    """ Flat offer for OLX """
 
-        Returns
-        -------
-        float
-            price per square meter
-        """
-        offer_price_meter = self.offer_wrapper.find_all(
-            lambda tag: tag.name == 'div' and re.search(
-                re.compile(r'\d+ z\u0142/m'), tag.text))[-1].text
-        offer_price_meter_float = float(
-            re.sub(r'[^\d\.]', '', offer_price_meter))
-        return offer_price_meter_float
+    DOMAIN = 'www.olx.pl'
+    PARAM_NAMES = {'price_meter': 'Cena za m\u00B2',
+                   'area': 'Powierzchnia',
+                   'furniture': 'Umeblowane',
+                   'owner': 'Oferta od',
+                   'floor': 'Poziom',
+                   'nrooms': 'Liczba pokoi',
+                   'market': 'Rynek',
+                   'building_type': 'Rodzaj zabudowy'}
 
     def _get_param_value(self, par_name: str) -> str:
         """Find parameter value based on its name
@@ -301,86 +308,66 @@ class OtodomOffer(Offer):
         str
             parameter value for given offer
         """
-        param_table = self.offer_wrapper.find(
-            'section', {'class': 'section-overview'})  # Table with parameters
-        par_pattern = re.compile(fr'{par_name}')
-        par_value = param_table.find(
-            lambda tag: tag.name == 'li' and re.search(
-                par_pattern, tag.text)).text
-        par_value = re.sub(par_name, '', par_value).replace(':', '').strip()
+        par_value = self.offer_wrapper.find(
+            'span', class_="offer-details__name", text=par_name)\
+                .find_next_sibling().text.strip()
         return par_value
 
-    def _get_offer_area(self):
-        """Get area
 
-        Returns
-        -------
-        float
-            flat area (square meter)
-        """
-        offer_area = self._get_param_value('Powierzchnia')
-        offer_area_float = float(
-            re.sub(r'[^\d\.]', '', offer_area.replace(',', '.')))
-        return offer_area_float
-
-    def _get_offer_market(self):
-        """Get market
+class OtodomOffer(Offer):
+    """ Flat offer for Otodom
 
-        Returns
-        -------
-        str
-            Market (primary/secondary)
-        """
-        market = self._get_param_value('Rynek')
-        market_encoded = 'Primary' if 'pierwotny' in market else 'Secondary'
-        return market_encoded
+    Parameters are read from ad data embedded in page (dict of raw values,
+    see `get_otodom_params`), or from page HTML for pages without it.
+    """
 
-    def _get_offer_nrooms(self):
-        """Get number of rooms
+    DOMAIN = 'www.otodom.pl'
+    PARAM_NAMES = {'area': 'Powierzchnia',
+                   'floor': 'Piętro',
+                   'nrooms': 'Liczba pokoi',
+                   'market': 'Rynek',
+                   'building_type': 'Rodzaj zabudowy'}
 
-        Returns
-        -------
-        str
-            number of rooms in the flat
-        """
-        nrooms = self._get_param_value('Liczba pokoi')
-        nrooms_encoded = re.sub(r'[^\d\.]', '', nrooms)
-        return nrooms_encoded
+    def _get_raw_value(self, param: str) -> str:
+        """Get raw text of offer parameter
 
-    def _get_offer_floor(self):
-        """Get floor number
+        Parameters
+        ----------
+        param : str
+            offer field e.g. floor
 
         Returns
         -------
         str
-            Floor number
+            parameter value as shown on offer page
         """
-        floor = self._get_param_value('Piętro')
-        if floor == 'parter':
-            floor_encoded = '0'
-        elif floor == '> 10':
-            floor_encoded = '>10'
-        else:
-            floor_encoded = floor
-        return floor_encoded
+        if isinstance(self.offer_wrapper, dict):
+            return self.offer_wrapper.get(param)
+        if param == 'price_meter':
+            # Price per square meter is shown outside of parameter table
+            return self.offer_wrapper.find_all(
+                lambda tag: tag.name == 'div' and re.search(
+                    re.compile(r'\d+ z\u0142/m'), tag.text))[-1].text
+        return super()._get_raw_value(param)
 
-    def _get_offer_buildtype(self):
-        """Get building type
+    def _get_param_value(self, par_name: str) -> str:
+        """Find parameter value based on its name
+
+        Parameters
+        ----------
+        par_name : str
+            Offer parameter name
 
         Returns
         -------
         str
-            building type
+            parameter value for given offer
         """
-        building_type = self._get_param_value('Rodzaj zabudowy')
-        if building_type == 'blok':
-            building_type_encoded = 'Block'
-        elif building_type == 'kamienica':
-            building_type_encoded = 'Tenement'
-        elif building_type == 'apartamentowiec':
-            building_type_encoded = 'Apartment'
-        elif building_type is not None:
-            building_type_encoded = 'Other'
-        else:
-            building_type_encoded = building_type
-        return building_type_encoded
+        param_table = self.offer_wrapper.find(
+            'section', {'class': 'section-overview'})  # Table with parameters
+        par_pattern = re.compile(fr'{par_name}')
+        par_value = param_table.find(
+            lambda tag: tag.name == 'li' and re.search(
+                par_pattern, tag.text)).text
+        par_value = re.sub(par_name, '', par_value).replace(':', '').strip()
+        return par_value
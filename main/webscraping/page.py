@@ -0,0 +1,99 @@
+""" Reading fetched pages from response bytes
+
+Page encoding is taken from the Content-Type header or the meta tag of the
+page (never guessed from content), and page bytes are passed to the parser
+directly, without a decoded copy of the page.
+"""
+
+import re
+
+import bs4
+import requests
+from lxml import html
+
+DEFAULT_ENCODING = 'utf-8'
+
+CHARSET_PATTERN = re.compile(r'charset=["\']?([\w-]+)', re.IGNORECASE)
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+META_SCAN_BYTES = 4096  # meta tag is searched at the start of page
+
+_parsers = {}  # encoding -> lxml HTML parser
+
+
+def get_encoding(response: requests.models.Response) -> str:
+    """Get page encoding declared by server or page
+
+    Parameters
+    ----------
+    response : requests.models.Response
+        response from website (or archived page)
+
+    Returns
+    -------
+    str
+        charset of Content-Type header, else charset of meta tag,
+        else encoding of archived response, by default utf-8
+    """
+    content_type = getattr(response, 'headers', {}).get('content-type', '')
+    charset = CHARSET_PATTERN.search(content_type)
+    if charset:
+        return charset.group(1)
+    charset = META_CHARSET_PATTERN.search(response.content[:META_SCAN_BYTES])
+    if charset:
+        return charset.group(1).decode('ascii')
+    if not hasattr(response, 'headers') and response.encoding:
+        return response.encoding  # archived page (encoding of original response)
+    return DEFAULT_ENCODING
+
+
+def parse_html(response: requests.models.Response) -> html.HtmlElement:
+    """Get lxml tree of page
+
+    Parameters
+    ----------
+    response : requests.models.Response
+        response from website
+
+    Returns
+    -------
+    lxml.html.HtmlElement
+        page root element
+    """
+    encoding = get_encoding(response)
+    if encoding not in _parsers:
+        _parsers[encoding] = html.HTMLParser(encoding=encoding)
+    return html.fromstring(response.content, parser=_parsers[encoding])
+
+
+def parse_soup(response: requests.models.Response) -> bs4.BeautifulSoup:
+    """Get BeautifulSoup of page
+
+    Parameters
+    ----------
+    response : requests.models.Response
+        response from website
+
+    Returns
+    -------
+    bs4.BeautifulSoup
+        parsed page
+    """
+    return bs4.BeautifulSoup(response.content, 'lxml', from_encoding=get_encoding(response))
+
+
+def contains_text(response: requests.models.Response, text: str) -> bool:
+    """Check if page contains text, without decoding the page
+
+    Parameters
+    ----------
+    response : requests.models.Response
+        response from website
+    text : str
+        searched text
+
+    Returns
+    -------
+    bool
+        True if text is found in page body
+    """
+    return text.encode(get_encoding(response), errors='xmlcharrefreplace') in response.content
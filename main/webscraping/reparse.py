@@ -0,0 +1,181 @@
+""" Re-parse archived pages without network requests
+
+Listing pages of selected runs are parsed again (ads and their offers)
+in a pool of worker processes and saved in the export format of the scraper.
+
+Usage:
+    python -m main.webscraping.reparse <archive_dir> <data_file>
+        [--format json|parquet] [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+        [--raw] [--processes N] [--memo MEMO_FILE]
+"""
+
+import argparse
+import logging
+from collections import defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date
+from itertools import repeat
+from pathlib import Path
+
+from main.webscraping.ad import OLXAd
+from main.webscraping.archive import ArchivedResponse, PageArchive
+from main.webscraping.memo import ParseMemo
+from main.webscraping.scraper import OLXScraper, Scraper
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Archive and memo opened in worker process (path -> PageArchive/ParseMemo)
+_worker_archives = {}
+_worker_memos = {}
+
+
+class ArchiveScraper(Scraper):
+    """ Flat scraper reading pages of a past run from archive """
+
+    def __init__(self, archive: PageArchive, run_date: str,
+                 raw: bool = False,
+                 base_url: str = OLXScraper.BASE_URL):
+        """
+        Parameters
+        ----------
+        archive : PageArchive
+            archive with fetched pages
+        run_date : str
+            date of archived scraping run (YYYY-MM-DD)
+        raw : bool, optional
+            capture raw text of offer parameters, by default False
+        base_url : str, optional
+            URL of searched listing, by default OLX flat sale offers
+        """
+        super().__init__(base_url)
+        self.archive = archive
+        self.run_date = date.fromisoformat(str(run_date))
+        self.raw = raw
+        self.ad_processor = OLXAd
+
+    def _fetch(self, url: str, kind: str, params: dict = None,
+               pending: Future = None) -> ArchivedResponse:
+        """Get page fetched in archived run (None if not archived)"""
+        if pending is not None:
+            return pending.result()
+        return self.archive.find_page(url, kind, self.run_date)
+
+
+def reparse_listing(archive_dir: str, page_id: int, run_date: str,
+                    raw: bool = False,
+                    memo_file: str = None) -> list:
+    """Parse archived listing page and offers of its ads (run in worker process)
+
+    Parameters
+    ----------
+    archive_dir : str
+        archive directory
+    page_id : int
+        id of listing page
+    run_date : str
+        date of scraping run (YYYY-MM-DD)
+    raw : bool, optional
+        capture raw text of offer parameters, by default False
+    memo_file : str, optional
+        memo of parsed offer parameters, by default None
+
+    Returns
+    -------
+    list
+        offer parameters
+    """
+    if archive_dir not in _worker_archives:
+        _worker_archives[archive_dir] = PageArchive(archive_dir)
+    archive = _worker_archives[archive_dir]
+    scraper = ArchiveScraper(archive, run_date, raw=raw)
+    if memo_file:
+        if memo_file not in _worker_memos:
+            _worker_memos[memo_file] = ParseMemo(memo_file)
+        scraper.memo = _worker_memos[memo_file]
+    site = archive.get_page(page_id)
+    if site is None or scraper.check_url(site) == 0:
+        return []
+    scraper._scrape_listing(site)
+    return scraper.offer_data
+
+
+def reparse_archive(archive_dir: str, data_file: str,
+                    file_format: str = 'json',
+                    run_date_from: str = None,
+                    run_date_to: str = None,
+                    raw: bool = False,
+                    processes: int = None,
+                    memo_file: str = None) -> dict:
+    """Parse archived runs again and save offer data
+
+    Parameters
+    ----------
+    archive_dir : str
+        archive directory
+    data_file : str
+        json file (one file per run, named <stem>_<run date>.json)
+        or parquet dataset directory
+    file_format : str, optional
+        output format - json or parquet, by default 'json'
+    run_date_from : str, optional
+        first run date (YYYY-MM-DD), by default None
+    run_date_to : str, optional
+        last run date (YYYY-MM-DD), by default None
+    raw : bool, optional
+        capture raw text of offer parameters, by default False
+    processes : int, optional
+        number of worker processes, by default number of CPUs
+    memo_file : str, optional
+        memo of parsed offer parameters, by default None. Offer pages
+        repeated across runs are parsed once per parser version
+
+    Returns
+    -------
+    dict
+        run date -> number of offers
+    """
+    archive_dir = str(Path(archive_dir).resolve())
+    pages = PageArchive(archive_dir).get_pages('listing', run_date_from, run_date_to)
+    logger.info(f"Re-parsing {len(pages)} listing pages from: {archive_dir}")
+
+    offer_data = defaultdict(list)  # run date -> offer parameters
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = executor.map(reparse_listing, repeat(archive_dir),
+                               [p[0] for p in pages], [p[1] for p in pages],
+                               repeat(raw), repeat(memo_file))
+        for (_, run_date), offers in zip(pages, results):
+            offer_data[run_date].extend(offers)
+
+    data_file = Path(data_file)
+    data_file.parent.mkdir(parents=True, exist_ok=True)
+    for run_date, offers in sorted(offer_data.items()):
+        exporter = ArchiveScraper(None, run_date, raw=raw)
+        exporter.offer_data = offers
+        exporter.export_data(data_file if file_format == 'parquet' else
+                             data_file.with_name(f"{data_file.stem}_{run_date}{data_file.suffix}"),
+                             file_format)
+    return {run_date: len(offers) for run_date, offers in sorted(offer_data.items())}
+
+
+if __name__ == '__main__':
+    # Workers need functions importable from the module (not __main__)
+    from main.webscraping.reparse import reparse_archive
+    from utils.logging_config import get_log_config
+
+    parser = argparse.ArgumentParser(description='Re-parse archived pages into offer data')
+    parser.add_argument('archive_dir', help='archive directory')
+    parser.add_argument('data_file', help='output json file or parquet dataset directory')
+    parser.add_argument('--format', default='json', choices=['json', 'parquet'],
+                        help='output format')
+    parser.add_argument('--from', dest='run_date_from', help='first run date (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='run_date_to', help='last run date (YYYY-MM-DD)')
+    parser.add_argument('--raw', action='store_true', help='capture raw text of offer parameters')
+    parser.add_argument('--processes', type=int, help='number of worker processes')
+    parser.add_argument('--memo', dest='memo_file', help='memo file of parsed offer parameters')
+    args = parser.parse_args()
+
+    get_log_config("logging.json")
+    reparse_archive(args.archive_dir, args.data_file, args.format,
+                    args.run_date_from, args.run_date_to, args.raw, args.processes,
+                    args.memo_file)
@@ -1,22 +1,40 @@
 """ Flat scraper """
 
+import asyncio
 import json
 import logging
 import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime
 from pathlib import Path
 from pprint import pformat
 from urllib.parse import urlparse
 
-import bs4
 import requests
 
+from main.analysis.sketch import PriceStats
+from main.schema import OFFER_FIELDS, PARTITION_FIELDS, coerce_value, get_arrow_schema
 from main.webscraping.ad import OLXAd, get_ads
+from main.webscraping.archive import PageArchive
 from main.webscraping.filter import OLXFilter
+from main.webscraping.frontier import (LISTING, OFFER, CrawlBudget, CrawlFrontier,
+                                       get_ad_priority, get_criteria, get_listing_priority)
+from main.webscraping.hedge import HedgedFetcher
+from main.webscraping.memo import ParseMemo
+from main.webscraping.memory import MemoryBudget
+from main.webscraping.watch import AdaptivePoller, get_ad_key
 from main.webscraping.offer import OLXOffer, OtodomOffer, get_offer
+from main.webscraping.page import contains_text
 
 # Logger
 logger = logging.getLogger(__name__)
 
+# Text of listing page without ads
+NO_ADS_TEXT = "Nie znaleźliśmy ogłoszeń dla tego zapytania."
+
 
 class Scraper(object):
     """ Flat scraper - parent class """
@@ -28,10 +46,229 @@ class Scraper(object):
                             fr"^{self.base_url}\?page=\d+$"]  # ULRs to skip
 
         self.offer_data = []  # store offer parameters
+        self.raw = False  # offer parameters captured as raw text
+        self.live_stats = PriceStats()  # price statistics updated during run
+        self.run_date = date.today()  # date of scraping run
+
+        self.archive = None  # archive of fetched pages
+        self.memo = None  # parsed offer parameters by page content
+        self.ad_processor = None  # advertisement parser
+        self.fetcher = None  # hedged fetcher of offer pages
+        self.memory_budget = None  # memory limit of crawl
 
         self.offer_processors = {'www.olx.pl': OLXOffer,
                                  'www.otodom.pl': OtodomOffer}
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Stop threads of hedged fetcher"""
+        if self.fetcher is not None:
+            self.fetcher.close()
+
+    def _request(self, url: str, kind: str, params: dict = None) -> requests.models.Response:
+        """Send request for page (can run in worker thread)
+
+        Parameters
+        ----------
+        url : str
+            page URL
+        kind : str
+            page kind (listing/offer)
+        params : dict, optional
+            URL query parameters, by default None
+
+        Returns
+        -------
+        requests.models.Response
+            response from website, None if offer page was not received
+            before deadline of fetcher
+        """
+        if kind == 'offer' and self.fetcher is not None:
+            return self.fetcher.fetch(url)
+        return requests.get(url, params=params)
+
+    def _fetch(self, url: str, kind: str, params: dict = None,
+               pending: Future = None) -> requests.models.Response:
+        """Get page, store it in archive if set
+
+        Parameters
+        ----------
+        url : str
+            page URL
+        kind : str
+            page kind (listing/offer)
+        params : dict, optional
+            URL query parameters, by default None
+        pending : Future, optional
+            request sent ahead (see `_request`), by default request is sent now
+
+        Returns
+        -------
+        requests.models.Response
+            response from website, None if offer page was not received
+            before deadline of fetcher
+        """
+        site = pending.result() if pending is not None else self._request(url, kind, params)
+        if site is None:
+            return None
+        if self.memory_budget is not None:
+            self.memory_budget.record_page(len(site.content))
+        if self.archive is not None:
+            self.archive.store(site, kind, self.run_date,
+                               url=url if params is None else None)
+        return site
+
+    def _scrape_listing(self, site: requests.models.Response):
+        """Collect parameters of all ads (and their offers) from listing page
+
+        Parameters
+        ----------
+        site : requests.models.Response
+            response from page with advertisements
+        """
+        for offer_pars in self._iter_ads(get_ads(self.domain, site)):
+            self.offer_data.append(offer_pars)
+
+    def _iter_ads(self, ads: list):
+        """Get parameters of ads (and their offers) one by one
+
+        Parameters
+        ----------
+        ads : list
+            raw values of advertisements from listing page (see `get_ads`)
+
+        Yields
+        ------
+        dict
+            offer parameters
+        """
+        if self.memory_budget is not None:
+            yield from self._iter_ads_ahead(ads)
+            return
+        for a in ads:
+            offer_pars = self._scrape_ad(a)
+            self.live_stats.update(offer_pars)
+            yield offer_pars
+
+    def _iter_ads_ahead(self, ads: list):
+        """Get parameters of ads (and their offers) one by one, offer pages
+        are requested ahead as far as the memory budget allows
+
+        Parameters
+        ----------
+        ads : list
+            raw values of advertisements from listing page (see `get_ads`)
+
+        Yields
+        ------
+        dict
+            offer parameters (in order of ads)
+        """
+        ad_params = deque(self._parse_ad(a) for a in ads)
+        pending = deque()  # (ad parameters, offer page request) in flight
+        with ThreadPoolExecutor(self.memory_budget.max_in_flight) as executor:
+            while ad_params or pending:
+                if ad_params and len(pending) < self.memory_budget.get_in_flight_limit():
+                    offer_pars = ad_params.popleft()
+                    pending.append((offer_pars, executor.submit(
+                        self._request, offer_pars['link'], 'offer')))
+                    continue
+                offer_pars = self._scrape_offer(*pending.popleft())
+                self.live_stats.update(offer_pars)
+                yield offer_pars
+
+    def _scrape_ad(self, ad_wrapper: dict) -> dict:
+        """Get parameters of advertisement and its offer
+
+        Parameters
+        ----------
+        ad_wrapper : dict
+            raw values of advertisement fields (see `get_ads`)
+
+        Returns
+        -------
+        dict
+            offer parameters
+        """
+        return self._scrape_offer(self._parse_ad(ad_wrapper))
+
+    def _parse_ad(self, ad_wrapper: dict) -> dict:
+        """Get parameters of advertisement (from listing page)
+
+        Parameters
+        ----------
+        ad_wrapper : dict
+            raw values of advertisement fields (see `get_ads`)
+
+        Returns
+        -------
+        dict
+            advertisement parameters
+        """
+        # Get ad processor
+        ad_processor = self.ad_processor(ad_wrapper, raw=self.raw, captured=self.run_date)
+        ad_processor.get_ad_params()  # Get parameters for the advertisement
+        offer_pars = ad_processor.ad_params
+        if self.raw:
+            offer_pars['captured'] = self.run_date
+        return offer_pars
+
+    def _scrape_offer(self, offer_pars: dict, pending: Future = None) -> dict:
+        """Get parameters of offer
+
+        Parameters
+        ----------
+        offer_pars : dict
+            advertisement parameters (updated with offer parameters)
+        pending : Future, optional
+            offer page requested ahead, by default page is requested now
+
+        Returns
+        -------
+        dict
+            offer parameters (listing_only flag set if offer page
+            is not available)
+        """
+        # Access offer site
+        offer_site = self._fetch(offer_pars['link'], 'offer', pending=pending)
+        if offer_site is None:
+            logger.warning(f"Offer page not available: {offer_pars['link']}")
+            offer_pars['listing_only'] = True
+            return offer_pars
+        logger.info(
+            f"Scraping flat offer from: {offer_site.url}")
+        # Skip parsing of pages already parsed by current parser version
+        memo_key = None
+        if self.memo is not None:
+            memo_key = self.memo.get_key(offer_pars['domain'], offer_site.content, self.raw)
+            memo_params = self.memo.get(memo_key)
+            if memo_params is not None:
+                offer_pars.update(memo_params)
+                logger.debug(offer_pars)
+                return offer_pars
+        try:
+            offer_wrapper = get_offer(
+                offer_pars['domain'], offer_site)
+            del offer_site  # release page body, offer is parsed from wrapper
+            offer_processor = self.offer_processors[offer_pars['domain']]
+            offer = offer_processor(offer_wrapper, raw=self.raw)
+            del offer_wrapper
+            offer.get_offer_params()  # Get parameters for the offer
+            offer.release()  # destroy parse tree, parameters are plain values
+            # Collect all found parameters
+            offer_pars.update(offer.offer_params)
+            if memo_key is not None:
+                self.memo.set(memo_key, offer.offer_params)
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+        logger.debug(offer_pars)
+        return offer_pars
+
     def check_url(self, site: requests.models.Response) -> int:
         """Check if site contains valid ads
 
@@ -48,8 +285,7 @@ class Scraper(object):
         valid_flag = 1
 
         # check content
-        if bs4.BeautifulSoup(site.text, 'lxml').find(
-                text="Nie znaleźliśmy ogłoszeń dla tego zapytania."):
+        if contains_text(site, NO_ADS_TEXT):
             valid_flag = 0
             return valid_flag
 
@@ -60,44 +296,203 @@ class Scraper(object):
                 break
         return valid_flag
 
-    def export_data(self, data_file: str):
-        """Save collected offer data into .json file
+    def export_data(self, data_file: str, file_format: str = 'json',
+                    offers=None, batch_size: int = 1000) -> int:
+        """Save offer data into file
+
+        Offers are written as they come, so an iterator of offers
+        (e.g. `OLXScraper.iter_offers()`) is saved during the crawl
+        without keeping all offers in memory.
 
         Parameters
         ----------
         data_file : str
-            path to json file where offer data will be saved
+            path to json file (or dataset directory for parquet)
+            where offer data will be saved
+        file_format : str, optional
+            output format - json or parquet, by default 'json'.
+            Parquet data is partitioned by run date and district.
+        offers : iterable, optional
+            offer parameters to save, by default collected offer data
+        batch_size : int, optional
+            number of offers written to parquet at once, by default 1000
+
+        Returns
+        -------
+        int
+            number of saved offers
+
+        Raises
+        ------
+        ValueError
+            if unsupported file format specified
+            or raw data is exported to parquet
         """
-        with open(data_file, 'w', encoding='utf-8') as f:
-            json.dump(self.offer_data, f, indent=4,
-                      default=str, sort_keys=True)
+        offers = self.offer_data if offers is None else offers
+        if file_format == 'json':
+            n_offers = self._export_json(data_file, offers)
+        elif file_format == 'parquet':
+            if self.raw:
+                raise ValueError(
+                    'Raw offer data has to be normalized before parquet export')
+            n_offers = self._export_parquet(data_file, offers, batch_size)
+        else:
+            raise ValueError('Incorrect file format')
         logger.info(
-            f"Offer data has been saved into file: {Path(data_file).resolve()}")
+            f"{n_offers} offers have been saved into file: {Path(data_file).resolve()}")
+        return n_offers
+
+    @staticmethod
+    def _export_json(data_file: str, offers) -> int:
+        """Save offers into json file (list of offers), one offer at a time
+
+        Parameters
+        ----------
+        data_file : str
+            path to json file
+        offers : iterable
+            offer parameters
+
+        Returns
+        -------
+        int
+            number of saved offers
+        """
+        n_offers = 0
+        with open(data_file, 'w', encoding='utf-8') as f:
+            for offer_pars in offers:
+                offer_json = json.dumps(offer_pars, indent=4, default=str, sort_keys=True)
+                f.write(',\n' if n_offers else '[\n')
+                f.write('\n'.join('    ' + line for line in offer_json.split('\n')))
+                n_offers += 1
+            f.write('\n]' if n_offers else '[]')
+        return n_offers
+
+    def _export_parquet(self, data_dir: str, offers, batch_size: int = 1000) -> int:
+        """Save offers into partitioned parquet dataset, in batches
+
+        Parameters
+        ----------
+        data_dir : str
+            path to dataset directory, partitions are written as
+            run_date=<date>/district=<district>/ subdirectories
+        offers : iterable
+            offer parameters
+        batch_size : int, optional
+            number of offers written at once, by default 1000
+
+        Returns
+        -------
+        int
+            number of saved offers (no run partition is written
+            if there are no offers)
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = get_arrow_schema().append(pa.field('run_date', pa.string()))
+
+        def write_batch(batch: list):
+            columns = {f: [coerce_value(f, o.get(f)) for o in batch]
+                       for f in OFFER_FIELDS}
+            columns['run_date'] = [self.run_date.isoformat()] * len(batch)
+            table = pa.Table.from_pydict(columns, schema=schema)
+            pq.write_to_dataset(table, root_path=str(data_dir),
+                                partition_cols=PARTITION_FIELDS)
+
+        n_offers = 0
+        batch = []
+        for offer_pars in offers:
+            batch.append(offer_pars)
+            if len(batch) == batch_size:
+                write_batch(batch)
+                n_offers += len(batch)
+                batch = []
+        if batch:
+            write_batch(batch)
+            n_offers += len(batch)
+        if not n_offers:
+            # No partition is written, so an empty run is not listed as a run
+            logger.warning(f"No offers to save, dataset not changed: {Path(data_dir).resolve()}")
+        return n_offers
 
 
 class OLXScraper(Scraper):
     """ Flat scraper for OLX """
     BASE_URL = "https://www.olx.pl/nieruchomosci/mieszkania/sprzedaz/warszawa/"
 
-    def __init__(self, filters_selected: dict):
-        super().__init__(self.BASE_URL)
+    def __init__(self, filters_selected: dict, raw: bool = False,
+                 archive: PageArchive = None,
+                 memo: ParseMemo = None,
+                 base_url: str = BASE_URL,
+                 fetcher: HedgedFetcher = None,
+                 memory_budget: MemoryBudget = None):
+        """
+        Parameters
+        ----------
+        filters_selected : dict
+            filters to apply for search
+        raw : bool, optional
+            capture raw text of offer parameters instead of encoded values,
+            by default False. See `main.analysis.normalize`
+        archive : PageArchive, optional
+            archive where fetched pages are stored, by default None.
+            See `main.webscraping.reparse`
+        memo : ParseMemo, optional
+            memo of parsed offer parameters, by default None.
+            Offer pages already parsed are not parsed again
+        base_url : str, optional
+            URL of searched listing (city and category, e.g. flats for rent
+            in Krakow), by default flats for sale in Warsaw
+        fetcher : HedgedFetcher, optional
+            fetcher of offer pages with hedged requests and deadline,
+            by default None. Offers not received in time are listing-only
+        memory_budget : MemoryBudget, optional
+            memory limit of crawl, by default None. Offer pages are requested
+            ahead as far as memory left in budget allows, peak memory
+            is reported at the end of run
+        """
+        super().__init__(base_url)
         logger.info("Starting OLX Scraper")
         self.filters_selected = filters_selected
-        self.filter_processor = OLXFilter(self.filters_selected)
+        self.raw = raw
+        self.archive = archive
+        self.memo = memo
+        self.fetcher = fetcher
+        self.memory_budget = memory_budget
+        self.filter_processor = OLXFilter(self.filters_selected, self.base_url)
         self.filter_processor.get_filters()
         self.ad_processor = OLXAd
+        self.requests = 0  # number of requests sent in watch mode
+        self.unfetched = None  # work left by budgeted crawl
 
     def run(self):
-        """ Run scraper """
+        """ Run scraper, collect offers in `offer_data` """
         logger.info(
             f"Running OLX Scraper for selected filters:\n{pformat(self.filters_selected)}")
+        for offer_pars in self.iter_offers():
+            self.offer_data.append(offer_pars)
+        logger.info(f"{len(self.offer_data)} flat offers have been browsed")
+
+    def iter_offers(self):
+        """Browse offers for selected filters, yield each offer once parsed
+
+        Offers are not collected in `offer_data`, so a consumer (e.g.
+        `export_data`) processes them during the crawl at constant memory.
+
+        Yields
+        ------
+        dict
+            offer parameters
+        """
+        self.run_date = date.today()
         self.filter_processor.get_url_params()
 
         for p in self.filter_processor.url_params:
             k = 1  # start on first page
             while True:
                 pars = self.filter_processor.get_page(p, k)
-                site = requests.get(self.base_url, params=pars)
+                site = self._fetch(self.base_url, 'listing', params=pars)
 
                 # Check if site is valid, otherwise stop
                 url_validflag = self.check_url(site)
@@ -106,27 +501,234 @@ class OLXScraper(Scraper):
 
                 logger.info(f"Scraping advertisements from: {site.url}")
                 ads = get_ads(self.domain, site)
-                for a in ads:
-                    # Get ad processor
-                    ad_processor = self.ad_processor(a)
-                    ad_processor.get_ad_params()  # Get parameters for the advertisement
-                    offer_pars = ad_processor.ad_params
-                    # Access offer site
-                    offer_site = requests.get(
-                        ad_processor.ad_params['link'])
-                    logger.info(
-                        f"Scraping flat offer from: {offer_site.url}")
-                    try:
-                        offer_wrapper = get_offer(
-                            offer_pars['domain'], offer_site)
-                        offer_processor = self.offer_processors[offer_pars['domain']]
-                        offer = offer_processor(offer_wrapper)
-                        offer.get_offer_params()  # Get parameters for the offer
-                        # Collect all found parameters
-                        offer_pars.update(offer.offer_params)
-                    except Exception as e:
-                        logger.exception(e, exc_info=True)
-                    logger.debug(offer_pars)
-                    self.offer_data.append(offer_pars)
+                del site  # release page body before offers are fetched
+                yield from self._iter_ads(ads)
+                logger.info(
+                    f"Live median price/m\u00B2: {self.live_stats.median():,.0f} z\u0142"
+                    f" ({self.live_stats.total['price_meter'].moments.count} offers)")
                 k += 1
-        logger.info(f"{len(self.offer_data)} flat offers have been browsed")
+
+        if self.memory_budget is not None:
+            self.memory_budget.log_report()
+
+    async def aiter_offers(self):
+        """Browse offers for selected filters in a worker thread,
+        yield each offer once parsed (asynchronous iterator)
+
+        The crawl runs in a single dedicated thread, so the archive and memo
+        (sqlite connections) are always used from the thread that opened them.
+
+        Yields
+        ------
+        dict
+            offer parameters
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1)
+        offers = self.iter_offers()
+        done = object()  # end of offers
+        try:
+            while True:
+                offer_pars = await loop.run_in_executor(executor, next, offers, done)
+                if offer_pars is done:
+                    break
+                yield offer_pars
+        finally:
+            await loop.run_in_executor(executor, offers.close)
+            executor.shutdown(wait=True)
+
+    def crawl(self, max_seconds: float = None,
+              max_requests: int = None,
+              criteria: dict = None) -> dict:
+        """Run scraper in order of priority within time/request budget
+
+        Listing pages and offers are fetched from a crawl frontier: newer
+        pages first, then offers of newer ads matching search criteria.
+        Offers are collected in `offer_data`, work left when the budget
+        is spent is stored in `unfetched`.
+
+        Parameters
+        ----------
+        max_seconds : float, optional
+            crawl time limit [s], by default None (no limit)
+        max_requests : int, optional
+            limit of requests sent, by default None (no limit)
+        criteria : dict, optional
+            price_min, price_max and districts of interest,
+            by default taken from selected filters
+
+        Returns
+        -------
+        dict
+            unfetched listing pages (query, page) and offers (ad parameters),
+            with priority
+        """
+        logger.info(
+            f"Crawling OLX for selected filters:\n{pformat(self.filters_selected)}")
+        self.run_date = date.today()
+        self.filter_processor.get_url_params()
+        criteria = criteria if criteria is not None else get_criteria(self.filters_selected)
+        budget = CrawlBudget(max_seconds, max_requests)
+        frontier = CrawlFrontier()
+        queries = dict(zip(self._get_query_names(), self.filter_processor.url_params))
+        for query in queries:
+            frontier.push(LISTING, get_listing_priority(1), {'query': query, 'page': 1})
+        seen = set()  # keys of ads in frontier
+
+        while frontier and budget.can_fetch():
+            kind, priority, task = frontier.pop()
+            start_time = time.monotonic()
+            if kind == LISTING:
+                pars = self.filter_processor.get_page(dict(queries[task['query']]), task['page'])
+                site = self._fetch(self.base_url, 'listing', params=pars)
+                if self.check_url(site) == 1:
+                    logger.info(f"Scraping advertisements from: {site.url}")
+                    for a in get_ads(self.domain, site):
+                        ad_params = self._parse_ad(a)
+                        key = get_ad_key(ad_params['link'])
+                        if key not in seen:
+                            seen.add(key)
+                            frontier.push(OFFER, get_ad_priority(ad_params, criteria, self.run_date),
+                                          ad_params)
+                    frontier.push(LISTING, get_listing_priority(task['page'] + 1),
+                                  dict(task, page=task['page'] + 1))
+            else:
+                offer_pars = self._scrape_offer(task)
+                self.offer_data.append(offer_pars)
+                self.live_stats.update(offer_pars)
+            budget.record(time.monotonic() - start_time)
+
+        self.unfetched = frontier.get_remaining()
+        logger.info(f"{len(self.offer_data)} flat offers have been browsed with "
+                    f"{budget.requests} requests in {budget.elapsed:.0f}s")
+        if frontier:
+            logger.info(f"Budget spent, left unfetched: {len(self.unfetched[OFFER])} offers, "
+                        f"next listing pages of queries: "
+                        f"{', '.join(t['query'] for t in self.unfetched[LISTING])}")
+        return self.unfetched
+
+    def _get_query_names(self) -> list:
+        """Get names of search queries (one query per district)
+
+        Returns
+        -------
+        list
+            query names in order of `url_params`
+        """
+        districts = self.filters_selected.get('Dzielnica')
+        if isinstance(districts, (list, tuple)):
+            return list(districts)
+        return [districts or 'All']
+
+    def _poll_query(self, params: dict, seen: set, max_pages: int,
+                    detail: bool = True) -> list:
+        """Get new ads from first listing pages of query (newest first)
+
+        Next page is read only if all ads on a page are new.
+
+        Parameters
+        ----------
+        params : dict
+            URL parameters of query
+        seen : set
+            keys of ads already found (updated)
+        max_pages : int
+            maximum number of pages read
+        detail : bool, optional
+            fetch offers of new ads, by default True
+
+        Returns
+        -------
+        list
+            offer parameters of new ads
+        """
+        new_offers = []
+        for k in range(1, max_pages + 1):
+            site = self._fetch(self.base_url, 'listing',
+                               params=self.filter_processor.get_page(dict(params), k))
+            self.requests += 1
+            if self.check_url(site) == 0:
+                break
+            ads = get_ads(self.domain, site)
+            n_new = 0
+            self.run_date = date.today()
+            for a in ads:
+                ad_params = self._parse_ad(a)
+                key = get_ad_key(ad_params['link'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                n_new += 1
+                if detail:
+                    new_offers.append(self._scrape_offer(ad_params))
+                    self.requests += 1
+            if n_new < len(ads):
+                break
+        return new_offers
+
+    def watch(self, event_file: str = None,
+              max_pages: int = 3,
+              duration: float = None,
+              poller: AdaptivePoller = None):
+        """Watch newest ads continuously, emit new offers as JSON lines
+
+        Only first listing page(s) of each query (sorted newest first) are
+        polled, at intervals adapted to the rate of new ads per query.
+        Ads present at start on the first `max_pages` pages are treated as known. New offers are also
+        collected in `offer_data`.
+
+        Parameters
+        ----------
+        event_file : str, optional
+            JSONL file where events are appended, by default standard output
+        max_pages : int, optional
+            maximum number of pages read per poll, by default 3
+        duration : float, optional
+            watching time [s], by default None (until interrupted)
+        poller : AdaptivePoller, optional
+            poll scheduler, by default `AdaptivePoller()`
+        """
+        logger.info(
+            f"Watching OLX for selected filters:\n{pformat(self.filters_selected)}")
+        self.filter_processor.get_url_params()
+        poller = poller or AdaptivePoller()
+        queries = dict(zip(self._get_query_names(), self.filter_processor.url_params))
+        seen = {q: set() for q in queries}
+        self.requests = 0
+
+        # Known ads (not emitted), from the same pages as each poll reads
+        for query, params in queries.items():
+            self._poll_query(params, seen[query], max_pages, detail=False)
+            poller.add(query, delay=poller.min_interval)
+        logger.info(f"Found {sum(len(s) for s in seen.values())} known ads "
+                    f"in {len(queries)} queries")
+
+        events = open(event_file, 'a', encoding='utf-8') if event_file else sys.stdout
+        end_time = time.monotonic() + duration if duration is not None else None
+        try:
+            while True:
+                query, wait = poller.next_due()
+                if end_time is not None and time.monotonic() + wait > end_time:
+                    break
+                time.sleep(wait)
+                new_offers = self._poll_query(queries[query], seen[query], max_pages)
+                detected_at = datetime.now().isoformat(timespec='seconds')
+                for offer_pars in new_offers:
+                    events.write(json.dumps({'event': 'new_offer',
+                                             'query': query,
+                                             'detected_at': detected_at,
+                                             'offer': offer_pars},
+                                            default=str, sort_keys=True) + '\n')
+                    self.offer_data.append(offer_pars)
+                    self.live_stats.update(offer_pars)
+                events.flush()
+                interval = poller.record(query, len(new_offers))
+                if new_offers:
+                    logger.info(f"{len(new_offers)} new offers in query {query}, "
+                                f"next poll in {interval:.0f}s ({self.requests} requests sent)")
+        except KeyboardInterrupt:
+            logger.info("Watching stopped")
+        finally:
+            if events is not sys.stdout:
+                events.close()
+        logger.info(f"{len(self.offer_data)} new offers found with {self.requests} requests")
@@ -0,0 +1,129 @@
+""" Scheduling of listing polls in watch mode
+
+Each search query (e.g. district) is polled at its own interval, adapted to
+the observed rate of new ads: queries with frequent new ads are polled often,
+quiet queries are polled less and less often.
+"""
+
+import heapq
+import logging
+import time
+
+# Logger
+logger = logging.getLogger(__name__)
+
+
+def get_ad_key(link: str) -> str:
+    """Get ad key (link without query string and fragment)
+
+    Parameters
+    ----------
+    link : str
+        advertisement URL
+
+    Returns
+    -------
+    str
+        ad key
+    """
+    return link.split('#', 1)[0].split('?', 1)[0]
+
+
+class AdaptivePoller(object):
+    """ Poll schedule with per-query interval adapted to rate of new ads """
+
+    def __init__(self, min_interval: float = 30,
+                 max_interval: float = 1800,
+                 target_new: float = 1.0,
+                 smoothing: float = 0.3,
+                 backoff: float = 1.5,
+                 clock=time.monotonic):
+        """
+        Parameters
+        ----------
+        min_interval : float, optional
+            shortest interval between polls of a query [s], by default 30
+        max_interval : float, optional
+            longest interval between polls of a query [s], by default 1800
+        target_new : float, optional
+            expected number of new ads per poll, by default 1.0
+        smoothing : float, optional
+            weight of last poll in rate estimate (0-1), by default 0.3
+        backoff : float, optional
+            interval multiplier after poll without new ads, by default 1.5
+        clock : callable, optional
+            time source [s], by default time.monotonic
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_new = target_new
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self.clock = clock
+        self.queries = {}  # query -> state (interval, rate, last poll)
+        self.schedule = []  # heap of (due time, query)
+
+    def add(self, query: str, delay: float = 0):
+        """Add query to schedule
+
+        Parameters
+        ----------
+        query : str
+            query name
+        delay : float, optional
+            time to first poll [s], by default 0
+        """
+        now = self.clock()
+        self.queries[query] = {'interval': self.min_interval,
+                               'rate': None,  # new ads per second
+                               'last_poll': now,
+                               'polls': 0,
+                               'new_ads': 0}
+        heapq.heappush(self.schedule, (now + delay, query))
+
+    def next_due(self) -> tuple:
+        """Get next query to poll
+
+        Returns
+        -------
+        tuple
+            (query, time to wait [s])
+        """
+        due, query = self.schedule[0]
+        return query, max(due - self.clock(), 0)
+
+    def record(self, query: str, n_new: int) -> float:
+        """Record result of poll and schedule next poll of query
+
+        Parameters
+        ----------
+        query : str
+            polled query
+        n_new : int
+            number of new ads found
+
+        Returns
+        -------
+        float
+            interval to next poll [s]
+        """
+        now = self.clock()
+        state = self.queries[query]
+        elapsed = max(now - state['last_poll'], 1e-6)
+        observed_rate = n_new / elapsed
+        state['rate'] = observed_rate if state['rate'] is None else \
+            self.smoothing * observed_rate + (1 - self.smoothing) * state['rate']
+        if n_new == 0:
+            interval = state['interval'] * self.backoff
+        else:
+            interval = self.target_new / state['rate']
+        state['interval'] = min(max(interval, self.min_interval), self.max_interval)
+        state['last_poll'] = now
+        state['polls'] += 1
+        state['new_ads'] += n_new
+
+        self.schedule = [(d, q) for d, q in self.schedule if q != query]
+        self.schedule.append((now + state['interval'], query))
+        heapq.heapify(self.schedule)
+        logger.debug(f"Query {query}: {n_new} new ads, next poll in {state['interval']:.0f}s")
+        return state['interval']
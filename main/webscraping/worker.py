@@ -0,0 +1,426 @@
+""" Crawl workers sharing a work queue
+
+A crawl is seeded with first listing pages of searches (city and category,
+selected filters) and processed by any number of workers claiming tasks from
+a shared `WorkQueue`: a listing task adds offer tasks of its ads and the next
+listing page, an offer task stores offer parameters. Ads found by several
+searches (or workers) are fetched once per run.
+
+Usage:
+    python -m main.webscraping.worker seed <queue_file> <crawl_config.json>
+    python -m main.webscraping.worker work <queue_file>
+        [--processes N] [--raw] [--archive ARCHIVE_DIR] [--memo MEMO_FILE]
+    python -m main.webscraping.worker export <queue_file> <data_file>
+        [--format json|parquet] [--base-url URL] [--run-date YYYY-MM-DD] [--raw]
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import repeat
+from urllib.parse import urlencode
+
+from main.webscraping.ad import OLXAd, get_ads
+from main.webscraping.archive import PageArchive
+from main.webscraping.filter import OLXFilter
+from main.webscraping.frontier import (LISTING, OFFER, get_ad_priority, get_criteria,
+                                       get_listing_priority)
+from main.webscraping.memo import ParseMemo
+from main.webscraping.scraper import Scraper
+from main.webscraping.watch import get_ad_key
+from main.webscraping.workqueue import WorkQueue
+
+# Logger
+logger = logging.getLogger(__name__)
+
+
+def get_listing_key(base_url: str, params: dict, run_date: str) -> str:
+    """Get key of listing page task
+
+    Parameters
+    ----------
+    base_url : str
+        URL of searched listing
+    params : dict
+        URL parameters of page (with page number)
+    run_date : str
+        date of scraping run
+
+    Returns
+    -------
+    str
+        task key
+    """
+    return f"{LISTING}|{run_date}|{base_url}?{urlencode(sorted(params.items()))}"
+
+
+def get_offer_key(link: str, run_date: str) -> str:
+    """Get key of offer task (and its result)
+
+    Parameters
+    ----------
+    link : str
+        advertisement URL
+    run_date : str
+        date of scraping run
+
+    Returns
+    -------
+    str
+        task key
+    """
+    return f"{OFFER}|{run_date}|{get_ad_key(link)}"
+
+
+def seed_crawl(queue: WorkQueue, searches: list, run_date: date = None) -> int:
+    """Add first listing pages of searches to queue
+
+    Parameters
+    ----------
+    queue : WorkQueue
+        work queue
+    searches : list
+        searches as dicts with base_url (searched listing, by default
+        flats for sale in Warsaw) and filters (selected filters)
+    run_date : date, optional
+        date of scraping run, by default today
+
+    Returns
+    -------
+    int
+        number of listing tasks added
+    """
+    run_date = str(run_date or date.today())
+    added = 0
+    for search in searches:
+        filters_selected = search.get('filters', {})
+        filter_processor = OLXFilter(filters_selected, search.get('base_url', OLXFilter.BASE_URL))
+        filter_processor.get_filters()
+        filter_processor.get_url_params()
+        criteria = get_criteria(filters_selected)
+        for params in filter_processor.url_params:
+            params = filter_processor.get_page(dict(params), 1)
+            payload = {'base_url': filter_processor.base_url,
+                       'params': params,
+                       'page': 1,
+                       'page_param': filter_processor.filters['Strona']['param'],
+                       'criteria': criteria,
+                       'run_date': run_date}
+            added += queue.put(LISTING, get_listing_key(payload['base_url'], params, run_date),
+                               payload, get_listing_priority(1))
+    logger.info(f"{added} listing pages of {len(searches)} searches added to queue")
+    return added
+
+
+class WorkerScraper(Scraper):
+    """ Flat scraper processing tasks of a work queue """
+
+    def __init__(self, base_url: str, run_date: str,
+                 raw: bool = False,
+                 archive: PageArchive = None,
+                 memo: ParseMemo = None):
+        """
+        Parameters
+        ----------
+        base_url : str
+            URL of searched listing
+        run_date : str
+            date of scraping run (YYYY-MM-DD)
+        raw : bool, optional
+            capture raw text of offer parameters, by default False
+        archive : PageArchive, optional
+            archive where fetched pages are stored, by default None
+        memo : ParseMemo, optional
+            memo of parsed offer parameters, by default None
+        """
+        super().__init__(base_url)
+        self.run_date = date.fromisoformat(str(run_date))
+        self.raw = raw
+        self.archive = archive
+        self.memo = memo
+        self.ad_processor = OLXAd
+
+
+class CrawlWorker(object):
+    """ Worker claiming, fetching, parsing and acknowledging queued tasks """
+
+    def __init__(self, queue_file: str, worker_id: str = None,
+                 raw: bool = False,
+                 archive_dir: str = None,
+                 memo_file: str = None,
+                 lease_seconds: float = 120):
+        """
+        Parameters
+        ----------
+        queue_file : str
+            SQLite file of work queue
+        worker_id : str, optional
+            worker id, by default <host>-<pid>
+        raw : bool, optional
+            capture raw text of offer parameters, by default False
+        archive_dir : str, optional
+            archive where fetched pages are stored, by default None
+        memo_file : str, optional
+            memo of parsed offer parameters, by default None
+        lease_seconds : float, optional
+            time a claimed task is reserved for worker [s], by default 120
+        """
+        self.queue = WorkQueue(queue_file, lease_seconds=lease_seconds)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.raw = raw
+        self.archive = PageArchive(archive_dir) if archive_dir else None
+        self.memo = ParseMemo(memo_file) if memo_file else None
+        self.processed = 0  # number of tasks done
+        self.failed = 0  # number of task attempts with error
+
+    def _get_scraper(self, payload: dict) -> WorkerScraper:
+        return WorkerScraper(payload['base_url'], payload['run_date'], self.raw,
+                             self.archive, self.memo)
+
+    def _process_listing(self, payload: dict):
+        """Queue offers of ads on listing page and the next listing page"""
+        scraper = self._get_scraper(payload)
+        site = scraper._fetch(payload['base_url'], 'listing', params=payload['params'])
+        if scraper.check_url(site) == 0:
+            return
+        logger.info(f"Scraping advertisements from: {site.url}")
+        for a in get_ads(scraper.domain, site):
+            ad_params = scraper._parse_ad(a)
+            self.queue.put(OFFER, get_offer_key(ad_params['link'], payload['run_date']),
+                           {'base_url': payload['base_url'],
+                            'run_date': payload['run_date'],
+                            'ad_params': ad_params},
+                           get_ad_priority(ad_params, payload['criteria'], scraper.run_date))
+        page = payload['page'] + 1
+        params = dict(payload['params'], **{payload['page_param']: page})
+        self.queue.put(LISTING, get_listing_key(payload['base_url'], params, payload['run_date']),
+                       dict(payload, params=params, page=page),
+                       get_listing_priority(page))
+
+    def _process_offer(self, task: dict):
+        """Fetch and parse offer, store its parameters"""
+        payload = task['payload']
+        offer_pars = self._get_scraper(payload)._scrape_offer(dict(payload['ad_params']))
+        self.queue.store_result(task['key'], offer_pars, self.worker_id,
+                                payload['base_url'], payload['run_date'])
+
+    def process(self, task: dict):
+        """Process claimed task
+
+        Parameters
+        ----------
+        task : dict
+            task claimed from queue
+
+        Raises
+        ------
+        ValueError
+            if task kind is not supported
+        """
+        if task['kind'] == LISTING:
+            self._process_listing(task['payload'])
+        elif task['kind'] == OFFER:
+            self._process_offer(task)
+        else:
+            raise ValueError(f"Incorrect task kind: {task['kind']}")
+
+    def run(self, max_tasks: int = None,
+            idle_timeout: float = None,
+            poll_interval: float = 1) -> int:
+        """Process tasks until queue is drained
+
+        Tasks are acknowledged when processed, released for another attempt
+        (or marked as failed) on error. A task not acknowledged in time
+        (e.g. worker was killed) is claimed again by another worker.
+
+        Parameters
+        ----------
+        max_tasks : int, optional
+            number of tasks to process, by default None (no limit)
+        idle_timeout : float, optional
+            time to wait for tasks leased by other workers [s], by default
+            lease time of queue. A shorter wait may stop all workers while
+            a task of a killed worker is still leased (and then never done)
+        poll_interval : float, optional
+            time between claims when no task is available [s], by default 1
+
+        Returns
+        -------
+        int
+            number of tasks done
+        """
+        if idle_timeout is None:
+            idle_timeout = self.queue.lease_seconds
+        elif idle_timeout < self.queue.lease_seconds:
+            logger.warning(f"Idle timeout ({idle_timeout}s) is shorter than task lease "
+                           f"({self.queue.lease_seconds}s), expired tasks may be left undone")
+        logger.info(f"Worker {self.worker_id} started")
+        idle_since = None
+        while max_tasks is None or self.processed < max_tasks:
+            task = self.queue.claim(self.worker_id)
+            if task is None:
+                # Tasks leased by other workers may add new tasks
+                if self.queue.is_drained():
+                    break
+                idle_since = idle_since or time.monotonic()
+                if time.monotonic() - idle_since > idle_timeout:
+                    break
+                time.sleep(poll_interval)
+                continue
+            idle_since = None
+            try:
+                self.process(task)
+            except Exception as e:
+                logger.exception(e, exc_info=True)
+                self.queue.fail(task['id'], self.worker_id, repr(e))
+                self.failed += 1
+                continue
+            if self.queue.ack(task['id'], self.worker_id):
+                self.processed += 1
+            else:
+                logger.warning(f"Lease of task {task['key']} expired before it was done")
+        logger.info(f"Worker {self.worker_id} done: {self.processed} tasks, "
+                    f"{self.failed} errors")
+        return self.processed
+
+    def close(self):
+        """Close queue, archive and memo"""
+        self.queue.close()
+        if self.archive is not None:
+            self.archive.close()
+        if self.memo is not None:
+            self.memo.close()
+
+
+def run_worker(queue_file: str, worker_kwargs: dict = None) -> int:
+    """Run worker until queue is drained (run in worker process)
+
+    Parameters
+    ----------
+    queue_file : str
+        SQLite file of work queue
+    worker_kwargs : dict, optional
+        parameters of `CrawlWorker`, by default None
+
+    Returns
+    -------
+    int
+        number of tasks done
+    """
+    worker = CrawlWorker(queue_file, **(worker_kwargs or {}))
+    try:
+        return worker.run()
+    finally:
+        worker.close()
+
+
+def run_workers(queue_file: str, processes: int = None, **worker_kwargs) -> int:
+    """Run pool of worker processes on one host
+
+    Parameters
+    ----------
+    queue_file : str
+        SQLite file of work queue
+    processes : int, optional
+        number of worker processes, by default number of CPUs
+    worker_kwargs
+        parameters of `CrawlWorker` (raw, archive_dir, memo_file, lease_seconds)
+
+    Returns
+    -------
+    int
+        number of tasks done
+    """
+    processes = processes or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        done = sum(executor.map(run_worker, repeat(str(queue_file), processes),
+                                repeat(worker_kwargs, processes)))
+    queue = WorkQueue(queue_file)
+    logger.info(f"{done} tasks done by {processes} workers, queue: {queue.get_stats()}")
+    queue.close()
+    return done
+
+
+def export_results(queue_file: str, data_file: str,
+                   file_format: str = 'json',
+                   base_url: str = None,
+                   run_date: str = None,
+                   raw: bool = False) -> int:
+    """Save offer parameters collected by workers
+
+    Parameters
+    ----------
+    queue_file : str
+        SQLite file of work queue
+    data_file : str
+        path to json file (or dataset directory for parquet)
+    file_format : str, optional
+        output format - json or parquet, by default 'json'
+    base_url : str, optional
+        searched listing URL, by default all
+    run_date : str, optional
+        date of scraping run (YYYY-MM-DD), by default today
+    raw : bool, optional
+        offer parameters captured as raw text, by default False
+
+    Returns
+    -------
+    int
+        number of exported offers
+    """
+    run_date = str(run_date or date.today())
+    queue = WorkQueue(queue_file)
+    exporter = WorkerScraper(base_url or OLXFilter.BASE_URL, run_date, raw)
+    exporter.offer_data = queue.get_results(base_url, run_date)
+    queue.close()
+    exporter.export_data(data_file, file_format)
+    return len(exporter.offer_data)
+
+
+if __name__ == '__main__':
+    # Workers need functions importable from the module (not __main__)
+    from main.webscraping.worker import export_results, run_workers, seed_crawl
+    from utils.logging_config import get_log_config
+
+    parser = argparse.ArgumentParser(description='Crawl with workers sharing a work queue')
+    commands = parser.add_subparsers(dest='command', required=True)
+    seed_parser = commands.add_parser('seed', help='add searches to queue')
+    seed_parser.add_argument('queue_file', help='SQLite file of work queue')
+    seed_parser.add_argument('crawl_config',
+                             help='json file with list of searches (base_url, filters)')
+    work_parser = commands.add_parser('work', help='process tasks until queue is drained')
+    work_parser.add_argument('queue_file', help='SQLite file of work queue')
+    work_parser.add_argument('--processes', type=int, help='number of worker processes')
+    work_parser.add_argument('--raw', action='store_true',
+                             help='capture raw text of offer parameters')
+    work_parser.add_argument('--archive', dest='archive_dir', help='archive directory')
+    work_parser.add_argument('--memo', dest='memo_file',
+                             help='memo file of parsed offer parameters')
+    export_parser = commands.add_parser('export', help='save collected offer data')
+    export_parser.add_argument('queue_file', help='SQLite file of work queue')
+    export_parser.add_argument('data_file', help='output json file or parquet dataset directory')
+    export_parser.add_argument('--format', default='json', choices=['json', 'parquet'],
+                               help='output format')
+    export_parser.add_argument('--base-url', help='searched listing URL')
+    export_parser.add_argument('--run-date', help='date of scraping run (YYYY-MM-DD)')
+    export_parser.add_argument('--raw', action='store_true',
+                               help='offer parameters captured as raw text (work --raw)')
+    args = parser.parse_args()
+
+    get_log_config("logging.json")
+    if args.command == 'seed':
+        with open(args.crawl_config, encoding='utf-8') as f:
+            work_queue = WorkQueue(args.queue_file)
+            seed_crawl(work_queue, json.load(f))
+            work_queue.close()
+    elif args.command == 'work':
+        run_workers(args.queue_file, args.processes, raw=args.raw,
+                    archive_dir=args.archive_dir, memo_file=args.memo_file)
+    else:
+        export_results(args.queue_file, args.data_file, args.format,
+                       args.base_url, args.run_date, args.raw)
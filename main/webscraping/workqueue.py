@@ -0,0 +1,280 @@
+""" Shared queue of crawl tasks with leases
+
+Tasks (listing and offer pages) and results are stored in a SQLite file,
+so any number of worker processes on one host can claim tasks. The file
+must be on a local disk, as SQLite locking (WAL mode) is not reliable on
+network filesystems: hosts must not share the queue file. A claimed task
+is leased to a worker for a limited time; tasks of workers that died are
+claimed again when their lease ends.
+Tasks and results are deduplicated by key.
+"""
+
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+# Logger
+logger = logging.getLogger(__name__)
+
+# Task states
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, priority DESC, id);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    base_url TEXT,
+    run_date TEXT,
+    offer_params TEXT NOT NULL,
+    worker TEXT,
+    stored_at REAL
+);
+"""
+
+
+class WorkQueue(object):
+    """ SQLite-backed queue of crawl tasks with leases and deduplicated results """
+
+    def __init__(self, queue_file: str, lease_seconds: float = 120,
+                 max_attempts: int = 3):
+        """
+        Parameters
+        ----------
+        queue_file : str
+            SQLite file with tasks and results
+        lease_seconds : float, optional
+            time a claimed task is reserved for a worker [s], by default 120
+        max_attempts : int, optional
+            number of attempts before task is marked as failed, by default 3
+        """
+        self.queue_file = Path(queue_file)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.queue_file.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.queue_file), timeout=60,
+                                  isolation_level=None)  # explicit transactions
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(QUEUE_SCHEMA)
+
+    def put(self, kind: str, key: str, payload: dict, priority: float = 0) -> bool:
+        """Add task unless task with the same key exists
+
+        Parameters
+        ----------
+        kind : str
+            task kind (listing/offer)
+        key : str
+            task key (deduplication)
+        payload : dict
+            task data
+        priority : float, optional
+            task priority, higher first, by default 0
+
+        Returns
+        -------
+        bool
+            True if task was added
+        """
+        cursor = self.db.execute(
+            'INSERT OR IGNORE INTO tasks (kind, key, payload, priority, updated_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (kind, key, json.dumps(payload, default=str), priority, time.time()))
+        return cursor.rowcount == 1
+
+    def claim(self, worker: str) -> dict:
+        """Lease task with highest priority (pending or with expired lease)
+
+        Tasks whose lease expired after the last attempt (e.g. task crashing
+        its worker) are marked as failed instead of being claimed again.
+
+        Parameters
+        ----------
+        worker : str
+            worker id
+
+        Returns
+        -------
+        dict
+            task (id, kind, key, payload, attempts), None if no task available
+        """
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.execute(
+                'UPDATE tasks SET status = ?, lease_until = NULL, error = ?, updated_at = ? '
+                'WHERE status = ? AND lease_until < ? AND attempts >= ?',
+                (FAILED, 'Lease expired on last attempt', now, LEASED, now, self.max_attempts))
+            row = self.db.execute(
+                'SELECT id, kind, key, payload, attempts FROM tasks '
+                'WHERE status = ? OR (status = ? AND lease_until < ?) '
+                'ORDER BY priority DESC, id LIMIT 1', (PENDING, LEASED, now)).fetchone()
+            if row is not None:
+                self.db.execute(
+                    'UPDATE tasks SET status = ?, worker = ?, lease_until = ?, '
+                    'attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                    (LEASED, worker, now + self.lease_seconds, now, row[0]))
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        return {'id': row[0], 'kind': row[1], 'key': row[2],
+                'payload': json.loads(row[3]), 'attempts': row[4] + 1}
+
+    def extend(self, task_id: int, worker: str) -> bool:
+        """Extend lease of task (for long tasks)
+
+        Parameters
+        ----------
+        task_id : int
+            task id
+        worker : str
+            worker id
+
+        Returns
+        -------
+        bool
+            True if task is still leased to worker
+        """
+        cursor = self.db.execute(
+            'UPDATE tasks SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?',
+            (time.time() + self.lease_seconds, task_id, worker, LEASED))
+        return cursor.rowcount == 1
+
+    def ack(self, task_id: int, worker: str) -> bool:
+        """Mark leased task as done
+
+        Parameters
+        ----------
+        task_id : int
+            task id
+        worker : str
+            worker id
+
+        Returns
+        -------
+        bool
+            True if task was still leased to worker
+        """
+        cursor = self.db.execute(
+            'UPDATE tasks SET status = ?, lease_until = NULL, updated_at = ? '
+            'WHERE id = ? AND worker = ? AND status = ?',
+            (DONE, time.time(), task_id, worker, LEASED))
+        return cursor.rowcount == 1
+
+    def fail(self, task_id: int, worker: str, error: str):
+        """Release task after error, mark as failed after last attempt
+
+        Parameters
+        ----------
+        task_id : int
+            task id
+        worker : str
+            worker id
+        error : str
+            error message
+        """
+        self.db.execute(
+            'UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+            'lease_until = NULL, error = ?, updated_at = ? '
+            'WHERE id = ? AND worker = ? AND status = ?',
+            (self.max_attempts, FAILED, PENDING, error, time.time(), task_id, worker, LEASED))
+
+    def store_result(self, key: str, offer_params: dict, worker: str,
+                     base_url: str = None, run_date: str = None) -> bool:
+        """Store offer parameters unless offer was stored already
+
+        Parameters
+        ----------
+        key : str
+            result key e.g. ad key and run date
+        offer_params : dict
+            offer parameters
+        worker : str
+            worker id
+        base_url : str, optional
+            searched listing URL (city and category), by default None
+        run_date : str, optional
+            date of scraping run, by default None
+
+        Returns
+        -------
+        bool
+            True if result was stored
+        """
+        cursor = self.db.execute(
+            'INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?, ?)',
+            (key, base_url, run_date, json.dumps(offer_params, default=str), worker, time.time()))
+        return cursor.rowcount == 1
+
+    def get_results(self, base_url: str = None, run_date: str = None) -> list:
+        """Get stored offer parameters
+
+        Parameters
+        ----------
+        base_url : str, optional
+            searched listing URL, by default all
+        run_date : str, optional
+            date of scraping run, by default all
+
+        Returns
+        -------
+        list
+            offer parameters
+        """
+        query = 'SELECT offer_params FROM results WHERE 1 = 1'
+        params = []
+        if base_url:
+            query += ' AND base_url = ?'
+            params.append(base_url)
+        if run_date:
+            query += ' AND run_date = ?'
+            params.append(str(run_date))
+        return [json.loads(row[0]) for row in self.db.execute(query + ' ORDER BY stored_at', params)]
+
+    def get_stats(self) -> dict:
+        """Get number of tasks by kind and status, and number of results
+
+        Returns
+        -------
+        dict
+            '<kind>_<status>' -> number of tasks, 'results' -> number of results
+        """
+        stats = {f"{kind}_{status}": count for kind, status, count in self.db.execute(
+            'SELECT kind, status, COUNT(*) FROM tasks GROUP BY kind, status')}
+        stats['results'] = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return stats
+
+    def is_drained(self) -> bool:
+        """Check if all tasks are done or failed
+
+        Returns
+        -------
+        bool
+            True if no task is pending or leased
+        """
+        return self.db.execute('SELECT COUNT(*) FROM tasks WHERE status IN (?, ?)',
+                               (PENDING, LEASED)).fetchone()[0] == 0
+
+    def close(self):
+        """Close queue file"""
+        self.db.close()